@@ -4,11 +4,12 @@ Created on Tue Sep 13 19:01:57 2016
 
 @author: sebalander
 """
-from numpy import zeros, roots, array, isreal, tan, prod, arctan
-from numpy import any, empty_like, arange, real, pi, abs
+from numpy import zeros, array, tan, prod, arctan
+from numpy import pi, abs, asarray, sign
 from cv2 import Rodrigues
 #from cv2.fisheye import projectPoints
 from lmfit import  Parameters # , minimize
+from calibration.rootFinder import positiveExtrema, solveMonotoneSegments
 #from calibration import calibrator
 #xypToZplane = calibrator.xypToZplane
 
@@ -75,7 +76,8 @@ def radialDistort(rp, k, quot=False, der=False):
     th6 = th2*th4
     th8 = th4*th4
     
-    k.shape = -1
+    if k.ndim < 3:  # (nk, S, 1) is a batch of S samples, rp (S, n)
+        k.shape = -1
     rpp = (1 + k[0]*th2 + k[1]*th4 + k[2]*th6 + k[3]*th8) * th
     
     if der:
@@ -88,7 +90,7 @@ def radialDistort(rp, k, quot=False, der=False):
         # q wrt rpp 
         dQdP = (dPPdP - q) / rp # deriv wrt undistorted coords
         
-        dQdK = array([th2, th4, th6, th8]) * th
+        dQdK = array([th2, th4, th6, th8]) * th / rp
         
         if quot:
             return q, dQdP, dQdK
@@ -107,35 +109,32 @@ def radialUndistort(rpp, k, quot=False, der=False):
     takes distorted radius and returns the radius undistorted
     optionally it returns the distortion quotioent rpp = rp * q
     '''
-    # polynomial coeffs, grade 7
-    # # (k1,k2,p1,p2[,k3[,k4,k5,k6[,s1,s2,s3,s4[,τx,τy]]]])
-    # polynomial coeffs, grade 7
-    # # (k1,k2,p1,p2[,k3[,k4,k5,k6[,s1,s2,s3,s4[,τx,τy]]]])
-    
     k.shape = -1
-    poly = [[k[3], 0, k[2], 0, k[1], 0, k[0], 0, 1, -r] for r in rpp]
-    
-    # calculate roots
-    rootsPoly = array([roots(p) for p in poly])
-    
-    # return flag, True if there is a suitable (real AND positive) solution
-    rPRB = isreal(rootsPoly) & (0 <= real(rootsPoly))  # real Positive Real Bool
-    retVal = any(rPRB, axis=1)
-    
-    thetap = empty_like(rpp)
-    
-    if any(~retVal): # if at least one case of non solution
-        # calculate extrema of polyniomial
-        thExtrema = roots([9*k[3], 0, 7*k[2], 0, 5*k[1], 0, 3*k[0], 0, 1])
-        # select real extrema in positive side, keep smallest
-        thRealPos = min(thExtrema.real[isreal(thExtrema) & (0<=thExtrema.real)])
-        # assign to problematic values
-        thetap[~retVal] = thRealPos
-    
-    # choose minimum positive roots
-    thetap[retVal] = [min(rootsPoly[i, rPRB[i]].real)
-                   for i in arange(rpp.shape[0])[retVal]]
-    
+    rpp = asarray(rpp)
+
+    def distortDer(th):
+        # distorted radius as function of the angle and its derivative
+        th2 = th*th
+        th4 = th2*th2
+        th6 = th2*th4
+        th8 = th4*th4
+        rpp = (1 + k[0]*th2 + k[1]*th4 + k[2]*th6 + k[3]*th8) * th
+        dPPdTh = 1 + 3 * k[0]*th2 + 5 * k[1]*th4 + 7 * k[2]*th6 + 9 * k[3]*th8
+        return rpp, dPPdTh
+
+    # extrema of polyniomial, the same for all points
+    thExtrema = positiveExtrema([9*k[3], 0, 7*k[2], 0, 5*k[1], 0, 3*k[0], 0,
+                                 1])
+    # sign of the leading (first non zero) coefficient, sign at infinity
+    leadSign = sign([c for c in [k[3], k[2], k[1], k[0], 1] if c != 0][0])
+
+    # minimum positive root for all points at once with newton, seeded from
+    # the linear solution th = rpp. return flag is True if there is a
+    # suitable (real AND positive) solution, if not the smallest extremum is
+    # assigned to problematic values
+    thetap, retVal = solveMonotoneSegments(distortDer, rpp, thExtrema, rpp,
+                                           leadSign)
+
     rp = abs(tan(thetap))  # correct negative values
     # if theta angle is greater than pi/2, retVal=False
     retVal[thetap >= pi/2] = False
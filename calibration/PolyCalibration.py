@@ -5,10 +5,12 @@ Created on Tue Sep 13 19:01:57 2016
 @author: sebalander
 """
 from numpy import zeros, sqrt, roots, array, isreal, shape, prod, abs, sum
-from numpy import reshape, dot, real, any, empty_like, arange
+from numpy import reshape, dot
+from numpy import asarray, sign
 from cv2 import projectPoints, Rodrigues
 from lmfit import minimize, Parameters
 from calibration import calibrator
+from calibration.rootFinder import positiveExtrema, solveMonotoneSegments
 #xypToZplane = calibrator.xypToZplane
 
 # %% ========== ========== RATIONAL PARAMETER HANDLING ========== ==========
@@ -131,7 +133,8 @@ def radialDistort(rp, k, quot=False, der=False):
     rp4 = rp2**2
     rp6 = rp2*rp4
     
-    k.shape = -1
+    if k.ndim < 3:  # (nk, S, 1) is a batch of S samples, rp (S, n)
+        k.shape = -1
     q = 1 + k[0]*rp2 + k[1]*rp4 + k[4]*rp6
     
     if der:
@@ -156,45 +159,42 @@ def radialUndistort(rpp, k, quot=False, der=False):
     '''dqD
     takes distorted radius and returns the radius undistorted
     optioally it returns the undistortion quotient rp = rpp * q
+    with der it returns the distortion quotient rpp = rp * q, as
+    radialDistort does, and the derivatives
     '''
     # polynomial coeffs, grade 7
     # # (k1,k2,p1,p2[,k3[,k4,k5,k6[,s1,s2,s3,s4[,τx,τy]]]])
-    # polynomial coeffs, grade 7
-    # # (k1,k2,p1,p2[,k3[,k4,k5,k6[,s1,s2,s3,s4[,τx,τy]]]])
     k.shape = -1
-    poly = [[k[4], # k3
-             0,
-             k[1], # k2
-             0,
-             k[0], # k1
-             0,
-             1,
-             -r] for r in rpp]
-    
-    # calculate roots
-    rootsPoly = array([roots(p) for p in poly])
-    
-    # return flag, True if there is a suitable (real AND positive) solution
-    rPRB = isreal(rootsPoly) & (0 <= real(rootsPoly))  # real Positive Real Bool
-    retVal = any(rPRB, axis=1)
-    
-    rp = empty_like(rpp)
-    
-    if any(~ retVal): # if at least one case of non solution
-        # calculate extrema of polyniomial
-        rExtrema = roots([7*k[4], 0, 5*k[1], 0, 3*k[0], 0, 1])
-        # select real extrema in positive side, keep smallest
-        rRealPos = min(rExtrema.real[isreal(rExtrema) & (0<=rExtrema.real)])
-        # assign to problematic values
-        rp[~retVal] = rRealPos
-    
-    # choose minimum positive roots
-    rp[retVal] = [min(rootsPoly[i, rPRB[i]].real)
-                   for i in arange(rpp.shape[0])[retVal]]
-    
+    rpp = asarray(rpp)
+
+    def distortDer(rp):
+        # distorted radius and its derivative, analytic from radialDistort
+        q, dQdP, _ = radialDistort(rp, k, quot=True, der=True)
+        return rp * q, q + rp * dQdP
+
+    # extrema of polyniomial, the same for all points
+    rExtrema = positiveExtrema([7*k[4], 0, 5*k[1], 0, 3*k[0], 0, 1])
+    # sign of the leading (first non zero) coefficient, sign at infinity
+    leadSign = sign([c for c in [k[4], k[1], k[0], 1] if c != 0][0])
+
+    # minimum positive root for all points at once with newton, seeded from
+    # the linear solution rp = rpp. return flag is True if there is a
+    # suitable (real AND positive) solution, if not the smallest extremum is
+    # assigned to problematic values
+    rp, retVal = solveMonotoneSegments(distortDer, rpp, rExtrema, rpp,
+                                       leadSign)
+
+    return undistortOutputs(rpp, rp, retVal, k, quot, der)
+
+
+def undistortOutputs(rpp, rp, retVal, k, quot=False, der=False):
+    '''
+    outputs of radialUndistort once the undistorted radius rp is known, also
+    used by the fitted approximate inverse in calibrator
+    '''
     if der:
         # derivada de la directa
-        q, dQdP, dQdK = radialDistort(rp, k, der=True)
+        q, dQdP, dQdK = radialDistort(rp, k, quot=True, der=True)
 
         if quot:
             return q, retVal, dQdP, dQdK
@@ -4,8 +4,12 @@ Created on Tue Sep 13 19:01:57 2016
 
 @author: sebalander
 """
-from numpy import zeros, sqrt, roots, array, isreal, shape, bitwise_and, prod
+from numpy import zeros, sqrt, array, isreal, shape, bitwise_and, prod
 from numpy import empty_like, arange, real, full_like  # , polyder, polymul
+from numpy import empty, asarray, argmax, zeros_like, ones_like, where, inf
+from numpy import nan
+from numpy import any as anny
+from numpy.linalg import eigvals
 from cv2 import projectPoints, Rodrigues
 from lmfit import minimize, Parameters
 from calibration import calibrator
@@ -134,7 +138,8 @@ def radialDistort(rp, k, quot=False, der=False):
     rp4 = rp2**2
     rp6 = rp2*rp4
 
-    k.shape = -1
+    if k.ndim < 3:  # (nk, S, 1) is a batch of S samples, rp (S, n)
+        k.shape = -1
     num = 1 + k[0]*rp2 + k[1]*rp4 + k[4]*rp6
     den = 1 + k[5]*rp2 + k[6]*rp4 + k[7]*rp6
 
@@ -145,11 +150,11 @@ def radialDistort(rp, k, quot=False, der=False):
         dNum = k[0] + 2*k[1]*rp2 + 3*k[4]*rp4  # later multiply by rp * 2
         dDen = k[5] + 2*k[6]*rp2 + 3*k[7]*rp4
         # derivative of quot of polynomials, "Direct" mapping
-        dQdP = 2 * rp * (dNum  - q * dDen)
+        dQdP = 2 * rp * (dNum  - q * dDen) / den
 
         dQdK = array([rp2, rp4, rp6, rp2, rp4, rp6])
         dQdK[:3] /= den
-        dQdK[3:] *= q / den
+        dQdK[3:] *= - q / den
 
         if quot:
             return q, dQdP, dQdK
@@ -164,25 +169,68 @@ def radialDistort(rp, k, quot=False, der=False):
 
 
 # %% ========== ========== INVERSE RATIONAL ========== ==========
+def rootsBatch(polys, chunkSize=100000):
+    '''
+    calculates the roots of many polynomials of the same degree at once
+    polys has shape (n, d+1), highest power first as in numpy.roots
+
+    the companion matrices of all polynomials are stacked and their
+    eigenvalues found in one batched call, same as numpy.roots does for each
+    polynomial, so the roots are the same. chunkSize bounds the memory used by
+    the (chunkSize, d, d) stack.
+    returns complex array of shape (n, d)
+    '''
+    polys = asarray(polys, dtype=float)
+    # leading coefficients that are zero for all polynomials lower the degree
+    polys = polys[:, argmax(anny(polys != 0, axis=0)):]
+    n, N = polys.shape
+
+    rootsPoly = empty((n, N - 1), dtype=complex)
+    if N < 2:
+        return rootsPoly
+
+    # companion matrix, ones in the subdiagonal
+    A = zeros((min(n, chunkSize), N - 1, N - 1))
+    A[:, arange(1, N - 1), arange(N - 2)] = 1
+
+    for i in range(0, n, chunkSize):
+        p = polys[i:i + chunkSize]
+        m = p.shape[0]
+        A[:m, 0] = - p[:, 1:] / p[:, :1]
+        rootsPoly[i:i + m] = eigvals(A[:m])
+
+    return rootsPoly
+
+
 def radialUndistort(rpp, k, quot=False, der=False):
     '''
     takes distorted radius and returns the radius undistorted
     optioally it returns the undistortion quotient rp = rpp * q
+    with der it returns the distortion quotient rpp = rp * q, as
+    radialDistort does, and the derivatives
     '''
     # polynomial coeffs, grade 7
     # # (k1,k2,p1,p2[,k3[,k4,k5,k6[,s1,s2,s3,s4[,τx,τy]]]])
     k.shape = -1
-    poly = [[k[4], # k3
-             -r*k[7], # k6
-             k[1], # k2
-             -r*k[6], # k5
-             k[0], # k1
-             -r*k[5], # k4
-             1,
-             -r] for r in rpp]
-
-    # choose the maximum of the real roots, hopefully it will be positive
-    rootsPoly = array([roots(p) for p in poly])
+    rpp = asarray(rpp)
+
+    # rpp=0 is a root already, no need to solve for it
+    rp = zeros_like(rpp, dtype=float)
+    noCero = rpp != 0
+    r = rpp[noCero]
+    unos = ones_like(r)
+
+    poly = array([k[4] * unos,  # k3
+                  -r*k[7],  # k6
+                  k[1] * unos,  # k2
+                  -r*k[6],  # k5
+                  k[0] * unos,  # k1
+                  -r*k[5],  # k4
+                  unos,
+                  -r]).T
+
+    # all polynomials solved at once
+    rootsPoly = rootsBatch(poly)
 
     # True if there is a suitable (real AND positive) solution
     rPRB = isreal(rootsPoly) & (0 <= real(rootsPoly))  # radius Positive Real Bool
@@ -190,6 +238,8 @@ def radialUndistort(rpp, k, quot=False, der=False):
     # there should be solutions for any case because rational model distortion
     # is dominated by ~rp^1 term
     retVal = full_like(rpp, True, dtype=bool)  # all solutions exist
+    # but if there is none flag it instead of failing
+    retVal[noCero] = anny(rPRB, axis=1)
 
     # if any(-retVal): # if at least one case of non solution
     #    # calculate extrema of polyniomial
@@ -204,12 +254,21 @@ def radialUndistort(rpp, k, quot=False, der=False):
     #    # assign to problematic values
     #    rp[-retVal] = rRealPos
 
-    # choose minimum positive roots
-    rp = array([min(rootsPoly[i, rPRB[i]].real) for i in range(rpp.shape[0])])
+    # choose minimum positive roots, nan where there is none
+    rp[noCero] = where(rPRB, real(rootsPoly), inf).min(axis=1)
+    rp[~retVal] = nan
 
+    return undistortOutputs(rpp, rp, retVal, k, quot, der)
+
+
+def undistortOutputs(rpp, rp, retVal, k, quot=False, der=False):
+    '''
+    outputs of radialUndistort once the undistorted radius rp is known, also
+    used by the fitted approximate inverse in calibrator
+    '''
     if der:
         # derivada de la directa
-        q, dQdP, dQdK = radialDistort(rp, k, der=True)
+        q, dQdP, dQdK = radialDistort(rp, k, quot=True, der=True)
 
         if quot:
             return q, retVal, dQdP, dQdK
@@ -4,7 +4,7 @@ Created on Tue Sep 13 19:00:40 2016
 
 @author: sebalander
 """
-from numpy import zeros, sqrt, array, tan, arctan, prod
+from numpy import zeros, sqrt, array, tan, arctan, prod, pi, where, nan
 from cv2 import  Rodrigues
 from lmfit import minimize, Parameters
 from calibration import calibrator
@@ -57,16 +57,30 @@ def retrieveParameters(params):
 
 
 # %% ========== ========== DIRECT  ========== ==========
-def radialDistort(rp, k, quot=False):
+def radialDistort(rp, k, quot=False, der=False):
     '''
     returns distorted radius using distortion coefficient k
     optionally it returns the distortion quotioent rpp = rp * q
+    optionally returns the derivatives of q wrt rp and k
     '''
     th = arctan(rp)
     
-    k.shape = 1
+    if k.ndim < 3:  # (nk, S, 1) is a batch of S samples, rp (S, n)
+        k.shape = 1
     rpp = k * tan(th/2)
     
+    if der:
+        # tan(th/2) = rp / (1 + sqrt(1 + rp^2)), so q = k / (1 + s)
+        s = sqrt(1 + rp**2)
+        q = k / (1 + s)
+        dQdP = - q * rp / (s * (1 + s))
+        dQdK = (q / k).reshape((1, -1))
+        
+        if quot:
+            return q, dQdP, dQdK
+        else:
+            return rpp, dQdP, dQdK
+    
     if quot:
         return rpp / rp
     
@@ -127,23 +141,36 @@ def radialDistort(rp, k, quot=False):
 
 
 # %% ========== ========== INVERSE  ========== ==========
-def radialUndistort(rpp, k, quot=False):
+def radialUndistort(rpp, k, quot=False, der=False):
     '''
     takes distorted radius and returns the radius undistorted
     optioally it returns the undistortion quotient rp = rpp * q
+    rp is nan where the angle is beyond pi/2, there is no solution
+    with der it returns the distortion quotient rpp = rp * q, as
+    radialDistort does, retVal (False where there is no solution) and the
+    derivatives
     '''
-    # polynomial coeffs, grade 7
-    # # (k1,k2,p1,p2[,k3[,k4,k5,k6[,s1,s2,s3,s4[,τx,τy]]]])
     k.shape = -1
     
     thetap = 2*arctan(rpp/k)
+    retVal = (0 <= thetap) & (thetap < pi / 2)
     
     rp = tan(thetap)
     
-    if quot:
-        return rp / rpp
-    
-    return rp
+    if der:
+        # derivada de la directa
+        q, dQdP, dQdK = radialDistort(rp, k, quot=True, der=True)
+        
+        if quot:
+            return q, retVal, dQdP, dQdK
+        else:
+            return rp, retVal, dQdP, dQdK
+    else:
+        rp = where(retVal, rp, nan)
+        if quot:
+            return rp / rpp
+        else:
+            return rp
 
 #def inverse(imageCorners, rVec, tVec, linearCoeffs, distCoeffs):
 #    
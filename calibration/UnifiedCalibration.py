@@ -4,7 +4,7 @@ Created on Tue Sep 13 19:14:17 2016
 
 @author: sebalander
 """
-from numpy import zeros, sqrt, array, prod
+from numpy import zeros, sqrt, array, prod, isfinite, errstate, where, nan
 from cv2 import  Rodrigues
 from lmfit import minimize, Parameters
 from calibration import calibrator
@@ -58,16 +58,30 @@ def retrieveParameters(params):
 
 
 # %% ========== ========== DIRECT  ========== ==========
-def radialDistort(rp, k, quot=False):
+def radialDistort(rp, k, quot=False, der=False):
     '''
     returns distorted radius using distortion coefficient k
     optionally it returns the distortion quotioent rpp = rp * q
+    optionally returns the derivatives of q wrt rp and k = (l, m)
     '''
     rp2 = rp*rp
 
-    k.shape = 2
+    if k.ndim < 3:  # (nk, S, 1) is a batch of S samples, rp (S, n)
+        k.shape = 2
+
+    s = sqrt(1+rp2)
+    den = 1 + k[0] * s
+    q = (k[0]+k[1]) / den
+
+    if der:
+        dQdP = - q * k[0] * rp / (s * den)
+        dQdK = array([(1 - k[1] * s) / den**2,  # wrt l
+                      1 / den])  # wrt m
 
-    q = (k[0]+k[1]) / (1 + k[0] * sqrt(1+rp2))
+        if quot:
+            return q, dQdP, dQdK
+        else:
+            return rp * q, dQdP, dQdK
 
     if quot:
         return q
@@ -125,22 +139,54 @@ def radialDistort(rp, k, quot=False):
 
 
 # %% ========== ========== INVERSE  ========== ==========
-def radialUndistort(rp, k, quot=False):
+def radialUndistort(rpp, k, quot=False, der=False):
     '''
     returns undistorted radius using distortion coefficient k
-    optionally it returns the distortion quotioent rp = rpp * q
-    NOT IMPLEMENTED
+    optionally it returns the undistortion quotient rp = rpp * q
+    rp is nan where there is no solution (beyond the horizon)
+    with der it returns the distortion quotient rpp = rp * q, as
+    radialDistort does, retVal (False where there is no solution) and the
+    derivatives
+
+    squaring rpp (1 + l sqrt(1 + rp^2)) = (l + m) rp gives a quadratic in rp,
+    the root that goes to rp = rpp (1 + l) / (l + m) at the center is
+    rp = rpp (1 - l^2) / (a - l S) = rpp (a + l S) / (a^2 - l^2 rpp^2)
+    with a = l + m and S = sqrt(a^2 + (1 - l^2) rpp^2). the first form is
+    used for l < 0 and the second for l >= 0, so that there is no
+    cancellation
     '''
-    rp2 = rp*rp
-
     k.shape = 2
-
-    q = (k[0]+k[1]) / (1 + k[0] * sqrt(1+rp2))
-
-    if quot:
-        return q
-
-    return rp * q
+    l = k[0]
+    a = k[0] + k[1]
+
+    with errstate(invalid='ignore', divide='ignore'):
+        S = sqrt(a**2 + (1 - l**2) * rpp**2)
+        if l < 0:
+            den = a - l * S
+            rp = rpp * (1 - l**2) / den
+        else:
+            den = a**2 - l**2 * rpp**2
+            rp = rpp * (a + l * S) / den
+
+        # the squared equation has spurious roots, the original one needs
+        # (l + m) rp - rpp = l rpp sqrt(1 + rp^2) to have the sign of l
+        retVal = isfinite(rp) & (0 <= rp) & (0 < den * a)
+        retVal &= (a * rp - rpp) * l >= 0
+
+    if der:
+        # derivada de la directa
+        q, dQdP, dQdK = radialDistort(rp, k, quot=True, der=True)
+
+        if quot:
+            return q, retVal, dQdP, dQdK
+        else:
+            return rp, retVal, dQdP, dQdK
+    else:
+        rp = where(retVal, rp, nan)
+        if quot:
+            return rp / rpp
+        else:
+            return rp
 
 #def inverse(imageCorners, rVec, tVec, linearCoeffs, distCoeffs):
 #
@@ -13,10 +13,21 @@ from numpy import max, zeros, array, sqrt, roots, diag
 from numpy import sin, cos, cross, ones, concatenate, flipud, dot, isreal
 from numpy import linspace, polyval, eye, linalg, mean, prod, vstack
 from numpy import empty_like, ones_like, zeros_like, pi, empty
+from numpy import frombuffer, asarray, minimum, maximum, abs
+from numpy import vander, savez, load, inf, result_type
+from numpy import einsum, einsum_path, broadcast_to, full
+from numpy import stack, arctan2, newaxis, ndim
+from numpy import nan, isfinite, flatnonzero, array_split, argsort
+from numpy import where, errstate
 from numpy import any as anny
-from scipy.linalg import norm, inv, eig
+from scipy.linalg import norm, inv
+from functools import lru_cache
+from os import cpu_count
+from os.path import isfile
 from scipy.special import chdtri
+from scipy.optimize import least_squares, OptimizeResult
 from matplotlib.patches import FancyArrowPatch
+from matplotlib.collections import LineCollection
 from mpl_toolkits.mplot3d import proj3d
 # from copy import deepcopy as dc
 from importlib import reload
@@ -64,7 +75,7 @@ def rotateRodrigues(x, r):
     https://en.wikipedia.org/wiki/Rodrigues%27_rotation_formula
     '''
     r.shape = 3
-    th = norm(r)
+    th = sqrt(dot(r, r))  # keeps the dtype of r, scipy's norm doesn't
     rn = r / th
     ct = cos(th)
     st = sin(th)
@@ -149,21 +160,26 @@ distort = {
 
 
 def direct(objectPoints, rVec, tVec, cameraMatrix, distCoeffs, model,
-           ocv=False):
+           ocv=False, dtype=None):
     '''
     performs projection form 3D world into image, is the "direct" distortion
     optionally it uses opencv's function if available
+
+    calculates in float64 or in dtype if given, see inverse
     '''
-    xHomog = rotoTrasHomog(objectPoints, rVec, tVec)
+    dt = float if dtype is None else dtype
+    objectPoints = asarray(objectPoints, dtype=dt)
+    xHomog = rotoTrasHomog(objectPoints, asarray(rVec, dtype=dt),
+                           asarray(tVec, dtype=dt))
 
     rp = norm(xHomog, axis=1)
 
-    q = distort[model](rp, distCoeffs, quot=True)
+    q = distort[model](rp, distCoeffs, quot=True).astype(dt, copy=False)
     # print(xHomog.shape, q.shape)
     xpp, ypp = xHomog.T * q.reshape(1, -1)
 
     # project to ccd
-    return hom2ccd(xpp, ypp, cameraMatrix)
+    return hom2ccd(xpp, ypp, asarray(cameraMatrix, dtype=dt))
 
 
 def residualDirect(params, objectPoints, imagePoints, model):
@@ -191,6 +207,86 @@ def calibrateDirect(objectPoints, imagePoints, rVec, tVec, cameraMatrix,
                            cameraMatrix, distCoeffs)
 
 
+# %% COVARIANCE PROPAGATION
+# J C J^T for J and C per point (3 dims) or the same for all points (2 dims)
+propagationSubscripts = {
+    (3, 3): 'nik,nkl,njl->nij',
+    (3, 2): 'nik,kl,njl->nij',
+    (2, 3): 'ik,nkl,jl->nij',
+    (2, 2): 'ik,kl,jl->ij'  # the same for all points, added broadcasting
+    }
+
+
+@lru_cache(maxsize=64)
+def propagationPath(jNdim, cNdim, k):
+    '''
+    contraction path for einsum, calculated once for each kind of
+    propagation and number of parameters k (it doesn't depend on the number
+    of points, a small sample is used)
+    '''
+    n = 64
+    J = empty((n, 2, k) if jNdim == 3 else (2, k))
+    C = empty((n, k, k) if cNdim == 3 else (k, k))
+    return einsum_path(propagationSubscripts[(jNdim, cNdim)], J, C, J,
+                       optimize='optimal')[0]
+
+
+def propagateCovariance(J, C, out=None):
+    '''
+    propagates covariance C through jacobian J, returns J C J^T for every
+    point, of shape (n, 2, 2). J is (n, 2, k) or (2, k) if it's the same
+    for all points, C is (n, k, k) or (k, k) (if both are the same for all
+    points the result is (2, 2)).
+    if out (n, 2, 2) is given the result is added to it, so that the
+    contributions of several sources of uncertainty go to the same array.
+    no temporary bigger than (n, 2, k) is built
+    '''
+    J = asarray(J)
+    C = asarray(C, dtype=J.dtype)
+    k = J.shape[-1]
+    path = propagationPath(J.ndim, C.ndim, k)
+    JCJt = einsum(propagationSubscripts[(J.ndim, C.ndim)], J, C, J,
+                  optimize=path)
+    if out is None:
+        return JCJt
+    out += JCJt
+    return out
+
+
+def det2x2(C):
+    '''
+    determinants of the 2x2 matrices C (..., 2, 2) in closed form
+    '''
+    return C[..., 0, 0] * C[..., 1, 1] - C[..., 0, 1] * C[..., 1, 0]
+
+
+def inverse2x2(C, out=None):
+    '''
+    inverses of the 2x2 matrices C (..., 2, 2) in closed form, elementwise
+    over all the matrices instead of linalg.inv, written in out if given
+    '''
+    det = det2x2(C)
+    if out is None:
+        out = empty_like(C)
+    out[..., 0, 0] = C[..., 1, 1] / det
+    out[..., 1, 1] = C[..., 0, 0] / det
+    out[..., 0, 1] = - C[..., 0, 1] / det
+    out[..., 1, 0] = - C[..., 1, 0] / det
+    return out
+
+
+def sqrtPSD(C):
+    '''
+    square roots L of the covariances C (..., d, d), L L^T = C, from the
+    eigendecomposition with negative eigenvalues (rounding) clipped to 0.
+    unlike cholesky it takes singular covariances, a parameter held fixed
+    with zero variance for example, the columns of L in those directions
+    are zero
+    '''
+    l, v = linalg.eigh(asarray(C, dtype=float))
+    return v * sqrt(maximum(l, 0))[..., newaxis, :]
+
+
 # %% INVERSE PROJECTION
 def ccd2homJacobian(imagePoints, cameraMatrix):
     '''
@@ -212,13 +308,20 @@ def ccd2homJacobian(imagePoints, cameraMatrix):
     return Jd_i, Jd_k
 
 
-def ccd2hom(imagePoints, cameraMatrix, Cccd=False, Cf=False):
+def ccd2hom(imagePoints, cameraMatrix, Cccd=False, Cf=False, dtype=None):
     '''
-    must provide covariances for every point if cov is not None
+    Cccd is the covariance of every point (n, 2, 2), or the same for all of
+    them (2, 2), or a scalar variance for isotropic errors (Cccd * eye(2)).
     
     Cf is the covariance matrix of intrinsic linear parameters fx, fy, u, v
     (in that order).
+
+    calculates in float64 (float32 corners too) or in dtype if given, see
+    inverse
     '''
+    dt = float if dtype is None else dtype
+    imagePoints = asarray(imagePoints, dtype=dt)
+    cameraMatrix = asarray(cameraMatrix, dtype=dt)
     # undo CCD projection, asume diagonal ccd rescale
     xpp = (imagePoints[:, 0] - cameraMatrix[0, 2]) / cameraMatrix[0, 0]
     ypp = (imagePoints[:, 1] - cameraMatrix[1, 2]) / cameraMatrix[1, 1]
@@ -227,23 +330,17 @@ def ccd2hom(imagePoints, cameraMatrix, Cccd=False, Cf=False):
     Cfbool = anny(Cf)
     
     if Cccdbool or Cfbool:
-        Cpp = zeros((xpp.shape[0],2,2))  # create covariance matrix
+        Cpp = zeros((xpp.shape[0],2,2), dtype=dt)  # create covariance matrix
         Jd_i, Jd_k = ccd2homJacobian(imagePoints, cameraMatrix)
         
         if Cccdbool:
-            Jd_iResh = Jd_i.reshape((-1, 2, 2, 1, 1))
-            Cpp += (Jd_iResh *
-                    Cccd.reshape((-1,1,2,2,1)) *
-                    Jd_iResh.transpose((0,4,3,2,1))
-                    ).sum((2,3))
+            if ndim(Cccd) == 0:  # isotropic
+                Cccd = Cccd * eye(2)
+            propagateCovariance(Jd_i.astype(dt), Cccd, Cpp)
         
         if Cfbool:
             # propagate uncertainty via Jacobians
-            Jd_kResh = Jd_k.reshape((-1, 2, 4, 1, 1))
-            Cpp += (Jd_kResh *
-                    Cf.reshape((-1,1,4,4,1)) *
-                    Jd_kResh.transpose((0,4,3,2,1))
-                    ).sum((2,3))
+            propagateCovariance(Jd_k, Cf, Cpp)
     else:
         Cpp = False  # return without covariance matrix
 
@@ -260,16 +357,342 @@ undistort = {
     'fisheye': fisheye.radialUndistort
 }
 
+# the exact solvers, to go back after using lookup tables
+undistortExact = dict(undistort)
+
+
+def undistortRadius(undistortFun, rpp, k):
+    '''
+    undistorted radius rp and retVal from any of the undistort functions.
+    stereographic and unified return just rp, nan where there is no
+    solution, the quotient with quot is not the same for every model so it
+    is not used here
+    '''
+    out = undistortFun(rpp, k)
+    if isinstance(out, tuple):
+        return out[0], out[1]
+    return out, isfinite(out)
+
+
+# %% UNDISTORTION LOOKUP TABLES
+@lru_cache(maxsize=32)
+def undistortTable(model, kBytes, quot, der, rppMax, maxError, nMax):
+    '''
+    tabulates undistortExact[model] in a regular grid of rpp in (0, rppMax]
+    for the distortion coefficients k given as bytes (to be hashable, use
+    k.tobytes()), so it is built once per (model, k) and kept in an LRU cache
+
+    the grid is refined until linear interpolation of every output is within
+    maxError (relative for values bigger than one) of the exact solver at the
+    middle of every interval, up to nMax nodes. intervals that still fail (or where
+    retVal changes or is False) are flagged to be solved exactly.
+
+    returns rpp0, h, outputs, exacto, esTupla
+    '''
+    k = frombuffer(kBytes, dtype=float).copy()
+    solver = undistortExact[model]
+    kw = {'quot': quot, 'der': der} if der else {'quot': quot}
+
+    def evalua(rpp):
+        out = solver(rpp, k.copy(), **kw)
+        if isinstance(out, tuple):
+            return [asarray(o) for o in out], True
+        return [asarray(out)], False
+
+    n = 256
+    while True:
+        rpp = linspace(rppMax / n, rppMax, n)
+        outputs, esTupla = evalua(rpp)
+        medios = (rpp[1:] + rpp[:-1]) / 2
+        outMedios, _ = evalua(medios)
+
+        exacto = zeros(n - 1, dtype=bool)
+        for o, oMedio in zip(outputs, outMedios):
+            if o.dtype == bool:
+                # retVal must be True in both extremes of the interval
+                exacto |= ~ (o[1:] & o[:-1])
+                continue
+            interpolado = (o[..., 1:] + o[..., :-1]) / 2
+            error = abs(interpolado - oMedio)
+            tolerancia = maxError * maximum(abs(oMedio), 1)
+            # nan counts as bad too
+            exacto |= ~ (error <= tolerancia).reshape((-1, n - 1)).all(0)
+
+        if not anny(exacto) or 2 * n > nMax:
+            break
+        n *= 2
+
+    return rpp[0], rpp[1] - rpp[0], outputs, exacto, esTupla
+
+
+def tabulatedUndistort(model, rppMax=3.0, maxError=1e-8, nMax=2**17):
+    '''
+    returns a function with the same signature and outputs as
+    undistort[model], (rpp, k, quot=False, der=False), that interpolates the
+    cached lookup table for k instead of solving every point. points outside
+    the table or in intervals where the interpolation error is bigger than
+    maxError are solved exactly. rppMax should cover the image, for example
+    the rpp of the image corners.
+    '''
+    def radialUndistortTable(rpp, k, quot=False, der=False):
+        k = asarray(k, dtype=float).reshape(-1)
+        rpp0, h, outputs, exacto, esTupla = undistortTable(
+            model, k.tobytes(), quot, der, rppMax, maxError, nMax)
+
+        rpp = asarray(rpp, dtype=float)
+        # index of the interval of each point and weight of its right node
+        pos = (rpp - rpp0) / h
+        adentro = (0 <= pos) & (pos <= exacto.shape[0])
+        ind = minimum(pos[adentro].astype(int), exacto.shape[0] - 1)
+        adentro[adentro] = ~ exacto[ind]
+        ind = minimum(pos[adentro].astype(int), exacto.shape[0] - 1)
+        w = pos[adentro] - ind
+
+        result = list()
+        for o in outputs:
+            r = empty(o.shape[:-1] + rpp.shape, dtype=o.dtype)
+            if o.dtype == bool:
+                r[..., adentro] = o[..., ind] & o[..., ind + 1]
+            else:
+                r[..., adentro] = o[..., ind] * (1 - w) + o[..., ind + 1] * w
+            result.append(r)
+
+        if not adentro.all():  # solve exactly the rest
+            kw = {'quot': quot, 'der': der} if der else {'quot': quot}
+            out = undistortExact[model](rpp[~adentro], k, **kw)
+            out = out if esTupla else [out]
+            for r, o in zip(result, out):
+                r[..., ~adentro] = o
+
+        return tuple(result) if esTupla else result[0]
+
+    return radialUndistortTable
+
+
+def useUndistortTables(on=True, rppMax=3.0, maxError=1e-8, nMax=2**17):
+    '''
+    replaces the radial undistortion of every model in undistort by the
+    tabulated version (or goes back to the exact solvers if on=False), so
+    homDist2homUndist, inverse, etc. use it transparently
+    '''
+    for model in undistortExact:
+        if on:
+            undistort[model] = tabulatedUndistort(model, rppMax, maxError,
+                                                  nMax)
+        else:
+            undistort[model] = undistortExact[model]
+
+
+# %% FITTED APPROXIMATE INVERSE
+# outputs of radialUndistort given rp, for the models with no closed form
+fitOutputs = {
+    'rational': rational.undistortOutputs,
+    'poly': poly.undistortOutputs
+    }
+
+# max residual in pixels for a fitted inverse to be used instead of solving
+inverseFitTolerance = 0.05
+
+# the fitted inverses in use, (model, k.tobytes()) -> fittedUndistort
+inverseFits = dict()
+
+
+def evalInverseFit(fit, rpp):
+    '''
+    undistorted radius rp = rpp * num(u) / den(u), u = (rpp / rppMax)**2,
+    just a few multiply-adds per point
+    '''
+    u = (rpp / fit['rppMax'])**2
+    return rpp * polyval(fit['num'], u) / polyval(fit['den'], u)
+
+
+def fitInverseDistortion(model, distCoeffs, cameraMatrix, rppMax=None,
+                         tolerance=inverseFitTolerance, maxDeg=8,
+                         nSamples=2000, nIter=10):
+    '''
+    fits a closed form approximate inverse of the radial distortion, the
+    rational function rp = rpp * num(u) / den(u) of u = (rpp / rppMax)**2,
+    with the exact solver on nSamples radii up to rppMax (the image corner
+    by default). linear least squares reweighted by 1/den (Sanathanan-
+    Koerner). degrees of num and den go up from 1 until the residual is under
+    tolerance or maxDeg is reached, the best fit is kept. if the exact inverse
+    fails before rppMax the fit is limited to where it exists, ValueError if
+    it fails from the first radius.
+
+    the residual is in pixels, |distort(fit(rpp)) - rpp| * max(fx, fy) on a
+    grid 4 times denser than the samples.
+
+    returns dict fit with model, distCoeffs, num, den, rppMax and
+    maxResidual, see saveInverseFit and fittedUndistort
+    '''
+    k = array(distCoeffs, dtype=float).reshape(-1)
+    f = maximum(cameraMatrix[0, 0], cameraMatrix[1, 1])
+    if rppMax is None:
+        rppMax = sqrt((cameraMatrix[0, 2] / cameraMatrix[0, 0])**2 +
+                      (cameraMatrix[1, 2] / cameraMatrix[1, 1])**2)
+
+    # only up to the first radius with no inverse
+    rppCheck = linspace(0, rppMax, 4 * nSamples + 1)[1:]
+    rpCheck, retVal = undistortRadius(undistortExact[model], rppCheck,
+                                      k.copy())
+    if not retVal.all():
+        if not retVal[0]:
+            raise ValueError('the %s distortion has no inverse near the '
+                             'center, nothing to fit' % model)
+        rppMax = rppCheck[retVal.argmin() - 1]
+        rppCheck = rppCheck[rppCheck <= rppMax]
+        rpCheck = rpCheck[:rppCheck.shape[0]]
+
+    rpp = rppCheck[::4]
+    u = (rpp / rppMax)**2
+    q = rpCheck[::4] / rpp
+
+    fit = {'model': model, 'distCoeffs': k, 'rppMax': rppMax,
+           'maxResidual': inf}
+    for deg in range(1, maxDeg + 1):
+        V = vander(u, deg + 1)
+        # q * den(u) = num(u), with den(0) = 1
+        A = concatenate((V, - q.reshape((-1, 1)) * V[:, :-1]), axis=1)
+        w = ones_like(u)
+        for i in range(nIter):
+            c = linalg.lstsq(A * w.reshape((-1, 1)), q * w, rcond=None)[0]
+            num = c[:deg + 1]
+            den = concatenate((c[deg + 1:], [1]))
+            w = 1 / abs(polyval(den, u))
+
+        # den must not vanish in the range
+        polos = roots(den)
+        polos = polos.real[isreal(polos)]
+        if anny((0 <= polos) & (polos <= 1)):
+            continue
+
+        prueba = {'num': num, 'den': den, 'rppMax': rppMax}
+        rppFit = distort[model](evalInverseFit(prueba, rppCheck), k.copy())
+        residual = abs(rppFit - rppCheck).max() * f
+        if not residual < fit['maxResidual']:
+            continue
+
+        fit.update(prueba, maxResidual=residual)
+        if residual < tolerance:
+            break
+
+    return fit
+
+
+def inverseFitFile(distCoeffsFile):
+    '''
+    name of the file with the inverse fit, next to the DistCoeffs.npy file
+    '''
+    return distCoeffsFile.replace('DistCoeffs.npy', 'InverseFit.npz')
+
+
+def saveInverseFit(fileName, fit):
+    savez(fileName, **fit)
+
+
+def loadInverseFit(fileName):
+    with load(fileName) as data:
+        fit = {n: data[n] for n in data.files}
+    fit['model'] = str(fit['model'])
+    fit['rppMax'] = float(fit['rppMax'])
+    fit['maxResidual'] = float(fit['maxResidual'])
+    return fit
+
+
+def fittedUndistort(fit, tolerance=inverseFitTolerance):
+    '''
+    returns a function with the same signature and outputs as
+    undistort[model] that evaluates the fitted inverse instead of solving,
+    if its residual is under tolerance pixels (if not it is just the exact
+    solver). points beyond the fitted range, or a k different from the one
+    of the fit (while optimizing for example), go to the exact solver.
+    '''
+    model = fit['model']
+    exact = undistortExact[model]
+    if not fit['maxResidual'] < tolerance:
+        return exact
+
+    kFit = asarray(fit['distCoeffs'], dtype=float).reshape(-1)
+
+    def radialUndistortFit(rpp, k, quot=False, der=False):
+        k = asarray(k, dtype=float).reshape(-1)
+        kw = {'quot': quot, 'der': der} if der else {'quot': quot}
+        if k.shape != kFit.shape or anny(k != kFit):
+            return exact(rpp, k, **kw)
+
+        rpp = asarray(rpp, dtype=float)
+        rp = evalInverseFit(fit, rpp)
+        retVal = ones_like(rpp, dtype=bool)
+
+        fuera = ~ (rpp <= fit['rppMax'])
+        if anny(fuera):
+            rp[fuera], retVal[fuera] = exact(rpp[fuera], k)
+
+        return fitOutputs[model](rpp, rp, retVal, k, quot, der)
+
+    return radialUndistortFit
+
+
+def registeredUndistort(model):
+    '''
+    radial undistortion of model that uses the fitted inverse registered in
+    inverseFits for k, if there is one, or the exact solver
+    '''
+    exact = undistortExact[model]
+
+    def radialUndistortRegistered(rpp, k, quot=False, der=False):
+        kBytes = asarray(k, dtype=float).reshape(-1).tobytes()
+        kw = {'quot': quot, 'der': der} if der else {'quot': quot}
+        return inverseFits.get((model, kBytes), exact)(rpp, k, **kw)
+
+    return radialUndistortRegistered
+
 
-def homDist2homUndist_ratioJacobians(xpp, ypp, distCoeffs, model):
+def useInverseFits(fits, tolerance=inverseFitTolerance):
+    '''
+    registers the fitted inverses with residual under tolerance, so that
+    undistort (and homDist2homUndist, inverse, etc) uses them for the
+    distortion coefficients they were fitted for. the other coefficients of
+    the same model (other cameras, or while optimizing) are solved exactly.
+    see useUndistortTables
+    '''
+    for fit in fits:
+        if not fit['maxResidual'] < tolerance:
+            continue
+        model = fit['model']
+        k = asarray(fit['distCoeffs'], dtype=float).reshape(-1)
+        inverseFits[(model, k.tobytes())] = fittedUndistort(fit, tolerance)
+        undistort[model] = registeredUndistort(model)
+
+
+def loadDistCoeffs(distCoeffsFile):
+    '''
+    loads the distortion coefficients and the inverse fit saved next to them
+    (inverseFitFile), None if there is none. the fit is not used until it is
+    registered, useInverseFits([fit]), which checks its residual.
+    returns distCoeffs, fit
+    '''
+    distCoeffs = load(distCoeffsFile)
+    fitFile = inverseFitFile(distCoeffsFile)
+    fit = loadInverseFit(fitFile) if isfile(fitFile) else None
+    return distCoeffs, fit
+
+
+def homDist2homUndist_ratioJacobians(xpp, ypp, distCoeffs, model,
+                                     undistortFun=None):
     '''
     returns the distortion ratio and the jacobians with respect to undistorted
     coords and distortion params.
+    undistortFun replaces undistort[model] if given (a tabulated one, etc)
     '''
+    if undistortFun is None:
+        undistortFun = undistort[model]
     # calculate ratio of undistortion
     rpp = norm([xpp, ypp], axis=0)
-    q, ret, dQdP, dQdK = undistort[model](rpp, distCoeffs, quot=True,
-                                           der=True)
+    q, ret, dQdP, dQdK = undistortFun(rpp, distCoeffs, quot=True, der=True)
+    # the solvers work in float64, back to the type of the points
+    dt = rpp.dtype
+    q, dQdP, dQdK = [asarray(v, dtype=dt) for v in (q, dQdP, dQdK)]
     
     xp = xpp / q
     yp = ypp / q
@@ -295,41 +718,41 @@ def homDist2homUndist_ratioJacobians(xpp, ypp, distCoeffs, model):
 
 
 
-def homDist2homUndist(xpp, ypp, distCoeffs, model, Cpp=False, Ck=False):
+def homDist2homUndist(xpp, ypp, distCoeffs, model, Cpp=False, Ck=False,
+                      undistortFun=None, dtype=None):
     '''
     takes ccd cordinates and projects to homogenpus coords and undistorts
+    undistortFun replaces undistort[model] if given (a tabulated one, etc).
+    calculates in float64 or in dtype if given, see inverse
     '''
+    dt = float if dtype is None else dtype
+    xpp, ypp = asarray(xpp, dtype=dt), asarray(ypp, dtype=dt)
+    if undistortFun is None:
+        undistortFun = undistort[model]
     Cppbool = anny(Cpp)
     Ckbool = anny(Ck)
     
     if Cppbool or Ckbool :  # no hay incertezas Ck ni Cpp
         q, _, Jp_pp, Jp_k = homDist2homUndist_ratioJacobians(xpp, ypp,
                                                             distCoeffs,
-                                                            model)
+                                                            model,
+                                                            undistortFun)
         xp = xpp / q  # undistort in homogenous coords
         yp = ypp / q
         
-        Cp = zeros((len(xp),2,2))
+        Cp = zeros((len(xp),2,2), dtype=xp.dtype)
         
         # nk = nparams[model] # distCoeffs.shape[0]  # unmber of dist coeffs
         if Cppbool:  # incerteza Cpp 
-            Jp_ppResh = Jp_pp.reshape((-1, 2, 1, 2, 1))
-            Cp = (Jp_ppResh *
-                  Cpp.reshape((-1,1,2,2,1)) *
-                  Jp_ppResh.transpose((0,4,3,2,1))
-                  ).sum((2,3))
+            propagateCovariance(Jp_pp, Cpp, Cp)
         if Ckbool:  # incerteza Ck 
-            nk = Jp_k.shape[-1]
-            Jp_kResh = Jp_k.reshape((-1, 2, 1, nk, 1))
-            Cp += (Jp_kResh *
-                   Ck.reshape((1, 1, nk, nk, 1)) *
-                   Jp_kResh.transpose((0, 4, 3, 2, 1))
-                   ).sum((2, 3))
+            propagateCovariance(Jp_k, Ck, Cp)
 
     else:
         # calculate ratio of undistortion
         rpp = norm([xpp, ypp], axis=0)
-        q, _ = undistort[model](rpp, distCoeffs, quot=True, der=False)
+        rp, _ = undistortRadius(undistortFun, rpp, distCoeffs)
+        q = rpp / asarray(rp, dtype=rpp.dtype)
         
         xp = xpp / q  # undistort in homogenous coords
         yp = ypp / q
@@ -383,15 +806,12 @@ def homDist2homUndist(xpp, ypp, distCoeffs, model, Cpp=False, Ck=False):
 #    return Cm
 
 
-def jacobianosHom2Map(xp, yp, rV, tV):
+def poseTerms(rx, ry, rz, tx, ty, tz):
     '''
-    returns the jacobians needed to calculate the propagation of uncertainty
-    todavia no me tome el trabajo de calcularlos pro separado según sea
-    necesario
+    the terms of jacobianosHom2MapPoints that depend only on the pose. the
+    components of rV, tV can be scalars or arrays of many poses (shape
+    (m, 1) for the terms to broadcast against the points)
     '''
-    rx, ry, rz = rV
-    tx, ty, tz = tV
-    x0 = ty - tz*yp
     x1 = rx**2
     x2 = ry**2
     x3 = rz**2
@@ -411,31 +831,17 @@ def jacobianosHom2Map(xp, yp, rV, tV):
     x17 = -x16 + x9
     x18 = x15*x2
     x19 = x16 + x8
-    x20 = x19*yp
-    x21 = x12 + x18 - x20
     x22 = x1*x15
     x23 = ry*x7
     x24 = -x23
     x25 = rx*rz
     x26 = x15*x25
     x27 = x24 + x26
-    x28 = x27*xp
-    x29 = x12 + x22 - x28
     x30 = rz*x7
     x31 = -x30
     x32 = rx*ry
     x33 = x15*x32
-    x34 = -x19*xp + x31 + x33
-    x35 = -x27*yp + x30 + x33
-    x36 = x21*x29 - x34*x35
-    x37 = 1/x36
     x38 = x23 - x26
-    x39 = x17*x35 - x21*x38
-    x40 = tx - tz*xp
-    x41 = x36**(-2)
-    x42 = x41*(x0*x34 - x21*x40)
-    x43 = -x17*x29 + x34*x38
-    x44 = x41*(-x0*x29 + x35*x40)
     x45 = x6/x4**(3/2)
     x46 = x2*x45
     x47 = x4**(-2)
@@ -449,13 +855,11 @@ def jacobianosHom2Map(xp, yp, rV, tV):
     x55 = -x32*x54
     x56 = x53 + x55 + x7
     x57 = x1*x50 - x51 + x56
-    x58 = x49 - x57*yp + x9
     x59 = 2*ry*x14*x47
     x60 = ry*x51 - x1*x59
     x61 = x25*x45
     x62 = x25*x50
     x63 = ry*x15
-    x64 = -x57*xp + x60 + x61 - x62 + x63
     x65 = rx**3
     x66 = rx*x15
     x67 = 2*x14*x47
@@ -463,31 +867,127 @@ def jacobianosHom2Map(xp, yp, rV, tV):
     x69 = x32*x50
     x70 = rz*x15
     x71 = x52 + x68 - x69 + x70
-    x72 = x45*x65 - x65*x67 + 2*x66 - x71*xp + x9
     x73 = -x61
-    x74 = x60 + x62 + x63 - x71*yp + x73
-    x75 = -x21*x72 - x29*x58 + x34*x74 + x35*x64
     x76 = ry**3
     x77 = rz*x46 - x2*x54
     x78 = -x52 + x69 + x70 + x77
-    x79 = x24 + x45*x76 + 2*x63 - x67*x76 - x78*yp
     x80 = x10*x45
     x81 = x10*x50
     x82 = -x81
-    x83 = x49 + x66 - x78*xp + x80 + x82
     x84 = x53 + x55 - x7
     x85 = -x2*x50 + x46 + x84
-    x86 = x24 + x60 - x85*xp
-    x87 = x49 + x66 - x80 + x81 - x85*yp
-    x88 = -x21*x86 - x29*x79 + x34*x87 + x35*x83
     x89 = x3*x45
     x90 = ry*x89 - x3*x59 + x62 + x63 + x73
-    x91 = x31 + x77 - x90*yp
     x92 = x3*x50
-    x93 = x84 + x89 - x90*xp - x92
     x94 = rx*x89 - x3*x48 + x66 + x80 + x82
-    x95 = x31 + x68 - x94*xp
-    x96 = x56 - x89 + x92 - x94*yp
+
+    # the parts of the linear (in xp or yp) terms that don't depend on them
+    terms = (tx, ty, tz, x17, x19, x27, x38, x57, x71, x78, x85, x90, x94,
+             x12 + x18,                         # x21 = . - x19*yp
+             x12 + x22,                         # x29 = . - x27*xp
+             x31 + x33,                         # x34 = . - x19*xp
+             x30 + x33,                         # x35 = . - x27*yp
+             x49 + x9,                          # x58 = . - x57*yp
+             x60 + x61 - x62 + x63,             # x64 = . - x57*xp
+             x45*x65 - x65*x67 + 2*x66 + x9,    # x72 = . - x71*xp
+             x60 + x62 + x63 + x73,             # x74 = . - x71*yp
+             x24 + x45*x76 + 2*x63 - x67*x76,   # x79 = . - x78*yp
+             x49 + x66 + x80 + x82,             # x83 = . - x78*xp
+             x24 + x60,                         # x86 = . - x85*xp
+             x49 + x66 - x80 + x81,             # x87 = . - x85*yp
+             x31 + x77,                         # x91 = . - x90*yp
+             x84 + x89 - x92,                   # x93 = . - x90*xp
+             x31 + x68,                         # x95 = . - x94*xp
+             x56 - x89 + x92)                   # x96 = . - x94*yp
+    return terms
+
+
+@lru_cache(maxsize=32)
+def hom2MapPose(rVBytes, tVBytes, dtype):
+    '''
+    the terms of jacobianosHom2Map and xypToZplane that depend only on the
+    pose, calculated once per (rV, tV) given as bytes (rV.tobytes(), float64)
+    and kept in an LRU cache, so the same camera in every frame doesn't
+    repeat them. they are calculated in float64 and given as scalars of
+    dtype.
+    returns R (rotation matrix), Hinv (inverse of zPlaneHomography) and the
+    tuple of terms for jacobianosHom2MapPoints
+    '''
+    rx, ry, rz = frombuffer(rVBytes, dtype=float)
+    tx, ty, tz = frombuffer(tVBytes, dtype=float)
+    terms = poseTerms(rx, ry, rz, tx, ty, tz)
+    dt = dtype.type
+    R = Rodrigues(array([rx, ry, rz]))[0]
+    Hinv = inv(zPlaneHomography(R, [tx, ty, tz])).astype(dtype)
+
+    return R.astype(dtype), Hinv, tuple(dt(t) for t in terms)
+
+
+def poseOf(rV, tV, dtype):
+    '''
+    the cached hom2MapPose of rV, tV
+    '''
+    rV = asarray(rV, dtype=float).reshape(-1)
+    tV = asarray(tV, dtype=float).reshape(-1)
+    return hom2MapPose(rV.tobytes(), tV.tobytes(), result_type(dtype))
+
+
+def zPlaneHomography(rV, tV, inverse=False):
+    '''
+    homography from the z=0 plane (xm, ym, 1) to homogenous undistorted
+    coords (xp, yp, 1) for the pose rV (rotation vector or matrix), tV.
+    with inverse=True returns the one from xp, yp to the plane, the one
+    xypToZplane applies, cached per pose if rV is a rotation vector
+    '''
+    rV = asarray(rV, dtype=float)
+    if inverse:
+        if rV.size == 3:
+            return poseOf(rV, tV, float)[1].copy()
+        return inv(zPlaneHomography(rV, tV))
+
+    R = rV.reshape((3, 3)) if rV.size == 9 else Rodrigues(rV.reshape(-1))[0]
+    H = eye(3)
+    H[:, :2] = R[:, :2]
+    H[:, 2] = asarray(tV, dtype=float).reshape(-1)
+    return H
+
+
+def jacobianosHom2MapPoints(xp, yp, terms):
+    '''
+    the per point part of jacobianosHom2Map, with the pose terms of
+    hom2MapPose
+    '''
+    (tx, ty, tz, x17, x19, x27, x38, x57, x71, x78, x85, x90, x94, c21, c29,
+     c34, c35, c58, c64, c72, c74, c79, c83, c86, c87, c91, c93, c95,
+     c96) = terms
+
+    x0 = ty - tz*yp
+    x21 = c21 - x19*yp
+    x29 = c29 - x27*xp
+    x34 = c34 - x19*xp
+    x35 = c35 - x27*yp
+    x36 = x21*x29 - x34*x35
+    x37 = 1/x36
+    x39 = x17*x35 - x21*x38
+    x40 = tx - tz*xp
+    x41 = x37**2
+    x42 = x41*(x0*x34 - x21*x40)
+    x43 = -x17*x29 + x34*x38
+    x44 = x41*(-x0*x29 + x35*x40)
+    x58 = c58 - x57*yp
+    x64 = c64 - x57*xp
+    x72 = c72 - x71*xp
+    x74 = c74 - x71*yp
+    x75 = -x21*x72 - x29*x58 + x34*x74 + x35*x64
+    x79 = c79 - x78*yp
+    x83 = c83 - x78*xp
+    x86 = c86 - x85*xp
+    x87 = c87 - x85*yp
+    x88 = -x21*x86 - x29*x79 + x34*x87 + x35*x83
+    x91 = c91 - x90*yp
+    x93 = c93 - x90*xp
+    x95 = c95 - x94*xp
+    x96 = c96 - x94*yp
     x97 = -x21*x95 - x29*x91 + x34*x96 + x35*x93
 
     # jacobiano de la pos en el mapa con respecto a las posiciones homogeneas
@@ -495,75 +995,90 @@ def jacobianosHom2Map(xp, yp, rV, tV):
                      x37*(-tz*x34 - x17*x40) + x42*x43],
                     [x37*(-tz*x35 - x0*x38) + x39*x44,
                      x37*(tz*x29 + x38*x40) + x43*x44]])
-    
+
     # jacobiano respecto a la rototraslacion, tres primeras columnas son wrt
     # rotacion y las ultimas tres son wrt traslacion
     JXm_rtV = array([[x37*(x0*x64 - x40*x58) + x42*x75,     # x wrt r1
                       x37*(x0*x83 - x40*x79) + x42*x88,     # x wrt r2
                       x37*(x0*x93 - x40*x91) + x42*x97,     # x wrt r3
-                      x37*(x13 - x18 + x20),                # x wrt t1
-                      x34*x37, x37*(x21*xp - x34*yp)],      # x wrt t2
-                     [x37*(-x0*x72 + x40*x74) + x44*x75,    # x wrt t3
-                      x37*(-x0*x86 + x40*x87) + x44*x88,    # y wrt r1
-                      x37*(-x0*x95 + x40*x96) + x44*x97,    # y wrt r2
+                      - x37*x21,                            # x wrt t1
+                      x34*x37, x37*(x21*xp - x34*yp)],      # x wrt t2, t3
+                     [x37*(-x0*x72 + x40*x74) + x44*x75,    # y wrt r1
+                      x37*(-x0*x86 + x40*x87) + x44*x88,    # y wrt r2
+                      x37*(-x0*x95 + x40*x96) + x44*x97,    # y wrt r3
                       x35*x37,                              # y wrt t1
-                      x37*(x13 - x22 + x28),                # y wrt t2
+                      - x37*x29,                            # y wrt t2
                       x37*(x29*yp - x35*xp)]])              # y wrt t3
 
     return JXm_Xp, JXm_rtV
 
 
-def xypToZplane(xp, yp, rV, tV, Cp=False, Crt=False):
+def jacobianosHom2Map(xp, yp, rV, tV):
     '''
-    projects a point from homogenous undistorted to 3D asuming z=0
+    returns the jacobians needed to calculate the propagation of uncertainty
+    JXm_Xp (2, 2, n) wrt xp, yp and JXm_rtV (2, 6, n) wrt rV, tV. the terms
+    that only depend on the pose are cached (hom2MapPose), only the per point
+    part is evaluated for every call with the same pose
     '''
-    if prod(rV.shape) == 3:
-        R = Rodrigues(rV)[0]
+    terms = poseOf(rV, tV, xp.dtype)[2]
+    return jacobianosHom2MapPoints(xp, yp, terms)
 
-    # auxiliar calculations
-    a = R[0, 0] - R[2, 0] * xp
-    b = R[0, 1] - R[2, 1] * xp
-    c = tV[0] - tV[2] * xp
-    d = R[1, 0] - R[2, 0] * yp
-    e = R[1, 1] - R[2, 1] * yp
-    f = tV[1] - tV[2] * yp
-    q = a*e - d*b
 
-    xm = (f*b - c*e) / q
-    ym = (c*d - f*a) / q
+def xypToZplane(xp, yp, rV, tV, Cp=False, Crt=False, dtype=None):
+    '''
+    projects a point from homogenous undistorted to 3D asuming z=0,
+    applying the inverse of zPlaneHomography (cached for each pose).
+    rV is a rotation vector or a rotation matrix, Crt always refers to the
+    rotation vector.
+    for a single point given as scalars xm, ym are scalars and Cm (2, 2).
+    xp, yp of any shape, (S, n) for example, give xm, ym of that shape and
+    Cm of that shape plus (2, 2), Cp too if it is per point.
+    calculates in float64 or in dtype if given, see inverse
+    '''
+    dt = float if dtype is None else dtype
+    xp, yp = asarray(xp, dtype=dt), asarray(yp, dtype=dt)
+    shape = xp.shape
+    # the points in one row, back to shape at the end
+    xp, yp = xp.reshape(-1), yp.reshape(-1)
+    if ndim(Cp) > 2:
+        Cp = asarray(Cp).reshape((-1, 2, 2))
+    rV = asarray(rV, dtype=float)
+    if rV.size == 9:  # the pose terms are in terms of the rotation vector
+        rV = Rodrigues(rV.reshape((3, 3)))[0]
+    Hinv = poseOf(rV, tV, dt)[1]  # cached
+
+    # all points in one product and dehomogenize
+    X = Hinv[:, :2].dot(array([xp, yp])) + Hinv[:, 2:]
+    xm = X[0] / X[2]
+    ym = X[1] / X[2]
 
     Cpbool = anny(Cp)
     Crtbool = anny(Crt)
     if Cpbool or Crtbool:  # no hay incertezas
-        Cm = zeros((xm.shape[0],2,2))
+        Cm = zeros((xm.shape[0],2,2), dtype=dt)
         # calculo jacobianos
         JXm_Xp, JXm_rtV = jacobianosHom2Map(xp, yp, rV, tV)
         
         if Crtbool:  # contribucion incerteza Crt
-            JXm_rtVResh = JXm_rtV.reshape((2,6,1,1,-1))
-            Cm += (JXm_rtVResh *
-                   Crt.reshape((1,6,6,1,1)) *
-                   JXm_rtVResh.transpose((3,2,1,0,4))
-                   ).sum((1,2)).transpose((2,0,1))
+            propagateCovariance(JXm_rtV.transpose((2, 0, 1)), Crt, Cm)
         
         if Cpbool:  # incerteza Cp
-            Cp = Cp.transpose((1,2,0))
-            JXm_XpResh = JXm_Xp.reshape((2,2,1,1,-1))
-            Cm += (JXm_XpResh *
-                   Cp.reshape((1,2,2,1,-1)) *
-                   JXm_XpResh.transpose((3,2,1,0,4))
-                   ).sum((1,2)).transpose((2,0,1))
+            propagateCovariance(JXm_Xp.transpose((2, 0, 1)), Cp, Cm)
     
     else:
         Cm = False  # return None covariance
     
-    return xm, ym, Cm
+    if Cm is not False:
+        Cm = Cm.reshape(shape + (2, 2))
+    if shape == ():
+        return xm[0], ym[0], Cm
+    return xm.reshape(shape), ym.reshape(shape), Cm
 
 
 
 
 def inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
-            Cccd=False, Cf=False, Ck=False, Crt=False):
+            Cccd=False, Cf=False, Ck=False, Crt=False, dtype=None):
     '''
     inverseFisheye(objPoints, rVec/rotMatrix, tVec, cameraMatrix,
                     distCoeffs)-> objPoints
@@ -573,16 +1088,403 @@ def inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
     ignores tangential and tilt distortions
 
     propagates covariance uncertainty
+
+    calculates in float64 (even if imagePoints are float32, as the corners
+    are saved, derivatives of the calibration need it) or in dtype if given.
+    dtype=float32 halves memory and bandwidth for dense grids, the radial
+    undistortion is still solved in float64 and rounded, so results are
+    within float32 rounding of the float64 ones (~1e-6 relative in xm, ym
+    and Cm away from the horizon, see dev/benchmarkFloat32.py). ccd2hom,
+    homDist2homUndist and xypToZplane take the same dtype argument, the
+    parameters are only cast to float32 if it is asked for.
     '''
+    dt = float if dtype is None else dtype
+    imagePoints = asarray(imagePoints, dtype=dt)
     # project to homogenous distorted
-    xpp, ypp, Cpp = ccd2hom(imagePoints, cameraMatrix, Cccd, Cf)
+    xpp, ypp, Cpp = ccd2hom(imagePoints, cameraMatrix, Cccd, Cf, dt)
     # undistort
-    xp, yp, Cp = homDist2homUndist(xpp, ypp, distCoeffs, model, Cpp, Ck)
+    xp, yp, Cp = homDist2homUndist(xpp, ypp, distCoeffs, model, Cpp, Ck,
+                                   dtype=dt)
     # project to plane z=0 from homogenous
-    xm, ym, Cm = xypToZplane(xp, yp, rV, tV, Cp, Crt)
+    xm, ym, Cm = xypToZplane(xp, yp, rV, tV, Cp, Crt, dt)
     return xm, ym, Cm
 
 
+# %% JOINT COVARIANCE
+def inverseJacobians(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
+                     dtype=None):
+    '''
+    same as inverse but returns the jacobians of xm, ym with respect to the
+    image point, Jm_i (n, 2, 2), and with respect to the parameters shared
+    by all points: Jm_f (n, 2, 4) wrt fx, fy, u, v, Jm_k (n, 2, nk) wrt the
+    distortion coefficients (the ones Ck refers to) and Jm_rt (n, 2, 6) wrt
+    rV, tV.
+    returns xm, ym, Jm_i, Jm_f, Jm_k, Jm_rt
+    '''
+    dt = float if dtype is None else dtype
+    imagePoints = asarray(imagePoints, dtype=dt)
+    cameraMatrix = asarray(cameraMatrix, dtype=dt)
+    xpp, ypp, _ = ccd2hom(imagePoints, cameraMatrix, dtype=dt)
+    Jd_i, Jd_k = ccd2homJacobian(imagePoints, cameraMatrix)
+    q, _, Jp_pp, Jp_k = homDist2homUndist_ratioJacobians(xpp, ypp,
+                                                         distCoeffs, model)
+    xp = xpp / q
+    yp = ypp / q
+    xm, ym, _ = xypToZplane(xp, yp, rV, tV, dtype=dt)
+    JXm_Xp, JXm_rtV = jacobianosHom2Map(xp, yp, rV, tV)
+    JXm_Xp = JXm_Xp.transpose((2, 0, 1))
+
+    # chain rule, all (n, 2, 2) products
+    JXm_Xpp = JXm_Xp @ Jp_pp
+    Jm_i = JXm_Xpp @ Jd_i.astype(dt)
+    Jm_f = JXm_Xpp @ Jd_k
+    Jm_k = JXm_Xp @ Jp_k
+    Jm_rt = JXm_rtV.transpose((2, 0, 1))
+
+    return xm, ym, Jm_i, Jm_f, Jm_k, Jm_rt
+
+
+def inverseJoint(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
+                 Cccd=False, Cf=False, Ck=False, Crt=False, dtype=None):
+    '''
+    inverse projection with the joint covariance of all the points in
+    factored form. the uncertainty in Cf, Ck and Crt is shared by every
+    point so the 2n x 2n covariance of the points is
+
+        block_diag(Cm) + Js Cs Js^T
+
+    Cm (n, 2, 2) comes only from Cccd (independent between points, False
+    if Cccd is not given), Js (n, 2, p) are the jacobians wrt the shared
+    parameters whose covariance was given (in the order f, k, rt) and Cs
+    (p, p) their covariance. the 2x2 blocks that inverse returns are
+    jointBlocks(Cm, Js, Cs). use linearCovariance for centroids, distances,
+    etc. without building the 2n x 2n matrix.
+    returns xm, ym, Cm, Js, Cs
+    '''
+    xm, ym, Jm_i, Jm_f, Jm_k, Jm_rt = inverseJacobians(
+        imagePoints, rV, tV, cameraMatrix, distCoeffs, model, dtype)
+
+    Cccdbool = anny(Cccd)
+    if Cccdbool and ndim(Cccd) == 0:  # isotropic
+        Cccd = Cccd * eye(2)
+    Cm = propagateCovariance(Jm_i, Cccd) if Cccdbool else False
+
+    Js = [J for J, C in zip([Jm_f, Jm_k, Jm_rt], [Cf, Ck, Crt]) if anny(C)]
+    Cs = [asarray(C, dtype=xm.dtype) for C in [Cf, Ck, Crt] if anny(C)]
+    p = sum(C.shape[0] for C in Cs)
+    Js = concatenate(Js, axis=2) if Js else zeros((xm.shape[0], 2, 0),
+                                                  dtype=xm.dtype)
+    CsJoint = zeros((p, p), dtype=xm.dtype)
+    i = 0
+    for C in Cs:
+        CsJoint[i:i + C.shape[0], i:i + C.shape[0]] = C
+        i += C.shape[0]
+
+    return xm, ym, Cm, Js, CsJoint
+
+
+def jointBlocks(Cm, Js, Cs):
+    '''
+    per point 2x2 covariance (the diagonal blocks of the joint covariance)
+    from the factored form of inverseJoint, equal to the Cm of inverse
+    '''
+    out = zeros((Js.shape[0], 2, 2), dtype=Js.dtype)
+    if anny(Cm):
+        out += Cm
+    return propagateCovariance(Js, Cs, out)
+
+
+def linearCovariance(A, Cm, Js, Cs):
+    '''
+    covariance (m, m) of m linear functionals of the points, y = A x with
+    A (m, n, 2) acting on the (n, 2) coords xm, ym, from the factored joint
+    covariance of inverseJoint. O(n m p + m p^2) instead of building the
+    2n x 2n matrix.
+    example, for the centroid of the points
+    A = ones((2, n, 2)) * eye(2)[:, None] / n
+    '''
+    A = asarray(A, dtype=Js.dtype)
+    B = einsum('mni,nip->mp', A, Js)  # the m functionals wrt the shared
+    Cy = B.dot(Cs).dot(B.T)
+    if anny(Cm):
+        Cy += einsum('ani,nij,bnj->ab', A, Cm, A, optimize=True)
+    return Cy
+
+
+# %% BATCHED PIPELINE
+def rodriguesBatch(rV):
+    '''
+    rotation matrices (S, 3, 3) of the rotation vectors rV (S, 3)
+    '''
+    rV = asarray(rV, dtype=float).reshape((-1, 3))
+    th = sqrt(einsum('si,si->s', rV, rV))
+    # sin(th)/th and (1-cos(th))/th^2, with the limit for small angles
+    chico = th < 1e-8
+    thSafe = where(chico, 1, th)
+    a = where(chico, 1 - th**2 / 6, sin(thSafe) / thSafe)
+    b = where(chico, 0.5 - th**2 / 24, (1 - cos(thSafe)) / thSafe**2)
+
+    K = zeros((rV.shape[0], 3, 3))
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = - rV[:, 2], rV[:, 1], - rV[:, 0]
+    K -= K.transpose((0, 2, 1))
+
+    return eye(3) + a[:, newaxis, newaxis] * K + \
+        b[:, newaxis, newaxis] * (K @ K)
+
+
+def ccd2homBatch(imagePoints, cameraMatrix):
+    '''
+    imagePoints (S, n, 2) to homogenous distorted xpp, ypp (S, n), with a
+    camera matrix (S, 3, 3) per sample
+    '''
+    fx, fy = cameraMatrix[:, 0, 0, newaxis], cameraMatrix[:, 1, 1, newaxis]
+    u, v = cameraMatrix[:, 0, 2, newaxis], cameraMatrix[:, 1, 2, newaxis]
+    return (imagePoints[..., 0] - u) / fx, (imagePoints[..., 1] - v) / fy
+
+
+def homDist2homUndistBatch(xpp, ypp, distCoeffs, k0, model, tol=1e-12,
+                           maxIter=20):
+    '''
+    undistorts xpp, ypp (S, n) with distortion coefficients distCoeffs
+    (S, nk) per sample. the exact solver with the nominal coefficients k0,
+    only on the mean radius of each point over the samples, gives the
+    starting point rp = rpp * rpMean / rppMean for a few Newton iterations
+    (vectorized over all samples and points) on the distortion with the
+    coefficients of each sample. points where it doesn't converge are nan
+    '''
+    rpp = sqrt(xpp**2 + ypp**2)
+    rppMean = rpp.mean(0)
+    rpMean, retVal = undistortRadius(undistort[model], rppMean,
+                                     asarray(k0, dtype=float).copy())
+    rp = rpp * where(retVal & (rppMean > 0), rpMean / rppMean, 1)
+    k = distCoeffs.T.reshape((distCoeffs.shape[1], -1, 1)).copy()
+
+    with errstate(divide='ignore', invalid='ignore'):
+        for i in range(maxIter):
+            q, dQdP, _ = distort[model](rp, k, quot=True, der=True)
+            q, dQdP = q.reshape(rp.shape), dQdP.reshape(rp.shape)
+            paso = (rp * q - rpp) / (q + rp * dQdP)
+            rp -= paso
+            if not anny(abs(paso) > tol * rp):
+                break
+
+        q = distort[model](rp, k, quot=True).reshape(rp.shape)
+        converge = (abs(rp * q - rpp) <= 1e3 * tol * maximum(rpp, 1)) & \
+            (rp >= 0)
+        q = where(converge & retVal, q, float('nan'))
+
+    return xpp / q, ypp / q
+
+
+def xypToZplaneBatch(xp, yp, R, tV):
+    '''
+    intersection with the z=0 plane of xp, yp (S, n) for a rotation matrix
+    R (S, 3, 3) and translation tV (S, 3) per sample, same as xypToZplane
+    '''
+    R = R[..., newaxis]
+    tV = tV[..., newaxis]
+    a = R[:, 0, 0] - R[:, 2, 0] * xp
+    b = R[:, 0, 1] - R[:, 2, 1] * xp
+    c = tV[:, 0] - tV[:, 2] * xp
+    d = R[:, 1, 0] - R[:, 2, 0] * yp
+    e = R[:, 1, 1] - R[:, 2, 1] * yp
+    f = tV[:, 1] - tV[:, 2] * yp
+    q = a*e - d*b
+
+    with errstate(divide='ignore', invalid='ignore'):
+        return (f*b - c*e) / q, (c*d - f*a) / q
+
+
+def inverseBatch(imagePoints, rV, tV, cameraMatrix, distCoeffs, k0, model):
+    '''
+    inverse for S samples at once: imagePoints (S, n, 2), rV, tV (S, 3),
+    cameraMatrix (S, 3, 3), distCoeffs (S, nk). k0 are the nominal
+    distortion coefficients, to start the undistortion.
+    returns xm, ym (S, n)
+    '''
+    xpp, ypp = ccd2homBatch(imagePoints, cameraMatrix)
+    xp, yp = homDist2homUndistBatch(xpp, ypp, distCoeffs, k0, model)
+    return xypToZplaneBatch(xp, yp, rodriguesBatch(rV), tV)
+
+
+# %% SIGMA POINTS
+# indices in distCoeffs of the coefficients that Ck refers to (rows of dQdK)
+kIndices = {
+    'stereographic': [0],
+    'unified': [0, 1],
+    'rational': [0, 1, 4, 5, 6, 7],
+    'poly': [0, 1, 4],
+    'fisheye': [0, 1, 2, 3]
+    }
+
+
+def inverseUnscented(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
+                     Cccd=False, Cf=False, Ck=False, Crt=False, alpha=1.0,
+                     beta=2.0, kappa=0.0, dtype=None):
+    '''
+    same as inverse but propagates the uncertainty with the unscented
+    transform instead of linearizing, returns the mean xm, ym and the
+    covariance Cm of the projection of each point. it captures the non
+    linearity of the distortion and of the projection to the plane, what
+    montecarlo does with hundreds of realizations, with 2 (2 + p) + 1
+    evaluations of the projection, p the number of shared parameters with
+    uncertainty (fx, fy, u, v; distortion; rV, tV).
+
+    the state of each point is (image point, shared params) and they are
+    independent, so the sigma points of all the image points are projected
+    together in one call and the 2p sigma points of the shared parameters
+    in another, with inverseBatch (every sigma point with its own camera
+    matrix, distortion and pose). if the distortion of a sigma point has no
+    inverse at some point, that point is nan.
+    alpha, beta, kappa are the parameters of the scaled unscented transform,
+    the default puts the sigma points at sqrt(2 + p) standard deviations
+    '''
+    dt = float if dtype is None else dtype
+    imagePoints = asarray(imagePoints, dtype=dt).reshape((-1, 2))
+    n = imagePoints.shape[0]
+    cameraMatrix = array(cameraMatrix, dtype=float)
+    k = array(distCoeffs, dtype=float).reshape(-1)
+    rtV = concatenate((asarray(rV, dtype=float).reshape(-1),
+                       asarray(tV, dtype=float).reshape(-1)))
+    iK = kIndices[model]
+
+    # shared parameters with uncertainty, stacked in one vector
+    parts = [(name, asarray(C, dtype=float)) for name, C in
+             [('f', Cf), ('k', Ck), ('rt', Crt)] if anny(C)]
+    p = sum(C.shape[0] for _, C in parts)
+    Cccdbool = anny(Cccd)
+    nState = 2 * Cccdbool + p
+    if nState == 0:
+        return inverse(imagePoints, rV, tV, cameraMatrix, k, model,
+                       dtype=dtype)
+
+    lam = alpha**2 * (nState + kappa) - nState
+    Wm0 = lam / (nState + lam)
+    Wc0 = Wm0 + 1 - alpha**2 + beta
+    Wi = 1 / (2 * (nState + lam))
+
+    # center and sigma points of the image points, in one call
+    sigmaI = [imagePoints]
+    if Cccdbool:
+        if ndim(Cccd) == 0:  # isotropic
+            Cccd = Cccd * eye(2)
+        Cccd = broadcast_to(asarray(Cccd, dtype=float), (n, 2, 2))
+        L = sqrtPSD((nState + lam) * Cccd)
+        for j in range(2):
+            sigmaI += [imagePoints + L[:, :, j], imagePoints - L[:, :, j]]
+    xm, ym, _ = inverse(concatenate(sigmaI), rtV[:3], rtV[3:],
+                        cameraMatrix, k, model, dtype=dtype)
+    Y = [[xm.reshape((-1, n))], [ym.reshape((-1, n))]]
+
+    # sigma points of the shared params, all in one batched call
+    if p > 0:
+        L = zeros((p, p))
+        i = 0
+        for name, C in parts:
+            L[i:i + C.shape[0], i:i + C.shape[0]] = sqrtPSD(
+                (nState + lam) * C)
+            i += C.shape[0]
+        D = concatenate((L.T, - L.T))  # (2p, p), one sigma point per row
+
+        K = zeros((2 * p, 3, 3)) + cameraMatrix
+        kS = zeros((2 * p, k.shape[0])) + k
+        rtS = zeros((2 * p, 6)) + rtV
+        i = 0
+        for name, C in parts:
+            col = D[:, i:i + C.shape[0]]
+            if name == 'f':
+                K[:, [0, 1, 0, 1], [0, 1, 2, 2]] += col
+            elif name == 'k':
+                kS[:, iK] += col
+            else:
+                rtS += col
+            i += C.shape[0]
+        xm, ym = inverseBatch(broadcast_to(imagePoints, (2 * p, n, 2)),
+                              rtS[:, :3], rtS[:, 3:], K, kS, k, model)
+        Y[0].append(xm.astype(dt))
+        Y[1].append(ym.astype(dt))
+
+    # weighted mean and covariance of the projected sigma points
+    Y = array([concatenate(Y[0]), concatenate(Y[1])]).transpose((1, 2, 0))
+    # Y is (2 nState + 1, n, 2)
+    W = full(Y.shape[0], Wi, dtype=Y.dtype)
+    W[0] = Wm0
+    mu = einsum('s,snj->nj', W, Y)
+    dY = Y - mu
+    W[0] = Wc0
+    Cm = einsum('s,sni,snj->nij', W, dY, dY)
+
+    return mu[:, 0], mu[:, 1], Cm
+
+
+# %% STREAMING
+def splitChunks(points, chunkSize, Cccd=False):
+    '''
+    splits points (n, 2) or (n, 3) in chunks of chunkSize points for
+    inverseStream or directStream, with the covariances Cccd if given: split
+    too if they are per point (n, 2, 2), the same for every chunk if they
+    are shared by all points ((2, 2) or a scalar, as inverse takes them).
+    the chunks are views so points can be a memmap of a long detection log
+    '''
+    for i in range(0, points.shape[0], chunkSize):
+        if not anny(Cccd):
+            yield points[i:i + chunkSize]
+        elif ndim(Cccd) > 2:
+            yield points[i:i + chunkSize], Cccd[i:i + chunkSize]
+        else:
+            yield points[i:i + chunkSize], Cccd
+
+
+def inverseStream(chunks, rV, tV, cameraMatrix, distCoeffs, model, Cf=False,
+                  Ck=False, Crt=False, dtype=None):
+    '''
+    inverse of an iterable of chunks of image points, each chunk is
+    imagePoints (n, 2) or a tuple (imagePoints, Cccd) with the covariances of
+    the chunk. yields xm, ym, Cm for every chunk, Cm is False if there is no
+    covariance. memory is bounded by the chunk size, not the whole stream.
+    the arrays of every chunk are new, they can be kept (list(stream) is
+    the whole result).
+
+    example:
+    for xm, ym, Cm in inverseStream(splitChunks(detections, 10000), rV, tV,
+                                    cameraMatrix, distCoeffs, model):
+        ...
+    '''
+    rV = array(rV, dtype=float).reshape(-1)  # own copies, not reshaped
+    tV = array(tV, dtype=float).reshape(-1)
+    cameraMatrix = array(cameraMatrix, dtype=float)
+    distCoeffs = array(distCoeffs, dtype=float).reshape(-1)
+
+    for chunk in chunks:
+        if isinstance(chunk, tuple):
+            imagePoints, Cccd = chunk
+        else:
+            imagePoints, Cccd = chunk, False
+
+        yield inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
+                      Cccd, Cf, Ck, Crt, dtype)
+
+
+def directStream(chunks, rVec, tVec, cameraMatrix, distCoeffs, model,
+                 dtype=None):
+    '''
+    direct projection of an iterable of chunks of object points (n, 3),
+    yields the image points (n, 2) of every chunk, new arrays as in
+    inverseStream
+    '''
+    dt = float if dtype is None else dtype
+    rVec = array(rVec, dtype=float).reshape(-1)
+    tVec = array(tVec, dtype=float).reshape(-1)
+    cameraMatrix = array(cameraMatrix, dtype=float)
+    distCoeffs = array(distCoeffs, dtype=float).reshape(-1)
+
+    for objectPoints in chunks:
+        # direct reshapes what it gets, give it a copy of the chunk
+        objectPoints = array(objectPoints, dtype=dt)
+        yield direct(objectPoints, rVec, tVec, cameraMatrix, distCoeffs,
+                     model, dtype=dtype)
+
+
 def residualInverse(params, objectPoints, imagePoints, model):
     switcher = {
         'stereographic': stereographic.residualInverse,
@@ -607,6 +1509,474 @@ def calibrateInverse(objectPoints, imagePoints, rVec, tVec, cameraMatrix,
                            distCoeffs)
 
 
+# %% ANALYTIC LEAST SQUARES
+def lsqPack(rVecs, tVecs, cameraMatrix, distCoeffs, model, intrinsic=False):
+    '''
+    flat parameter vector for calibrateInverseLsq: fx, fy, u, v and the
+    distortion coefficients in kIndices[model] if intrinsic, then rV, tV of
+    every image
+    '''
+    rt = concatenate((asarray(rVecs, dtype=float).reshape((-1, 3)),
+                      asarray(tVecs, dtype=float).reshape((-1, 3))), axis=1)
+    if not intrinsic:
+        return rt.reshape(-1)
+    f = asarray(cameraMatrix, dtype=float)[[0, 1, 0, 1], [0, 1, 2, 2]]
+    k = asarray(distCoeffs, dtype=float).reshape(-1)[kIndices[model]]
+    return concatenate((f, k, rt.reshape(-1)))
+
+
+def lsqUnpack(X, cameraMatrix, distCoeffs, model, intrinsic=False):
+    '''
+    inverse of lsqPack, the parameters not in X are taken from cameraMatrix
+    and distCoeffs (which are not modified).
+    returns rVecs (m, 3), tVecs (m, 3), cameraMatrix, distCoeffs
+    '''
+    cameraMatrix = array(cameraMatrix, dtype=float)
+    distCoeffs = array(distCoeffs, dtype=float)
+    if intrinsic:
+        iK = kIndices[model]
+        cameraMatrix[[0, 1, 0, 1], [0, 1, 2, 2]] = X[:4]
+        distCoeffs.reshape(-1)[iK] = X[4:4 + len(iK)]
+        X = X[4 + len(iK):]
+    rt = X.reshape((-1, 6))
+    return rt[:, :3], rt[:, 3:], cameraMatrix, distCoeffs
+
+
+def lsqResidual(X, objectPoints, imagePoints, cameraMatrix, distCoeffs,
+                model, intrinsic=False):
+    '''
+    residual in the map of the inverse projection with the flat parameters
+    X, imagePoints and objectPoints are (m, n, 2), one row per image.
+    the intrinsics are shared so all points are undistorted in one call and
+    then projected to the plane with the pose of each image.
+    returns the (m, n, 2) residual raveled
+    '''
+    rVecs, tVecs, K, k = lsqUnpack(X, cameraMatrix, distCoeffs, model,
+                                   intrinsic)
+    m, n = imagePoints.shape[:2]
+    xpp, ypp, _ = ccd2hom(imagePoints.reshape((-1, 2)), K)
+    xp, yp, _ = homDist2homUndist(xpp, ypp, k, model)
+    xp, yp = xp.reshape((m, n)), yp.reshape((m, n))
+
+    er = empty((m, n, 2))
+    for j in range(m):
+        xm, ym, _ = xypToZplane(xp[j], yp[j], rVecs[j], tVecs[j])
+        er[j, :, 0] = xm - objectPoints[j, :, 0]
+        er[j, :, 1] = ym - objectPoints[j, :, 1]
+
+    return er.reshape(-1)
+
+
+def lsqJacobian(X, objectPoints, imagePoints, cameraMatrix, distCoeffs,
+                model, intrinsic=False):
+    '''
+    analytic jacobian of lsqResidual wrt X, (2 m n, len(X)), from the chain
+    of ccd2homJacobian, homDist2homUndist_ratioJacobians and the JXm_rtV of
+    jacobianosHom2Map (see inverseJacobians). each image only depends on its
+    own rV, tV, the rest of those columns are zero
+    '''
+    rVecs, tVecs, K, k = lsqUnpack(X, cameraMatrix, distCoeffs, model,
+                                   intrinsic)
+    m, n = imagePoints.shape[:2]
+    nI = 4 + len(kIndices[model]) if intrinsic else 0
+
+    J = zeros((m, n, 2, X.shape[0]))
+    for j in range(m):
+        _, _, _, Jm_f, Jm_k, Jm_rt = inverseJacobians(
+            imagePoints[j], rVecs[j], tVecs[j], K, k, model)
+        if intrinsic:
+            J[j, :, :, :4] = Jm_f
+            J[j, :, :, 4:nI] = Jm_k
+        J[j, :, :, nI + 6 * j:nI + 6 * j + 6] = Jm_rt
+
+    return J.reshape((-1, X.shape[0]))
+
+
+def lsqPoints(objectPoints, imagePoints, m):
+    '''
+    imagePoints (m, n, 2) and the x, y of objectPoints broadcasted to
+    (m, n, 2), from objectPoints (n, 3) the same for all images (a
+    chessboard) or (m, n, 3)
+    '''
+    imagePoints = asarray(imagePoints, dtype=float).reshape((m, -1, 2))
+    n = imagePoints.shape[1]
+    objectPoints = asarray(objectPoints, dtype=float).reshape((-1, n, 3))
+    objectPoints = broadcast_to(objectPoints[:, :, :2], (m, n, 2))
+    return objectPoints, imagePoints
+
+
+def calibrateInverseLsq(objectPoints, imagePoints, rVecs, tVecs,
+                        cameraMatrix, distCoeffs, model, intrinsic=False,
+                        **kwargs):
+    '''
+    fits the poses rVecs, tVecs of m images (and fx, fy, u, v and the
+    distortion coefficients in kIndices[model] if intrinsic) minimizing the
+    error in the map of the inverse projection, as calibrateInverse but with
+    flat parameter vectors and analytic jacobians (lsqJacobian) instead of
+    lmfit's finite differences over Parameters.
+    imagePoints is (m, n, 2) or reshapeable, objectPoints (n, 3) if the
+    same for all images (a chessboard) or (m, n, 3).
+    kwargs go to scipy.optimize.least_squares, the default method is 'lm'
+    (MINPACK, as lmfit's leastsq).
+    returns rVecs, tVecs, cameraMatrix, distCoeffs and the result of
+    least_squares (nfev, njev, cost...)
+    '''
+    shapeR, shapeT = asarray(rVecs).shape, asarray(tVecs).shape
+    objectPoints, imagePoints = lsqPoints(objectPoints, imagePoints,
+                                          prod(shapeR) // 3)
+
+    X0 = lsqPack(rVecs, tVecs, cameraMatrix, distCoeffs, model, intrinsic)
+    args = (objectPoints, imagePoints, cameraMatrix, distCoeffs, model,
+            intrinsic)
+    kwargs.setdefault('method', 'lm')
+    res = least_squares(lsqResidual, X0, jac=lsqJacobian, args=args,
+                        **kwargs)
+
+    rVs, tVs, cameraMatrix, distCoeffs = lsqUnpack(res.x, cameraMatrix,
+                                                   distCoeffs, model,
+                                                   intrinsic)
+    return (rVs.reshape(shapeR), tVs.reshape(shapeT), cameraMatrix,
+            distCoeffs, res)
+
+
+# %% JOINT CALIBRATION
+def jointNormalBlocks(X, objectPoints, imagePoints, cameraMatrix,
+                      distCoeffs, model, Cccd=False):
+    '''
+    blocks of the gauss-newton normal equations J^T S J, J^T S e of the
+    joint calibration of the intrinsics and the poses of the m images (X as
+    in lsqPack with intrinsic=True). as every image depends only on the
+    shared intrinsics and its own pose the matrix is arrow shaped:
+
+        [U    W_1 ... W_m]
+        [W_1' V_1        ]
+        [...      ...    ]
+        [W_m'         V_m]
+
+    U (nI, nI) intrinsics, V (m, 6, 6) poses, W (m, nI, 6) cross terms, gI
+    (nI,) and gE (m, 6) the gradient. S are the inverse covariances in the
+    map (m, n, 2, 2) of the image points, propagated from Cccd ((m, n, 2, 2),
+    (2, 2) or scalar), None if Cccd is not given (unweighted).
+    returns cost, U, V, W, gI, gE, S
+    '''
+    rVecs, tVecs, K, k = lsqUnpack(X, cameraMatrix, distCoeffs, model, True)
+    m, n = imagePoints.shape[:2]
+    nI = X.shape[0] - 6 * m
+    Cccdbool = anny(Cccd)
+    if Cccdbool and ndim(Cccd) == 0:  # isotropic
+        Cccd = Cccd * eye(2)
+
+    U = zeros((nI, nI))
+    V = empty((m, 6, 6))
+    W = empty((m, nI, 6))
+    gI = zeros(nI)
+    gE = empty((m, 6))
+    S = empty((m, n, 2, 2)) if Cccdbool else None
+    cost = 0.0
+    for j in range(m):
+        xm, ym, Jm_i, Jm_f, Jm_k, Jm_rt = inverseJacobians(
+            imagePoints[j], rVecs[j], tVecs[j], K, k, model)
+        e = stack((xm, ym), axis=1) - objectPoints[j]
+        A = concatenate((Jm_f, Jm_k), axis=2)  # (n, 2, nI)
+
+        if Cccdbool:
+            Cm = propagateCovariance(Jm_i, Cccd[j] if ndim(Cccd) > 2
+                                     else Cccd)
+            inverse2x2(Cm, S[j])
+            SA, SB = S[j] @ A, S[j] @ Jm_rt
+            Se = (S[j] @ e[:, :, newaxis])[:, :, 0]
+        else:
+            SA, SB, Se = A, Jm_rt, e
+
+        cost += einsum('ni,ni->', e, Se) / 2
+        U += einsum('nip,niq->pq', A, SA)
+        V[j] = einsum('nip,niq->pq', Jm_rt, SB)
+        W[j] = einsum('nip,niq->pq', A, SB)
+        gI += einsum('nip,ni->p', A, Se)
+        gE[j] = einsum('nip,ni->p', Jm_rt, Se)
+
+    return cost, U, V, W, gI, gE, S
+
+
+def jointCost(X, objectPoints, imagePoints, cameraMatrix, distCoeffs, model,
+              S=None):
+    '''
+    cost of the joint calibration, half the sum of the squared errors in the
+    map weighted by S (see jointNormalBlocks)
+    '''
+    e = lsqResidual(X, objectPoints, imagePoints, cameraMatrix, distCoeffs,
+                    model, True).reshape(imagePoints.shape)
+    if S is None:
+        return einsum('mni,mni->', e, e) / 2
+    return einsum('mni,mnij,mnj->', e, S, e) / 2
+
+
+def schurSolve(U, V, W, gI, gE, lam=0.0):
+    '''
+    solves the (levenberg-marquardt damped by lam) normal equations with the
+    arrow shape of jointNormalBlocks for the step dX, eliminating the poses
+    with the schur complement: only 6x6 inversions for each image and one
+    nI x nI system for the intrinsics, O(m) instead of O(m^3)
+    '''
+    Vd = V.copy()
+    Vd[:, range(6), range(6)] *= 1 + lam
+    Ud = U + lam * diag(diag(U))
+    Vinv = linalg.inv(Vd)
+    WVinv = W @ Vinv  # (m, nI, 6)
+    Schur = Ud - einsum('mpk,mqk->pq', WVinv, W)
+    dI = linalg.solve(Schur, - gI + einsum('mpk,mk->p', WVinv, gE))
+    dE = - einsum('mkl,ml->mk', Vinv, gE + einsum('mpk,p->mk', W, dI))
+    return concatenate((dI, dE.reshape(-1)))
+
+
+def jointCovariance(U, V, W):
+    '''
+    full covariance of the parameters, the inverse of the arrow shaped
+    normal matrix from its blocks (see jointNormalBlocks), in the order of
+    lsqPack. with the schur complement Schur = U - sum W V^-1 W^T
+
+        C_II = Schur^-1
+        C_Ij = - C_II W_j V_j^-1
+        C_jk = delta_jk V_j^-1 + V_j^-1 W_j^T C_II W_k V_k^-1
+    '''
+    m, nI = W.shape[:2]
+    Vinv = linalg.inv(V)
+    WVinv = W @ Vinv
+    CII = inv(U - einsum('mpk,mqk->pq', WVinv, W))
+    CIE = - einsum('pq,mqk->pmk', CII, WVinv).reshape((nI, 6 * m))
+
+    C = empty((nI + 6 * m, nI + 6 * m))
+    C[:nI, :nI] = CII
+    C[:nI, nI:] = CIE
+    C[nI:, :nI] = CIE.T
+    C[nI:, nI:] = - WVinv.transpose((0, 2, 1)).reshape((6 * m, nI)).dot(CIE)
+    for j in range(m):
+        C[nI + 6 * j:nI + 6 * j + 6, nI + 6 * j:nI + 6 * j + 6] += Vinv[j]
+    return C
+
+
+jointMessages = {
+    -2: 'no step lowers the cost, the damping went over 1e10',
+    0: 'the maximum number of iterations was reached',
+    2: 'the relative change of the cost is under tol',
+    3: 'the relative step is under tol',
+    4: 'the relative change of the cost and the step are under tol'
+    }
+
+
+def calibrateJoint(objectPoints, imagePoints, rVecs, tVecs, cameraMatrix,
+                   distCoeffs, model, Cccd=False, maxIter=100, tol=1e-10,
+                   lam=1e-3):
+    '''
+    bundle adjustment style joint calibration of the intrinsics (fx, fy, u,
+    v and the distortion coefficients in kIndices[model]) and the poses of
+    all the images, minimizing the error in the map with levenberg-marquardt
+    on the arrow shaped normal equations (jointNormalBlocks, schurSolve).
+    the jacobian is never built whole and every iteration is O(m).
+    if Cccd (the covariance of the image points, (m, n, 2, 2), (2, 2) or a
+    scalar) is given the errors are weighted by the inverse of their
+    covariance in the map, recalculated at each iteration. if not the
+    variance of the errors is estimated from the residual.
+    points as in calibrateInverseLsq.
+    returns rVecs, tVecs, cameraMatrix, distCoeffs, C the full covariance
+    of the parameters (in the order of lsqPack, the cross terms between
+    intrinsics and poses included) and an OptimizeResult with x, cost, nit,
+    grad and, as in least_squares, success, message and status: 2 the cost
+    stopped changing, 3 the step did, 4 both (converged), 0 maxIter was
+    reached, -2 no step lowered the cost even with lam over 1e10
+    '''
+    shapeR, shapeT = asarray(rVecs).shape, asarray(tVecs).shape
+    m = prod(shapeR) // 3
+    objectPoints, imagePoints = lsqPoints(objectPoints, imagePoints, m)
+    X = lsqPack(rVecs, tVecs, cameraMatrix, distCoeffs, model, True)
+    args = (objectPoints, imagePoints, cameraMatrix, distCoeffs, model)
+
+    status = nit = 0
+    for nit in range(1, maxIter + 1):
+        _, U, V, W, gI, gE, S = jointNormalBlocks(X, *args, Cccd)
+        # same residual for both sides of the comparison, the one of
+        # inverseJacobians differs for points outside the range where the
+        # distortion can be inverted
+        cost = jointCost(X, *args, S)
+        # damp until the cost goes down
+        while lam < 1e10:
+            dX = schurSolve(U, V, W, gI, gE, lam)
+            newCost = jointCost(X + dX, *args, S)
+            if newCost < cost:
+                break
+            lam *= 10
+        else:
+            status = -2
+            break
+        X = X + dX
+        lam = maximum(lam / 10, 1e-12)
+        status = (2 * (cost - newCost <= tol * cost) +
+                  3 * (norm(dX) <= tol * (norm(X) + tol)))
+        if status:
+            status = min(status, 4)
+            break
+
+    cost, U, V, W, gI, gE, S = jointNormalBlocks(X, *args, Cccd)
+    C = jointCovariance(U, V, W)
+    if not anny(Cccd):  # variance of the errors from the residual
+        C *= 2 * cost / (imagePoints.size - X.shape[0])
+
+    rVs, tVs, cameraMatrix, distCoeffs = lsqUnpack(X, cameraMatrix,
+                                                   distCoeffs, model, True)
+    res = OptimizeResult(x=X, cost=cost, nit=nit, grad=concatenate(
+        (gI, gE.reshape(-1))), status=status, success=status > 0,
+        message=jointMessages[status])
+    return (rVs.reshape(shapeR), tVs.reshape(shapeT), cameraMatrix,
+            distCoeffs, C, res)
+
+
+# %% MULTI-START POSE
+def posesToZplane(xp, yp, X, jacobian=False):
+    '''
+    xypToZplane of the same points xp, yp (n,) with the m poses in X (m, 6),
+    rV and tV in each row, in one product. with jacobian=True also the
+    jacobian of xm, ym wrt each pose from jacobianosHom2MapPoints with the
+    poseTerms of all poses.
+    returns xm, ym (m, n) and JXm_rtV (m, n, 2, 6) or None
+    '''
+    H = rodriguesBatch(X[:, :3])
+    H[:, :, 2] = X[:, 3:]
+    Hinv = linalg.inv(H)
+    P = Hinv[:, :, :2] @ array([xp, yp]) + Hinv[:, :, 2:]
+    xm, ym = P[:, 0] / P[:, 2], P[:, 1] / P[:, 2]
+    if not jacobian:
+        return xm, ym, None
+
+    # pose terms (m, 1) against the points (n,)
+    terms = poseTerms(*X.T[:, :, newaxis])
+    JXm_rtV = jacobianosHom2MapPoints(xp, yp, terms)[1]
+    return xm, ym, JXm_rtV.transpose((2, 3, 0, 1))
+
+
+def multiStartNormal(X, xp, yp, objectPoints):
+    '''
+    cost (m,), gauss-newton matrix J^T J (m, 6, 6) and gradient J^T e (m, 6)
+    of each of the m poses in X
+    '''
+    xm, ym, J = posesToZplane(xp, yp, X, True)
+    e = stack((xm - objectPoints[:, 0], ym - objectPoints[:, 1]), axis=2)
+    cost = einsum('mni,mni->m', e, e) / 2
+    return cost, einsum('mnip,mniq->mpq', J, J), einsum('mnip,mni->mp', J, e)
+
+
+def multiStartLM(X, xp, yp, objectPoints, maxIter=100, tol=1e-10,
+                 lam=1e-3):
+    '''
+    levenberg-marquardt for the m poses in X (m, 6) at the same time, each
+    with its own damping: a step that lowers the cost is taken and the
+    damping lowered, if not the damping is raised and the step tried again
+    in the next iteration. a pose stops when the cost or the step stop
+    changing (relative to tol) or the damping goes over 1e10, only the ones
+    still going are evaluated.
+    returns the poses X, cost (m,), nit (m,) and the cost after each
+    iteration (m, maxIter + 1), nan after each pose stopped
+    '''
+    X = array(X, dtype=float)
+    m = X.shape[0]
+    lam = full(m, lam, dtype=float)
+    cost, A, g = multiStartNormal(X, xp, yp, objectPoints)
+    history = full((m, maxIter + 1), nan)
+    history[:, 0] = cost
+    nit = zeros(m, dtype=int)
+    going = isfinite(cost)
+
+    for it in range(1, maxIter + 1):
+        a = flatnonzero(going)
+        if a.size == 0:
+            break
+        Ad = A[a].copy()
+        Ad[:, range(6), range(6)] *= 1 + lam[a, newaxis]
+        dX = - linalg.solve(Ad, g[a, :, newaxis])[:, :, 0]
+        newCost, newA, newG = multiStartNormal(X[a] + dX, xp, yp,
+                                               objectPoints)
+        ok = newCost < cost[a]  # nan never
+        b = a[ok]
+        done = ((cost[b] - newCost[ok] <= tol * cost[b]) |
+                (norm(dX[ok], axis=1) <= tol * (norm(X[b], axis=1) + tol)))
+        X[b] += dX[ok]
+        cost[b], A[b], g[b] = newCost[ok], newA[ok], newG[ok]
+        lam[b] = maximum(lam[b] / 10, 1e-12)
+        lam[a[~ok]] *= 10
+
+        nit[a] = it
+        history[a, it] = cost[a]
+        going[b[done]] = False
+        going[lam > 1e10] = False
+
+    return X, cost, nit, history
+
+
+def poseBasins(X, cost, tol=1e-3):
+    '''
+    groups the final poses X (m, 6) of the starts in basins: in order of
+    increasing cost each pose not yet grouped starts a basin with all the
+    poses within tol (relative) of it.
+    returns the basin of each start (m,), the cost (nb,) and count (nb,) of
+    each basin, lowest cost first. starts whose cost is nan are -1
+    '''
+    basin = full(X.shape[0], -1, dtype=int)
+    basinCost, basinCount = list(), list()
+    for i in argsort(cost):
+        if basin[i] >= 0 or not isfinite(cost[i]):
+            continue
+        near = ((basin < 0) & isfinite(cost) &
+                (norm(X - X[i], axis=1) <= tol * (norm(X[i]) + tol)))
+        basin[near] = len(basinCost)
+        basinCost.append(cost[i])
+        basinCount.append(near.sum())
+    return basin, array(basinCost), array(basinCount, dtype=int)
+
+
+def calibratePoseMultiStart(objectPoints, imagePoints, rVecs, tVecs,
+                            cameraMatrix, distCoeffs, model, maxIter=100,
+                            tol=1e-10, lam=1e-3, basinTol=1e-3, pool=None,
+                            chunks=None):
+    '''
+    fits the pose of one image from the m starting poses rVecs, tVecs (m, 3)
+    minimizing the error in the map of the inverse projection, as
+    calibrateInverseLsq but with all the starts in one batched evaluation
+    (posesToZplane): the intrinsics are fixed so the points are undistorted
+    only once, the ones outside the range where the distortion can be
+    inverted are left out. each start is optimized with levenberg-marquardt
+    (multiStartLM) and stops on its own.
+    if pool (a multiprocessing Pool or anything with starmap) is given the
+    starts are split in chunks (the number of cpus by default) and each
+    chunk optimized in a process.
+    returns rVec, tVec of the lowest cost and an OptimizeResult with x, cost
+    of the best start and for all the starts xs (m, 6), costs, nit, history
+    (the cost after each iteration, see multiStartLM) and the basins they
+    end in (basin, basinCost, basinCount, see poseBasins)
+    '''
+    X0 = lsqPack(rVecs, tVecs, cameraMatrix, distCoeffs, model)
+    X0 = X0.reshape((-1, 6))
+    xpp, ypp, _ = ccd2hom(asarray(imagePoints, dtype=float).reshape((-1, 2)),
+                          cameraMatrix)
+    xp, yp, _ = homDist2homUndist(xpp, ypp, distCoeffs, model)
+    ok = isfinite(xp) & isfinite(yp)
+    objectPoints = asarray(objectPoints, dtype=float).reshape((-1, 3))
+    args = (xp[ok], yp[ok], objectPoints[ok, :2], maxIter, tol, lam)
+
+    if pool is None:
+        X, cost, nit, history = multiStartLM(X0, *args)
+    else:
+        parts = array_split(X0, chunks or cpu_count())
+        parts = pool.starmap(multiStartLM, [(p,) + args for p in parts
+                                            if p.shape[0]])
+        X, cost, nit, history = [concatenate(r) for r in zip(*parts)]
+
+    basin, basinCost, basinCount = poseBasins(X, cost, basinTol)
+    best = argsort(cost)[0]  # nan last
+    res = OptimizeResult(x=X[best], cost=cost[best], xs=X, costs=cost,
+                         nit=nit, history=history, basin=basin,
+                         basinCost=basinCost, basinCount=basinCount)
+    return X[best, :3], X[best, 3:], res
+
+
 # %% PLOTTING
 # plot corners and their projection
 def cornerComparison(img, corners1, corners2=None,
@@ -922,10 +2292,20 @@ def plotRationalDist(distCoeffs, imgSize, cameraMatrix):
 
 
 # %%
-fi = linspace(0, 2 * pi, 100)
-r = sqrt(chdtri(2, 0.1))  # radio para que 90% caigan adentro
-# r = 1
-Xcirc = array([cos(fi), sin(fi)]) * r
+def eig2x2(C):
+    '''
+    closed form eigen decomposition of symmetric 2x2 matrices C (..., 2, 2),
+    all at once. returns the eigenvalues l (..., 2), the biggest first, and
+    the angle th (...) of the eigenvector of the biggest one, the other is
+    at th + pi/2
+    '''
+    C = asarray(C)
+    a, b, c = C[..., 0, 0], C[..., 0, 1], C[..., 1, 1]
+    m = (a + c) / 2
+    d = sqrt(((a - c) / 2)**2 + b**2)
+    l = stack((m + d, m - d), axis=-1)
+    th = arctan2(2 * b, a - c) / 2
+    return l, th
 
 
 def unit2CovTransf(C):
@@ -935,37 +2315,79 @@ def unit2CovTransf(C):
     Xnorm = np.random.randn(2,n)  # generate random points in 2D
     T = unit2CovTransf(C)  # calculate transform matriz
     X = np.dot(T, Xnorm)  # points that follow normal pdf of cov C
+    C can also be (n, 2, 2), then T is (n, 2, 2)
     '''
-    l, v = eig(C)
+    l, th = eig2x2(C)
+    c, s = cos(th), sin(th)
+    # eigenvectors as columns, times sqrt of eigenvalues
+    v = stack((stack((c, -s), axis=-1), stack((s, c), axis=-1)), axis=-2)
 
     # matrix such that A.dot(A.T)==C
-    T =  sqrt(l.real) * v
+    T = sqrt(maximum(l, 0))[..., newaxis, :] * v
 
     return T
 
 
+def ellipseAxes(C, p=0.9):
+    '''
+    semi axes (n, 2), the major first, and angle of the major axis (n) of
+    the ellipses that contain probability p of the normal pdfs of
+    covariances C (n, 2, 2)
+    '''
+    l, th = eig2x2(C)
+    return sqrt(chdtri(2, 1 - p) * maximum(l, 0)), th
+
+
+def ellipsePolygons(C, mux, muy, p=0.9, nVertices=100):
+    '''
+    vertices (n, nVertices, 2) of the ellipses of probability p of
+    covariances C (n, 2, 2) centered in mux, muy, all at once
+    '''
+    fi = linspace(0, 2 * pi, nVertices)
+    circ = array([cos(fi), sin(fi)]) * sqrt(chdtri(2, 1 - p))
+    X = unit2CovTransf(C) @ circ  # (n, 2, nVertices)
+    X[:, 0] += asarray(mux).reshape((-1, 1))
+    X[:, 1] += asarray(muy).reshape((-1, 1))
+    return X.transpose((0, 2, 1))
+
+
+def insideEllipse(x, y, mux, muy, C, p=0.9):
+    '''
+    True for the points x, y that fall inside the ellipse of probability p
+    of the normal pdf centered in mux, muy with covariance C (n, 2, 2).
+    x, y can be (N, n), N samples for each of the n ellipses, the fraction
+    inside is insideEllipse(...).mean(0)
+    '''
+    dx = x - mux
+    dy = y - muy
+    a, b, c = C[..., 0, 0], C[..., 0, 1], C[..., 1, 1]
+    # mahalanobis distance with the inverse of C in closed form
+    d2 = (c * dx**2 - 2 * b * dx * dy + a * dy**2) / (a * c - b**2)
+    return d2 <= chdtri(2, 1 - p)
+
+
 def plotEllipse(ax, C, mux, muy, col):
     '''
     se grafica una elipse asociada a la covarianza c, centrada en mux, muy
     '''
-    
-    T = unit2CovTransf(C)
-    # roto reescaleo para lleve del circulo a la elipse
-    xeli, yeli = dot(T, Xcirc)
+    plotPointsUncert(ax, asarray(C).reshape((1, 2, 2)), [mux], [muy], col)
 
-    ax.plot(xeli+mux, yeli+muy, c=col, lw=0.5)
-    v1, v2 = r * T.T
-    ax.plot([mux, mux + v1[0]], [muy, muy + v1[1]], c=col, lw=0.5)
-    ax.plot([mux, mux + v2[0]], [muy, muy + v2[1]], c=col, lw=0.5)
 
-
-def plotPointsUncert(ax, C, mux, muy, col):
+def plotPointsUncert(ax, C, mux, muy, col, p=0.9):
     '''
-    se grafican los puntos centrados en mux, muy con covarianzas C (una lista)
+    se grafican los puntos centrados en mux, muy con covarianzas C (n, 2, 2),
+    las elipses que encierran probabilidad p y sus ejes, todas en una sola
+    coleccion
     '''
-    
-    for i in range(len(mux)):
-        plotEllipse(ax, C[i], mux[i], muy[i], col)
+    elipses = ellipsePolygons(C, mux, muy, p)
+    T = unit2CovTransf(C) * sqrt(chdtri(2, 1 - p))
+    centros = array([mux, muy], dtype=float).T.reshape((-1, 1, 2))
+    ejes = [centros + T[:, :, i].reshape((-1, 1, 2)) * [[0], [1]]
+            for i in range(2)]
+
+    ax.add_collection(LineCollection([*elipses, *ejes[0], *ejes[1]],
+                                     colors=col, lw=0.5))
+    ax.autoscale_view()
 
 
 # %% INRINSIC CALIBRATION
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+a calibrated camera as one object, built once from (model, cameraMatrix,
+distCoeffs, rVec, tVec). keeps its own copy of the parameters and the
+constants that calibrator recalculates on every call (rotation matrix,
+homography of the z=0 plane and its inverse, undistortion tables) so
+projecting many batches with the same camera doesn't repeat them.
+
+only has arrays and strings inside so it can be pickled and sent cheaply to
+worker processes, the undistortion function is not pickled and the tables
+are rebuilt (once) in each process from calibrator's cache
+
+@author: sebalander
+"""
+from numpy import array, asarray, sqrt, eye, errstate, ones_like, zeros
+from numpy import empty, einsum, where, newaxis
+from numpy import any as anny
+from numpy.linalg import inv
+from cv2 import Rodrigues
+from calibration import calibrator as cl
+
+
+class CameraModel:
+    '''
+    model: 'stereographic', 'unified', 'rational', 'poly' or 'fisheye'
+    rVec, tVec: pose of the camera, optional if only ccd <-> homogenous
+    mappings are needed
+    useTables: undistort with calibrator.tabulatedUndistort, rppMax (the
+    range of the table) by default is 1.5 times the rpp of the image corner
+    as seen from cameraMatrix.
+    inverseFit: a fit from calibrator.fitInverseDistortion (or
+    loadInverseFit), used instead of the tables or the exact solver if its
+    residual is under fitTolerance pixels
+
+    example:
+    cam = CameraModel('fisheye', cameraMatrix, distCoeffs, rV, tV)
+    xm, ym, Cm = cam.inverse(imagePoints, Cccd=Ci)
+    imagePoints = cam.direct(objectPoints)
+    imagePoints, Cccd = cam.directCovariance(objectPoints, Crt=Crt)
+    '''
+
+    def __init__(self, model, cameraMatrix, distCoeffs, rVec=None, tVec=None,
+                 useTables=False, rppMax=None, maxError=1e-8,
+                 inverseFit=None,
+                 fitTolerance=cl.inverseFitTolerance):
+        self.model = model
+        # own copies, the model functions reshape them
+        self.cameraMatrix = array(cameraMatrix, dtype=float)
+        self.distCoeffs = array(distCoeffs, dtype=float).reshape(-1)
+
+        self.useTables = useTables
+        self.maxError = maxError
+        if rppMax is None:
+            fx, fy = self.cameraMatrix[[0, 1], [0, 1]]
+            cx, cy = self.cameraMatrix[:2, 2]
+            rppMax = 1.5 * sqrt((cx / fx)**2 + (cy / fy)**2)
+        self.rppMax = rppMax
+        self.inverseFit = inverseFit
+        self.fitTolerance = fitTolerance
+        self.undistortFun = None  # built the first time it is needed
+
+        self.setPose(rVec, tVec)
+
+    def __getstate__(self):
+        # the undistortion function is a closure, each process builds its own
+        state = self.__dict__.copy()
+        state['undistortFun'] = None
+        return state
+
+    def setPose(self, rVec, tVec):
+        '''
+        sets the pose and recalculates the rotation matrix (and its jacobian
+        wrt rVec), the homographies and the terms of the jacobians of the
+        projection to the plane that only depend on the pose
+        '''
+        if rVec is None:
+            self.rVec = self.tVec = self.R = self.H = self.Hinv = None
+            self.dRdrV = self.poseTerms = None
+            return
+
+        self.rVec = array(rVec, dtype=float).reshape(-1)
+        self.tVec = array(tVec, dtype=float).reshape(-1)
+        if self.rVec.shape[0] == 9:  # it is a rotation matrix
+            self.rVec = Rodrigues(self.rVec.reshape((3, 3)))[0].reshape(-1)
+        self.R, dR = Rodrigues(self.rVec)
+        self.dRdrV = dR.reshape((3, 3, 3))  # [k, i, j] is dR[i, j] / drV[k]
+
+        # homography from the z=0 plane to homogenous undistorted coords
+        self.H = eye(3)
+        self.H[:, :2] = self.R[:, :2]
+        self.H[:, 2] = self.tVec
+        self.Hinv = inv(self.H)
+        self.poseTerms = cl.poseTerms(*self.rVec, *self.tVec)
+
+    def checkPose(self, what):
+        '''
+        ValueError if the pose was not given, what needs it
+        '''
+        if self.R is None:
+            raise ValueError('%s needs the pose of the camera, give rVec, '
+                             'tVec or call setPose first' % what)
+
+    # %% RADIAL DISTORTION
+    def radialUndistort(self):
+        '''
+        the undistortion function for this camera, fitted, tabulated or
+        exact, built once
+        '''
+        if self.undistortFun is not None:
+            return self.undistortFun
+
+        if (self.inverseFit is not None and
+                self.inverseFit['maxResidual'] < self.fitTolerance):
+            self.undistortFun = cl.fittedUndistort(self.inverseFit,
+                                                   self.fitTolerance)
+        elif self.useTables:
+            self.undistortFun = cl.tabulatedUndistort(
+                self.model, self.rppMax, self.maxError)
+        else:
+            self.undistortFun = cl.undistortExact[self.model]
+        return self.undistortFun
+
+    # %% DIRECT
+    def homUndist2ccd(self, xp, yp):
+        '''
+        distorts undistorted homogenous coords and projects to the ccd
+        '''
+        rp = sqrt(xp**2 + yp**2)
+        q = cl.distort[self.model](rp, self.distCoeffs, quot=True)
+
+        return cl.hom2ccd(xp * q, yp * q, self.cameraMatrix)
+
+    def direct(self, objectPoints):
+        '''
+        projects 3D points of the scene (n, 3) to the image
+        '''
+        self.checkPose('direct')
+        xyz = asarray(objectPoints, dtype=float).reshape((-1, 3))
+        xyz = xyz.dot(self.R.T) + self.tVec
+
+        return self.homUndist2ccd(xyz[:, 0] / xyz[:, 2],
+                                  xyz[:, 1] / xyz[:, 2])
+
+    def directCovariance(self, objectPoints, Cobj=False, Cf=False, Ck=False,
+                         Crt=False):
+        '''
+        direct with the covariance of the projected points, propagated
+        linearly from the covariance of the object points Cobj ((n, 3, 3) or
+        the same (3, 3) for all) and of the parameters Cf, Ck, Crt, as in
+        inverse.
+        returns imagePoints (n, 2) and Cccd (n, 2, 2), False if no
+        covariance is given
+        '''
+        self.checkPose('directCovariance')
+        X = asarray(objectPoints, dtype=float).reshape((-1, 3))
+        xyz = X.dot(self.R.T) + self.tVec
+        xp = xyz[:, 0] / xyz[:, 2]
+        yp = xyz[:, 1] / xyz[:, 2]
+        rp = sqrt(xp**2 + yp**2)
+        q, dQdP, dQdK = cl.distort[self.model](rp, self.distCoeffs.copy(),
+                                               quot=True, der=True)
+        xpp, ypp = xp * q, yp * q
+        imagePoints = cl.hom2ccd(xpp, ypp, self.cameraMatrix)
+
+        if not (anny(Cobj) or anny(Cf) or anny(Ck) or anny(Crt)):
+            return imagePoints, False
+
+        n = X.shape[0]
+        fx, fy = self.cameraMatrix[[0, 1], [0, 1]]
+        f = array([fx, fy])[:, newaxis]
+        Cccd = zeros((n, 2, 2))
+
+        if anny(Cobj) or anny(Crt):
+            # ccd wrt undistorted homogenous, dq/dxp = dQdP xp / rp
+            with errstate(divide='ignore', invalid='ignore'):
+                dQ = where(rp > 0, dQdP / rp, 0)
+            Jccd_p = empty((n, 2, 2))
+            Jccd_p[:, 0, 0] = q + xp * xp * dQ
+            Jccd_p[:, 0, 1] = Jccd_p[:, 1, 0] = xp * yp * dQ
+            Jccd_p[:, 1, 1] = q + yp * yp * dQ
+            Jccd_p *= f
+            # homogenous wrt the camera frame
+            Jp_xyz = zeros((n, 2, 3))
+            Jp_xyz[:, 0, 0] = Jp_xyz[:, 1, 1] = 1 / xyz[:, 2]
+            Jp_xyz[:, 0, 2] = - xp / xyz[:, 2]
+            Jp_xyz[:, 1, 2] = - yp / xyz[:, 2]
+            Jccd_xyz = Jccd_p @ Jp_xyz
+
+            if anny(Cobj):
+                cl.propagateCovariance(Jccd_xyz @ self.R, Cobj, Cccd)
+            if anny(Crt):
+                Jxyz_rt = zeros((n, 3, 6))
+                Jxyz_rt[:, :, :3] = einsum('kij,nj->nik', self.dRdrV, X)
+                Jxyz_rt[:, :, 3:] = eye(3)
+                cl.propagateCovariance(Jccd_xyz @ Jxyz_rt, Crt, Cccd)
+
+        if anny(Cf):
+            Jccd_f = zeros((n, 2, 4))
+            Jccd_f[:, 0, 0] = xpp
+            Jccd_f[:, 1, 1] = ypp
+            Jccd_f[:, 0, 2] = Jccd_f[:, 1, 3] = 1
+            cl.propagateCovariance(Jccd_f, Cf, Cccd)
+
+        if anny(Ck):
+            Jccd_k = array([xp, yp])[:, newaxis] * dQdK * f[:, :, newaxis]
+            cl.propagateCovariance(Jccd_k.transpose((2, 0, 1)), Ck, Cccd)
+
+        return imagePoints, Cccd
+
+    # %% INVERSE
+    def ccd2homUndist(self, imagePoints, Cccd=False, Cf=False, Ck=False):
+        '''
+        from the image to undistorted homogenous coords, with covariance Cp
+        if any covariance is given (as calibrator.ccd2hom and
+        calibrator.homDist2homUndist)
+        '''
+        imagePoints = asarray(imagePoints, dtype=float).reshape((-1, 2))
+        xpp, ypp, Cpp = cl.ccd2hom(imagePoints, self.cameraMatrix, Cccd, Cf)
+
+        return cl.homDist2homUndist(xpp, ypp, self.distCoeffs, self.model,
+                                    Cpp, Ck, self.radialUndistort())
+
+    def homUndist2map(self, xp, yp):
+        '''
+        intersection with the z=0 plane applying the inverse homography
+        '''
+        self.checkPose('homUndist2map')
+        X = self.Hinv.dot([xp, yp, ones_like(xp)])
+        with errstate(divide='ignore', invalid='ignore'):
+            return X[0] / X[2], X[1] / X[2]
+
+    def inverse(self, imagePoints, Cccd=False, Cf=False, Ck=False,
+                Crt=False):
+        '''
+        takes points in the image (n, 2) and returns coordinates xm, ym in
+        the z=0 plane and their covariance Cm (False if no covariance is
+        given), same as calibrator.inverse
+        '''
+        self.checkPose('inverse')
+        xp, yp, Cp = self.ccd2homUndist(imagePoints, Cccd, Cf, Ck)
+        xm, ym = self.homUndist2map(xp, yp)
+
+        if not (anny(Cp) or anny(Crt)):
+            return xm, ym, False
+
+        # jacobians with the pose terms of this camera
+        JXm_Xp, JXm_rtV = cl.jacobianosHom2MapPoints(xp, yp, self.poseTerms)
+        Cm = zeros((xm.shape[0], 2, 2))
+        if anny(Crt):
+            cl.propagateCovariance(JXm_rtV.transpose((2, 0, 1)), Crt, Cm)
+        if anny(Cp):
+            cl.propagateCovariance(JXm_Xp.transpose((2, 0, 1)), Cp, Cm)
+        return xm, ym, Cm
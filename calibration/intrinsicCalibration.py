@@ -34,6 +34,7 @@ distCoeffsFile =   imagesFolder + camera + model + "DistCoeffs.npy"
 linearCoeffsFile = imagesFolder + camera + model + "LinearCoeffs.npy"
 tVecsFile =        imagesFolder + camera + model + "Tvecs.npy"
 rVecsFile =        imagesFolder + camera + model + "Rvecs.npy"
+inverseFitFile =   cl.inverseFitFile(distCoeffsFile)
 
 # load data
 imgpoints = np.load(cornersFile)
@@ -122,4 +123,15 @@ if plotCorners:
 np.save(distCoeffsFile, D)
 np.save(linearCoeffsFile, K)
 np.save(tVecsFile, tVecs)
-np.save(rVecsFile, rVecs)
\ No newline at end of file
+np.save(rVecsFile, rVecs)
+
+# closed form approximate inverse, for the models that need a root finder
+if model in cl.fitOutputs:
+    inverseFit = cl.fitInverseDistortion(model, D, K)
+    print('inverse fit max residual %g pixels' % inverseFit['maxResidual'])
+    # saved anyway, with its residual, cl.useInverseFits only uses it if it
+    # is under the tolerance
+    cl.saveInverseFit(inverseFitFile, inverseFit)
+    if not inverseFit['maxResidual'] < cl.inverseFitTolerance:
+        print('over %g pixels, the exact inverse will be used' %
+              cl.inverseFitTolerance)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+montecarlo propagation of the uncertainty of the inverse projection, all
+the samples of the parameters (image points, fx, fy, u, v, distortion, rV,
+tV) evaluated as one array computation by chunks of samples instead of a
+loop calling calibrator once per sample (calibrator.inverseBatch, every
+sample has its own camera matrix, distortion coefficients and pose).
+
+the samples are drawn from seeded independent streams (see spawnSeeds) so
+a run can be split among processes, each returns a CovarianceAccumulator
+and they are merged to get the statistics of the whole run
+
+@author: sebalander
+"""
+from numpy import array, asarray, zeros, einsum, where
+from numpy import errstate, newaxis, isfinite, ndim, eye
+from numpy import any as anny
+from numpy import split, cumsum, log2
+from numpy.random import SeedSequence, default_rng
+from scipy.stats import qmc
+from scipy.special import ndtri
+from calibration import calibrator as cl
+
+
+# %% SAMPLING
+def spawnSeeds(seed, nStreams):
+    '''
+    independent seeds for nStreams workers from one seed, pass one to each
+    call of montecarloInverse and merge the accumulators they return
+    '''
+    return SeedSequence(seed).spawn(nStreams)
+
+
+class Sampler:
+    '''
+    source of the samples: method 'random' (pseudo random, error ~ 1/sqrt(N))
+    or the scrambled quasi random sequences 'sobol' and 'halton' (error close
+    to 1/N for smooth functions of few parameters). seed is anything
+    numpy.random.default_rng takes, it seeds the scrambling, so independent
+    seeds (spawnSeeds) give independent randomized replicas that can be
+    merged.
+    every call continues the same sequence, the number of dimensions is
+    fixed by the first call. sobol works best with powers of two samples.
+
+    example, gaussian samples of the parameters for an error survey:
+    X = Sampler('sobol', 0).gaussian(1024, X0, Cx)
+    '''
+
+    def __init__(self, method='random', seed=None):
+        self.method = method
+        self.rng = default_rng(seed)
+        self.engine = None
+
+    def uniform(self, nSamples, dim):
+        '''
+        samples (nSamples, dim) uniform in the unit cube
+        '''
+        if self.method == 'random':
+            return self.rng.random((nSamples, dim))
+        if self.engine is None:
+            engines = {'sobol': qmc.Sobol, 'halton': qmc.Halton}
+            self.engine = engines[self.method](dim, scramble=True,
+                                               seed=self.rng)
+        return self.engine.random(nSamples)
+
+    def normal(self, nSamples, dim):
+        '''
+        standard normal samples (nSamples, dim)
+        '''
+        if self.method == 'random':
+            return self.rng.standard_normal((nSamples, dim))
+        # away from 0 and 1 so that the inverse cdf is finite
+        u = self.uniform(nSamples, dim).clip(1e-16, 1 - 1e-16)
+        return ndtri(u)
+
+    def gaussian(self, nSamples, mean, C):
+        '''
+        samples (nSamples, d) normal with mean (d) and covariance C (d, d),
+        through a square root of C (calibrator.sqrtPSD, C can be singular)
+        '''
+        mean = asarray(mean, dtype=float).reshape(-1)
+        L = cl.sqrtPSD(C)
+        return mean + self.normal(nSamples, mean.shape[0]) @ L.T
+
+
+def sampleParameters(sampler, nSamples, imagePoints, rV, tV, cameraMatrix,
+                     distCoeffs, model, Cccd=False, Cf=False, Ck=False,
+                     Crt=False):
+    '''
+    draws nSamples of every parameter with uncertainty around the nominal
+    values, normal with the given covariances, from a Sampler. Cccd can be
+    (n, 2, 2), the same (2, 2) for all points or a scalar (isotropic), Ck
+    refers to calibrator.kIndices[model]. the covariances can be singular,
+    a parameter held fixed with zero variance.
+    with a quasi random sampler the image noise is the same draw for all the
+    points (the sequences don't go to 2n dimensions), which is fine for the
+    statistics of each point but correlates the points with each other.
+    returns imagePoints (S, n, 2), rV, tV (S, 3), cameraMatrix (S, 3, 3),
+    distCoeffs (S, nk)
+    '''
+    S, n = nSamples, imagePoints.shape[0]
+    iP = zeros((S, n, 2)) + imagePoints
+    K = zeros((S, 3, 3)) + cameraMatrix
+    k = zeros((S, distCoeffs.shape[0])) + distCoeffs
+    rt = zeros((S, 6))
+    rt[:, :3] += asarray(rV, dtype=float).reshape(-1)
+    rt[:, 3:] += asarray(tV, dtype=float).reshape(-1)
+
+    # one draw of all the shared parameters and the image noise
+    Cs = [asarray(C, dtype=float) if anny(C) else zeros((0, 0)) for C in
+          [Cf, Ck, Crt]]
+    dims = [2 * anny(Cccd)] + [C.shape[0] for C in Cs]
+    Z = sampler.normal(S, sum(dims))
+    Zi, Zf, Zk, Zrt = split(Z, cumsum(dims)[:-1], axis=1)
+
+    if anny(Cccd):
+        if ndim(Cccd) == 0:  # isotropic
+            Cccd = Cccd * eye(2)
+        L = cl.sqrtPSD(Cccd)
+        if sampler.method == 'random':
+            Zi = sampler.normal(S * n, 2).reshape((S, n, 2))
+        else:
+            Zi = Zi.reshape((S, 1, 2))
+        iP += (L @ Zi[..., newaxis])[..., 0]
+    if anny(Cf):
+        K[:, [0, 1, 0, 1], [0, 1, 2, 2]] += Zf @ cl.sqrtPSD(Cs[0]).T
+    if anny(Ck):
+        k[:, cl.kIndices[model]] += Zk @ cl.sqrtPSD(Cs[1]).T
+    if anny(Crt):
+        rt += Zrt @ cl.sqrtPSD(Cs[2]).T
+
+    return iP, rt[:, :3], rt[:, 3:], K, k
+
+
+# %% STREAMING STATISTICS
+class CovarianceAccumulator:
+    '''
+    online mean and 2x2 covariance of n points, fed with batches of samples
+    (S, n, 2) and merged with the accumulators of other workers, without
+    keeping the samples. parallel Welford (Chan et al.): every batch is
+    centered on its own mean and combined with the running one, so there is
+    no cancellation even with 1e5+ samples. samples with nan (a point that
+    falls behind the camera for some parameters) are not counted for that
+    point, the count is per point.
+    memory is O(n), it only has arrays so it can be pickled back from a
+    worker process.
+
+    example:
+    acc = CovarianceAccumulator(n)
+    for X in batches:
+        acc.update(X)
+    acc.merge(accOtherWorker)
+    mu, C = acc.mean, acc.covariance()
+    '''
+
+    def __init__(self, nPoints):
+        self.count = zeros(nPoints)
+        self.mean = zeros((nPoints, 2))
+        self.M2 = zeros((nPoints, 2, 2))  # sum of centered outer products
+
+    def combine(self, count, mean, M2):
+        '''
+        Chan's combination of the running statistics with those of another
+        set of samples
+        '''
+        n = self.count + count
+        with errstate(divide='ignore', invalid='ignore'):
+            w = where(n > 0, count / n, 0)
+        delta = mean - self.mean
+        self.mean += delta * w[:, newaxis]
+        self.M2 += M2 + einsum('ni,nj->nij', delta, delta) * \
+            (self.count * w)[:, newaxis, newaxis]
+        self.count = n
+
+    def update(self, X):
+        '''
+        adds a batch of samples X (S, n, 2)
+        '''
+        X = asarray(X, dtype=float)
+        valid = isfinite(X).all(2)
+        count = valid.sum(0)
+        X = where(valid[..., newaxis], X, 0)
+        with errstate(divide='ignore', invalid='ignore'):
+            mean = where(count[:, newaxis] > 0,
+                         X.sum(0) / count[:, newaxis], 0)
+        dX = where(valid[..., newaxis], X - mean, 0)
+        self.combine(count, mean, einsum('sni,snj->nij', dX, dX))
+
+    def merge(self, other):
+        '''
+        adds the samples of another accumulator (from another worker)
+        '''
+        self.combine(other.count, other.mean, other.M2)
+
+    def covariance(self):
+        '''
+        unbiased covariance (n, 2, 2), nan where there are less than two
+        samples
+        '''
+        with errstate(divide='ignore', invalid='ignore'):
+            return self.M2 / (self.count - 1)[:, newaxis, newaxis]
+
+
+# %% MONTECARLO
+def montecarloInverse(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
+                      Cccd=False, Cf=False, Ck=False, Crt=False,
+                      nSamples=1000, seed=None, chunkSize=2**18,
+                      method='random'):
+    '''
+    montecarlo of calibrator.inverse: draws nSamples of the parameters
+    (sampleParameters) and projects them by chunks of about chunkSize
+    samples x points, keeping only the running statistics per point in a
+    CovarianceAccumulator. memory doesn't grow with nSamples.
+    seed is anything numpy.random.default_rng takes, one of spawnSeeds for
+    independent streams. method is the one of Sampler, with 'sobol' (and
+    nSamples a power of two) it needs about ten times less samples for the
+    same error, see dev/benchmarkQMC.py
+
+    returns xm, ym (n), Cm (n, 2, 2), the mean and covariance of the
+    projected points, and the accumulator, to be merged with the ones of
+    other streams
+    '''
+    imagePoints = asarray(imagePoints, dtype=float).reshape((-1, 2))
+    cameraMatrix = asarray(cameraMatrix, dtype=float)
+    distCoeffs = asarray(distCoeffs, dtype=float).reshape(-1)
+    sampler = Sampler(method, seed)
+    n = imagePoints.shape[0]
+    # powers of two, so that the chunks keep the balance of sobol
+    S = 2**int(log2(max(1, chunkSize // n)))
+    acc = CovarianceAccumulator(n)
+
+    for i in range(0, nSamples, S):
+        params = sampleParameters(sampler, min(S, nSamples - i), imagePoints,
+                                  rV, tV, cameraMatrix, distCoeffs, model,
+                                  Cccd, Cf, Ck, Crt)
+        xm, ym = cl.inverseBatch(*params[:5], distCoeffs, model)
+        acc.update(array([xm, ym]).transpose((1, 2, 0)))
+
+    return acc.mean[:, 0], acc.mean[:, 1], acc.covariance(), acc
@@ -67,8 +67,12 @@ for model in modelos:
     linearCoeffsFile = imagesFolder + camera + model + "LinearCoeffs.npy"
     tVecsFile =        imagesFolder + camera + model + "Tvecs.npy"
     rVecsFile =        imagesFolder + camera + model + "Rvecs.npy"
-    # load model specific data
-    distCoeffs = np.load(distCoeffsFile)
+    # load model specific data, with the fitted inverse if there is one
+    distCoeffs, inverseFit = cl.loadDistCoeffs(distCoeffsFile)
+    if inverseFit is not None:
+        print('inverse fit max residual %g pixels' %
+              inverseFit['maxResidual'])
+        cl.useInverseFits([inverseFit])  # only if under the tolerance
     cameraMatrix = np.load(linearCoeffsFile)
     rVecs = np.load(rVecsFile)
     tVecs = np.load(tVecsFile)
@@ -154,7 +158,7 @@ for model in modelos:
     rpp1 = cl.distort[model](rp0, D[model])
     plt.plot(rp0, rpp1, '-',c=clr[model], lw=1, label=model+' direct')
     
-    rp1, _ = cl.undistort[model](rpp0, D[model])
+    rp1, _ = cl.undistortRadius(cl.undistort[model], rpp0, D[model])
     plt.plot(rp1, rpp0, '--',c=clr[model], lw=1, label=model+' inverse')
 
 
@@ -198,26 +202,6 @@ plt.legend()
 plt.tight_layout()
 
 
-# %%
-from scipy.special import chdtriv
-fi = np.linspace(0,2*np.pi,20)
-Xcirc = np.array([np.cos(fi), np.sin(fi)]) * chdtriv(0.1, 2)
-
-def plotEllipse(ax, c, mux, muy, col):
-    '''
-    se grafican una elipse asociada a la covarianza c, centrada en mux, muy
-    '''
-    
-    l, v = ln.eig(ln.inv(c))
-    
-    D = v.T*np.sqrt(l.real) # queda con los autovectores como filas
-    
-    xeli, yeli = np.dot(ln.inv(D), Xcirc)
-    
-    ax.plot(xeli+mux, yeli+muy, c=col, lw=0.5)
-
-#
-
 # %% comparo los errores proyectando sobre las imagenes
 from matplotlib.patches import Ellipse
 objectPoints = chessboardModel.reshape(-1,3)
@@ -252,9 +236,8 @@ for model in modelos:
     # covarianzas
     C = np.array([np.dot(EE, EE.T) for EE in E]) / x1.shape[0]
     
-    # calculo de la elipse a partir de la covarianza
-    for i in range(len(C)):
-        plotEllipse(ax, C[i], mux[i], muy[i], clr[model])
+    # elipses a partir de las covarianzas, todas juntas
+    cl.plotPointsUncert(ax, C, mux, muy, clr[model])
         
 
 plt.tight_layout()
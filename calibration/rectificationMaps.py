@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+dense rectification maps for cv2.remap built with the project's own
+distortion models, so that continuous video can be undistorted with one remap
+per frame instead of solving every pixel. also the per pixel map coordinates
+(and covariance) of a fixed camera, to map detections with a bilinear gather.
+maps are saved once as memory mapped .npy files named after the calibration,
+and loaded from there afterwards.
+
+imgSize is (width, height), as opencv wants it and as it is saved in the
+*Shape.npy files
+
+@author: sebalander
+"""
+from numpy import arange, sqrt, float32, asarray, errstate, isfinite
+from numpy.lib.format import open_memmap
+from numpy import load, array, zeros, tile, repeat, empty, floor, where
+from numpy import minimum, nan, clip
+from numpy import any as anny
+from hashlib import sha1
+from os import path, makedirs, replace
+from inspect import signature
+from cv2 import remap, INTER_LINEAR, BORDER_CONSTANT
+from calibration import calibrator as cl
+
+
+# %% MAPS
+def hom2ccdDistorted(xp, yp, cameraMatrix, distCoeffs, model):
+    '''
+    distorts undistorted homogenous coords and projects them to the ccd, is
+    the second half of calibrator.direct
+    '''
+    rp = sqrt(xp**2 + yp**2)
+    rp[rp == 0] = 1e-12  # the quotient is the limit at the center
+
+    with errstate(invalid='ignore', divide='ignore'):
+        q = cl.distort[model](rp, distCoeffs, quot=True)
+
+    return cl.hom2ccd(xp * q, yp * q, cameraMatrix)
+
+
+def undistortMaps(imgSize, cameraMatrix, distCoeffs, model,
+                  newCameraMatrix=None, out=None, blockRows=64):
+    '''
+    maps for cv2.remap from the undistorted pinhole image of camera matrix
+    newCameraMatrix (cameraMatrix if not given) and size imgSize to the
+    distorted image. goes by blocks of rows and writes in out if given (an
+    array of shape (2, rows, columns) that can be a memmap)
+
+    returns maps of shape (2, rows, columns) float32, maps[0] are the x and
+    maps[1] the y coords, as cv2.remap needs them
+    '''
+    if newCameraMatrix is None:
+        newCameraMatrix = cameraMatrix
+    w, h = imgSize[:2]
+
+    if out is None:
+        out = zeros((2, h, w), dtype=float32)
+
+    u = arange(w, dtype=float)
+    xp = (u - newCameraMatrix[0, 2]) / newCameraMatrix[0, 0]
+
+    for v0 in range(0, h, blockRows):
+        v = arange(v0, min(v0 + blockRows, h), dtype=float)
+        yp = (v - newCameraMatrix[1, 2]) / newCameraMatrix[1, 1]
+
+        ccd = hom2ccdDistorted(tile(xp, v.shape[0]), repeat(yp, w),
+                               cameraMatrix, distCoeffs, model)
+        ccd[~ isfinite(ccd)] = -1  # out of the image, remap leaves it black
+
+        out[:, v0:v0 + v.shape[0]] = ccd.T.reshape((2, v.shape[0], w))
+
+    return out
+
+
+def topViewSize(xLim, yLim, pixSize):
+    '''
+    size (rows, columns) of the top view image that covers xLim, yLim of the
+    z=0 plane with pixels of side pixSize
+    '''
+    w = int(round((xLim[1] - xLim[0]) / pixSize))
+    h = int(round((yLim[1] - yLim[0]) / pixSize))
+    return h, w
+
+
+def topViewMaps(rV, tV, cameraMatrix, distCoeffs, model, xLim, yLim,
+                pixSize, out=None, blockRows=64):
+    '''
+    maps for cv2.remap from a top view of the z=0 plane to the distorted
+    image. the top view covers xLim, yLim (map coords) with square pixels of
+    side pixSize, the first row is at yLim[1] so the map is not mirrored.
+    it is the inverse of xypToZplane, every pixel of the top view is mapped
+    to the image as calibrator.direct does. points behind the camera are
+    mapped out of the image.
+
+    returns maps of shape (2, rows, columns) float32
+    '''
+    h, w = topViewSize(xLim, yLim, pixSize)
+
+    if out is None:
+        out = zeros((2, h, w), dtype=float32)
+
+    rV = asarray(rV, dtype=float).reshape(-1)
+    tV = asarray(tV, dtype=float).reshape(-1)
+    xm = xLim[0] + (arange(w) + 0.5) * pixSize
+
+    for v0 in range(0, h, blockRows):
+        rows = min(blockRows, h - v0)
+        ym = yLim[1] - (arange(v0, v0 + rows) + 0.5) * pixSize
+
+        objectPoints = zeros((rows, w, 3))
+        objectPoints[:, :, 0] = xm.reshape((1, -1))
+        objectPoints[:, :, 1] = ym.reshape((-1, 1))
+
+        # to camera frame and homogenous coords
+        xyz = cl.rotoTrasRodri(objectPoints.reshape((-1, 3)), rV, tV)
+        xyz = xyz.reshape((-1, 3))  # a single point comes back as (3,)
+        delante = xyz[:, 2] > 0
+        with errstate(invalid='ignore', divide='ignore'):
+            xp = xyz[:, 0] / xyz[:, 2]
+            yp = xyz[:, 1] / xyz[:, 2]
+
+        ccd = hom2ccdDistorted(xp, yp, cameraMatrix, distCoeffs, model)
+        ccd[~ delante] = -1
+        ccd[~ isfinite(ccd)] = -1
+
+        out[:, v0:v0 + rows] = ccd.T.reshape((2, rows, w))
+
+    return out
+
+
+# %% GROUND PLANE GRID
+def groundPlaneChannels(Cccd=False, Cf=False, Ck=False, Crt=False):
+    '''
+    number of channels of the ground plane grid, xm, ym and if there is any
+    covariance the three independent elements of Cm
+    '''
+    hayCov = anny(Cccd) or anny(Cf) or anny(Ck) or anny(Crt)
+    return 5 if hayCov else 2
+
+
+def groundPlaneGrid(imgSize, rV, tV, cameraMatrix, distCoeffs, model,
+                    Cccd=False, Cf=False, Ck=False, Crt=False, out=None,
+                    blockRows=64):
+    '''
+    map coordinates xm, ym of the center of every pixel of the image for a
+    fixed camera, calculated with calibrator.inverse by blocks of rows.
+    Cccd is the covariance of one pixel (2x2, the same for all) and Cf, Ck,
+    Crt as in calibrator.inverse. if any covariance is given the grid also
+    keeps Cm[0,0], Cm[0,1], Cm[1,1]. pixels that see above the horizon, or
+    where the undistortion fails, are nan.
+
+    returns grid of shape (2 or 5, height, width) float32, to be used with
+    groundPlaneLookup
+    '''
+    w, h = imgSize[:2]
+    nCh = groundPlaneChannels(Cccd, Cf, Ck, Crt)
+
+    if out is None:
+        out = zeros((nCh, h, w), dtype=float32)
+
+    rV = asarray(rV, dtype=float).reshape(-1)
+    tV = asarray(tV, dtype=float).reshape(-1)
+    u = arange(w, dtype=float)
+
+    for v0 in range(0, h, blockRows):
+        rows = min(blockRows, h - v0)
+        v = arange(v0, v0 + rows, dtype=float)
+        imagePoints = array([tile(u, rows), repeat(v, w)]).T
+        CccdBlock = (array([Cccd] * imagePoints.shape[0]) if anny(Cccd)
+                     else False)
+
+        with errstate(invalid='ignore', divide='ignore'):
+            xm, ym, Cm = cl.inverse(imagePoints, rV, tV, cameraMatrix,
+                                    distCoeffs, model, CccdBlock, Cf, Ck, Crt)
+
+            # the point must be in front of the camera
+            xyz = cl.rotoTrasRodri(array([xm, ym, 0 * xm]).T, rV, tV)
+        xyz = xyz.reshape((-1, 3))  # a single point comes back as (3,)
+        detras = ~ (xyz[:, 2] > 0)
+
+        canales = [xm, ym]
+        if nCh == 5:
+            canales += [Cm[:, 0, 0], Cm[:, 0, 1], Cm[:, 1, 1]]
+
+        for i, c in enumerate(canales):
+            c[detras] = nan
+            out[i, v0:v0 + rows] = c.reshape((rows, w))
+
+    return out
+
+
+def groundPlaneLookup(grid, imagePoints):
+    '''
+    map coordinates of imagePoints (n, 2) with sub pixel precision by
+    bilinear interpolation of the precomputed grid, is an O(1) gather per
+    point instead of undistorting and intersecting. points out of the image
+    are nan.
+
+    returns xm, ym, Cm like calibrator.inverse (Cm is False if the grid has
+    no covariance)
+    '''
+    nCh, h, w = grid.shape
+    u = asarray(imagePoints[:, 0], dtype=float)
+    v = asarray(imagePoints[:, 1], dtype=float)
+
+    adentro = (0 <= u) & (u <= w - 1) & (0 <= v) & (v <= h - 1)
+    # a grid one pixel wide or high has no second neighbour, it repeats
+    u0 = clip(floor(where(adentro, u, 0)).astype(int), 0, max(w - 2, 0))
+    v0 = clip(floor(where(adentro, v, 0)).astype(int), 0, max(h - 2, 0))
+    u1 = minimum(u0 + 1, w - 1)
+    v1 = minimum(v0 + 1, h - 1)
+    du = u - u0
+    dv = v - v0
+
+    # the four neighbours weighted
+    vals = (grid[:, v0, u0] * ((1 - du) * (1 - dv)) +
+            grid[:, v0, u1] * (du * (1 - dv)) +
+            grid[:, v1, u0] * ((1 - du) * dv) +
+            grid[:, v1, u1] * (du * dv))
+    vals[:, ~ adentro] = nan
+
+    if nCh == 5:
+        Cm = empty((u.shape[0], 2, 2))
+        Cm[:, 0, 0] = vals[2]
+        Cm[:, 0, 1] = Cm[:, 1, 0] = vals[3]
+        Cm[:, 1, 1] = vals[4]
+    else:
+        Cm = False
+
+    return vals[0], vals[1], Cm
+
+
+# %% CACHE IN DISK
+def calibrationKey(*args):
+    '''
+    hash of all the calibration parameters and options, for the file name
+    '''
+    h = sha1()
+    for a in args:
+        if isinstance(a, str):
+            h.update(a.encode())
+        else:
+            a = asarray(a, dtype=float)
+            h.update(array(a.shape).tobytes())
+            h.update(a.tobytes())
+    return h.hexdigest()[:16]
+
+
+def cachedMaps(folder, kind, *args, **kwargs):
+    '''
+    returns the maps of kind 'undistort' (undistortMaps), 'topView'
+    (topViewMaps) or 'groundPlane' (groundPlaneGrid) for the given args as a
+    read only memmap. the first time they are calculated and written to a
+    .npy file in folder named after the calibration, then they are just
+    loaded from there.
+
+    example:
+    maps = cachedMaps(folder, 'undistort', imgSize, cameraMatrix,
+                      distCoeffs, model)
+    for frame in video:
+        rectified = rectify(frame, maps)
+
+    grid = cachedMaps(folder, 'groundPlane', imgSize, rV, tV, cameraMatrix,
+                      distCoeffs, model, Cccd=Cccd)
+    for detections in frames:
+        xm, ym, Cm = groundPlaneLookup(grid, detections)
+    '''
+    switcher = {
+        'undistort': undistortMaps,
+        'topView': topViewMaps,
+        'groundPlane': groundPlaneGrid
+        }
+    # the arguments by name, whether given by position or keyword
+    bound = signature(switcher[kind]).bind(*args, **kwargs)
+    bound.apply_defaults()
+    argumentos = bound.arguments
+
+    # all that changes the maps is part of the name, with the names so that
+    # the same array given as Cccd or as Crt is not confused
+    opciones = [x for n, a in argumentos.items()
+                if a is not None and n not in ['out', 'blockRows']
+                for x in (n, a)]
+    key = calibrationKey(kind, *opciones)
+    fileName = path.join(folder, kind + 'Maps' + key + '.npy')
+
+    if not path.isfile(fileName):
+        if kind == 'topView':
+            shape = (2,) + topViewSize(argumentos['xLim'], argumentos['yLim'],
+                                       argumentos['pixSize'])
+        else:
+            covs = [argumentos.get(n, False)
+                    for n in ['Cccd', 'Cf', 'Ck', 'Crt']]
+            nCh = groundPlaneChannels(*covs) if kind == 'groundPlane' else 2
+            imgSize = argumentos['imgSize']
+            shape = (nCh, int(imgSize[1]), int(imgSize[0]))
+
+        makedirs(folder, exist_ok=True)
+        # write to a temporary file first, so there is never half a map
+        tmpName = fileName[:-4] + 'Tmp.npy'
+        maps = open_memmap(tmpName, mode='w+', dtype=float32, shape=shape)
+        argumentos['out'] = maps
+        switcher[kind](*bound.args, **bound.kwargs)
+        maps.flush()
+        del maps, argumentos['out']
+        replace(tmpName, fileName)
+
+    return load(fileName, mmap_mode='r')
+
+
+def rectify(frame, maps, interpolation=INTER_LINEAR):
+    '''
+    rectifies one frame with maps from undistortMaps, topViewMaps or
+    cachedMaps
+    '''
+    return remap(frame, maps[0], maps[1], interpolation,
+                 borderMode=BORDER_CONSTANT)
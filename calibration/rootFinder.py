@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+vectorized solvers for the inverse of the radial distortion functions, all
+points are solved at once instead of calling roots() point by point
+
+@author: sebalander
+"""
+from numpy import asarray, zeros_like, full_like, abs, sign, roots, isreal
+from numpy import unique, concatenate, inf, array, isfinite, clip, minimum
+from numpy import maximum, errstate, arange
+
+
+def positiveExtrema(dPoly):
+    '''
+    real positive roots of the polynomial derivative dPoly (highest power
+    first, as numpy.roots), sorted. are the extrema of the distortion
+    function and are the same for every point so only one roots() call
+    '''
+    rExtrema = roots(dPoly)
+    rExtrema = rExtrema.real[isreal(rExtrema) & (0 <= rExtrema.real)]
+    return unique(rExtrema)  # sorted and without repetitions
+
+
+def safeNewton(fun, y, a, b, x0, xtol=1e-14, maxIter=100):
+    '''
+    solves fun(x)[0] = y for every point, fun returns the value and the
+    derivative. each point has a bracket [a, b] where fun is monotone and
+    that contains the solution. iterates newton from x0 and falls back to
+    bisection whenever the step leaves the bracket
+    '''
+    y, a, b = [asarray(v, dtype=float).copy() for v in (y, a, b)]
+    x = clip(asarray(x0, dtype=float), a, b)
+
+    # orientation of the function in the bracket, to keep it increasing
+    s = sign(fun(b)[0] - fun(a)[0])
+    s[s == 0] = 1
+
+    act = arange(y.shape[0])  # points still iterating
+    for i in range(maxIter):
+        if act.shape[0] == 0:
+            break
+        xa = x[act]
+        g, dg = fun(xa)
+        f = g - y[act]
+
+        # shrink the brackets
+        pos = f * s[act] > 0
+        b[act[pos]] = xa[pos]
+        a[act[~pos]] = xa[~pos]
+        aa = a[act]
+        bb = b[act]
+
+        with errstate(divide='ignore', invalid='ignore'):
+            xn = xa - f / dg
+        # bisection if newton goes out of the bracket
+        fuera = ~ ((aa <= xn) & (xn <= bb))
+        xn[fuera] = (aa[fuera] + bb[fuera]) / 2
+        xn[f == 0] = xa[f == 0]  # exact solution already
+
+        x[act] = xn
+        tol = xtol * maximum(abs(xn), 1)
+        listo = (abs(xn - xa) <= tol) | (bb - aa <= tol)
+        act = act[~listo]
+
+    return x
+
+
+def solveMonotoneSegments(fun, y, extrema, x0, leadSign):
+    '''
+    solves fun(x)[0] = y for the smallest non negative x, where fun(0) = 0.
+    extrema are the positive extrema of fun sorted, so that fun is monotone
+    between them. leadSign is the sign of fun at infinity.
+
+    returns x and retVal, False where there is no solution. in that case x is
+    the smallest positive extremum (or nan if there are none)
+    '''
+    y = asarray(y, dtype=float)
+    x = full_like(y, inf)
+    a = zeros_like(y)
+    b = full_like(y, inf)
+    retVal = zeros_like(y, dtype=bool)
+
+    ends = concatenate(([0.0], extrema, [inf]))
+    gEnds = concatenate(([fun(array([0.0]))[0][0]],
+                         fun(asarray(extrema, dtype=float))[0],
+                         [leadSign * inf]))
+
+    # first segment that contains the solution is the smallest root
+    for i in range(ends.shape[0] - 1):
+        enSeg = ((minimum(gEnds[i], gEnds[i+1]) <= y) &
+                 (y <= maximum(gEnds[i], gEnds[i+1])) & ~ retVal)
+        a[enSeg] = ends[i]
+        b[enSeg] = ends[i+1]
+        retVal |= enSeg
+
+    # finite upper bound for the last, unbounded segment
+    abierto = retVal & ~ isfinite(b)
+    if abierto.any():
+        bb = maximum(2 * a[abierto], maximum(abs(y[abierto]), 1))
+        for i in range(1100):
+            corto = leadSign * (fun(bb)[0] - y[abierto]) < 0
+            if not corto.any():
+                break
+            bb[corto] *= 2
+        b[abierto] = bb
+
+    x[retVal] = safeNewton(fun, y[retVal], a[retVal], b[retVal],
+                           asarray(x0, dtype=float)[retVal])
+
+    # no solution, assign the extremum
+    x[~retVal] = extrema[0] if extrema.shape[0] else float('nan')
+
+    return x, retVal
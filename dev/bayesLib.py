@@ -26,7 +26,11 @@ from numpy import any as anny
 
 import numdifftools as ndf
 
-from multiprocess import Process, Queue
+import os
+import atexit
+from hashlib import sha1
+from collections import OrderedDict
+from multiprocess import Pool, shared_memory
 # https://github.com/uqfoundation/multiprocess/tree/master/py3.6/examples
 
 # %% funcion error
@@ -89,6 +93,47 @@ def flat2ext(X):
     return rVecs, tVecs
 
 # %%
+def covImagen(Ci, j):
+    '''
+    covarianza de los puntos de la imagen j. Ci es (m, n, 2, 2) una por punto,
+    o (2, 2) o un escalar (varianza isotropica) si son iguales para todos los
+    puntos, asi no hace falta armar np.repeat([np.eye(2)], n*m)
+    '''
+    if Ci is None:
+        return False
+    if np.ndim(Ci) <= 2:
+        return Ci
+    return Ci[j]
+
+
+def covImagenes(Ci, nIm):
+    '''
+    covarianza de los puntos de las primeras nIm imagenes, (nIm, n, 2, 2) o
+    Ci si es la misma para todos los puntos, False si no hay
+    '''
+    if Ci is None:
+        return False
+    if np.ndim(Ci) <= 2:
+        return Ci
+    return np.asarray(Ci[:nIm])
+
+
+def errorMahalanobis(er, Cm):
+    '''
+    suma de las distancias de mahalanobis de los errores er (n, 2) con
+    covarianzas Cm (n, 2, 2) mas el termino de normalizacion log(det(Cm)).
+    la inversa y el determinante de 2x2 en forma cerrada, sin np.linalg
+    (cl.inverse2x2, cl.det2x2). si no hay Cm es el error cuadratico pelado
+    '''
+    if not anny(Cm):
+        return np.sum(er**2)
+    
+    S = cl.inverse2x2(Cm)
+    Er = np.einsum('ni,nij,nj->', er, S, er)
+    Er += np.sum(np.log(cl.det2x2(Cm)))  # sumo termino de normalizacion
+    
+    return Er
+
 
 def errorCuadraticoImagen(Xext, Xint, Ns, params, j):
     '''
@@ -101,146 +146,432 @@ def errorCuadraticoImagen(Xext, Xint, Ns, params, j):
     # saco los parametros auxiliares
     n, m, imagePoints, model, chessboardModel, Ci = params
     
-    try: # check if there is covariance for this image
-        Cov = Ci[j]
-    except:
-        Cov = None
-    
     # hago la proyeccion
     xm, ym, Cm = cl.inverse(imagePoints[j,0], rvec, tvec, cameraMatrix,
-                            distCoeffs, model, Cccd=Cov)
-    # print(Cm)
+                            distCoeffs, model, Cccd=covImagen(Ci, j))
     # error
     er = ([xm, ym] - chessboardModel[0,:,:2].T).T
     
-    Cmbool = anny(Cm)
-    
-    if Cmbool:
-        # devuelvo error cuadratico pesado por las covarianzas
-        S = np.linalg.inv(Cm)  # inverse of covariance matrix
-        # q1 = [np.sum(S[:, :, 0] * er.T, 1),  # fastest way I found to do product
-        #       np.sum(S[:, :, 1] * er.T, 1)]
-        
-        # distancia mahalanobis
-        Er = (er.reshape((-1,2,1)) * S * er.reshape((-1,1,2))).sum()
-        Er += np.log(np.linalg.det(Cm)).sum()  # sumo termino de normalizacion
-    else:
-        # error cuadratico pelado, escalar
-        Er = np.sum(er**2)
-    
-    return Er
-
+    # error cuadratico pesado por las covarianzas (si hay)
+    return errorMahalanobis(er, Cm)
 
 
 def errorCuadraticoInt(Xint, Ns, XextList, params):
     '''
     el error asociado a todas la imagenes, es para optimizar respecto a los
-    parametros intrinsecos
+    parametros intrinsecos. como los intrinsecos son los mismos para todas
+    las imagenes se pasa a homogeneas y se desdistorsiona una sola vez con
+    todos los puntos juntos, despues se proyecta al plano con cada pose
     '''
+    cameraMatrix, distCoeffs = flat2int(Xint, Ns)
+    n, m, imagePoints, model, chessboardModel, Ci = params
+    nIm = len(XextList)
+    
+    Cccd = covImagenes(Ci, nIm)
+    if np.ndim(Cccd) > 2:
+        Cccd = Cccd.reshape((-1, 2, 2))
+    
+    # todos los puntos de todas las imagenes juntos
+    imPts = np.reshape(imagePoints[:nIm, 0], (-1, 2)).astype(float)
+    xpp, ypp, Cpp = cl.ccd2hom(imPts, cameraMatrix, Cccd)
+    xp, yp, Cp = cl.homDist2homUndist(xpp, ypp, distCoeffs, model, Cpp)
+    xp, yp = np.reshape([xp, yp], (2, nIm, -1))
+    Cpbool = anny(Cp)
+    if Cpbool:
+        Cp = Cp.reshape((nIm, -1, 2, 2))
+    
     # error
     Er = 0
+    for j in range(nIm):
+        rvec, tvec = flat2ext(XextList[j])
+        xm, ym, Cm = cl.xypToZplane(xp[j], yp[j], rvec, tvec,
+                                    Cp[j] if Cpbool else False)
+        er = ([xm, ym] - chessboardModel[0,:,:2].T).T
+        Er += errorMahalanobis(er, Cm)
+    
+    return Er
+
+# %% gradiente y hessiano analiticos
+def jacobianosImagen(Xext, Xint, Ns, params, j):
+    '''
+    error en el mapa de la imagen j (n, 2), los pesos S (n, 2, 2) (inversa
+    de la covarianza en el mapa, None si no hay Ci) y los jacobianos
+    analiticos del error respecto a Xint (n, 2, Ns[-1]) y a Xext (n, 2, 6),
+    de calibrator.inverseJacobians
+    '''
+    cameraMatrix, distCoeffs = flat2int(Xint, Ns)
+    rvec, tvec = flat2ext(Xext)
+    n, m, imagePoints, model, chessboardModel, Ci = params
+    
+    xm, ym, Jm_i, Jm_f, Jm_k, Jm_rt = cl.inverseJacobians(
+        imagePoints[j,0], rvec, tvec, cameraMatrix, distCoeffs, model)
+    er = ([xm, ym] - chessboardModel[0,:,:2].T).T
     
+    # los coeficientes que no estan en kIndices no cambian el error
+    Jint = np.zeros((er.shape[0], 2, Ns[-1]))
+    Jint[:, :, :Ns[0]] = Jm_f
+    Jint[:, :, Ns[0] + np.array(cl.kIndices[model])] = Jm_k
+    
+    Cov = covImagen(Ci, j)
+    if anny(Cov):
+        if np.ndim(Cov) == 0:  # isotropica
+            Cov = Cov * np.eye(2)
+        S = cl.inverse2x2(cl.propagateCovariance(Jm_i, Cov))
+    else:
+        S = None
+    
+    return er, S, Jint, Jm_rt
+
+
+def gradHess(er, S, J):
+    '''
+    gradiente 2 J^T S er y hessiano de gauss-newton 2 J^T S J del error
+    cuadratico pesado con los pesos fijos, con J (n, 2, p)
+    '''
+    SJ = J if S is None else S @ J
+    return 2 * np.einsum('nip,ni->p', SJ, er), 2 * np.einsum('nip,niq->pq',
+                                                              J, SJ)
+
+
+def covMapa(Xext, Xint, Ns, params, j):
+    '''
+    covarianza en el mapa (n, 2, 2) de los puntos de la imagen j, la que
+    pesa el error en errorCuadraticoImagen
+    '''
+    cameraMatrix, distCoeffs = flat2int(Xint, Ns)
+    rvec, tvec = flat2ext(Xext)
+    n, m, imagePoints, model, chessboardModel, Ci = params
+    Cov = covImagen(Ci, j)
+    if np.ndim(Cov) == 0:  # isotropica
+        Cov = Cov * np.eye(2)
+    Jm_i = cl.inverseJacobians(imagePoints[j,0], rvec, tvec, cameraMatrix,
+                               distCoeffs, model)[2]
+    return cl.propagateCovariance(Jm_i, Cov)
+
+
+def gradPesos(Xext, Xint, Ns, params, j, er, S, intrinsecos=True):
+    '''
+    parte del gradiente de errorCuadraticoImagen que viene de que los pesos
+    S = Cm^-1 y log(det(Cm)) dependen de los parametros, tr(S dCm) -
+    er^T S dCm S er, respecto a Xint o a Xext. dCm necesita las derivadas
+    segundas de la proyeccion, se saca por diferencias centradas de la
+    covarianza analitica. no es un paso a ajustar: Cm es analitica y suave,
+    el paso h = eps^(1/3) max(1, |x|) es el que equilibra el error de
+    truncamiento O(h^2) con el de redondeo O(eps / h), asi dCm tiene error
+    relativo O(eps^(2/3)) ~ 1e-11. el gradiente completo coincide con el de
+    numdifftools a ~1e-11 relativo (poly, rational, fisheye)
+    '''
+    model = params[3]
+    if intrinsecos:
+        X = Xint
+        cuales = list(range(Ns[0])) + [Ns[0] + k for k in cl.kIndices[model]]
+    else:
+        X = Xext
+        cuales = range(6)
+    
+    Se = (S @ er[:, :, np.newaxis])[:, :, 0]
+    g = np.zeros(X.shape[0])
+    for p in cuales:
+        h = np.finfo(float).eps**(1/3) * max(1, abs(X[p]))
+        dC = list()
+        for signo in [1, -1]:
+            Xh = np.array(X, dtype=float)
+            Xh[p] += signo * h
+            if intrinsecos:
+                dC.append(covMapa(Xext, Xh, Ns, params, j))
+            else:
+                dC.append(covMapa(Xh, Xint, Ns, params, j))
+        dC = (dC[0] - dC[1]) / (2 * h)
+        g[p] = np.einsum('nij,nji->', S, dC)
+        g[p] -= np.einsum('ni,nij,nj->', Se, dC, Se)
+    
+    return g
+
+
+def gradHessImagen(Xext, Xint, Ns, params, j):
+    '''
+    gradiente (6,) y hessiano de gauss-newton 2 J^T S J (6, 6) de
+    errorCuadraticoImagen respecto a Xext. el gradiente es analitico, mas
+    la parte de los pesos (gradPesos) si hay Ci
+    '''
+    er, S, _, Jext = jacobianosImagen(Xext, Xint, Ns, params, j)
+    g, h = gradHess(er, S, Jext)
+    if S is not None:
+        g += gradPesos(Xext, Xint, Ns, params, j, er, S, False)
+    return g, h
+
+
+def gradHessInt(Xint, Ns, XextList, params):
+    '''
+    gradiente (Ns[-1],) y hessiano de gauss-newton (Ns[-1], Ns[-1]) de
+    errorCuadraticoInt respecto a Xint, ver gradHessImagen
+    '''
+    jInt = np.zeros(Ns[-1])
+    hInt = np.zeros((Ns[-1], Ns[-1]))
     for j in range(len(XextList)):
-        # print(j)
-        Er += errorCuadraticoImagen(XextList[j], Xint, Ns, params, j)
+        er, S, Jint, _ = jacobianosImagen(XextList[j], Xint, Ns, params, j)
+        g, h = gradHess(er, S, Jint)
+        if S is not None:
+            g += gradPesos(XextList[j], Xint, Ns, params, j, er, S)
+        jInt += g
+        hInt += h
     
-    return Er
+    return jInt, hInt
+
 
 # %% funciones para calcular jacobiano y hessiano in y externo
+# numericos, solo para verificar los analiticos (jacobianos(numerico=True))
 Jint = ndf.Jacobian(errorCuadraticoInt)  # (Ns,)
 Hint = ndf.Hessian(errorCuadraticoInt)  #  (Ns, Ns)
 Jext = ndf.Jacobian(errorCuadraticoImagen)  # (6,)
 Hext = ndf.Hessian(errorCuadraticoImagen)  # (6,6)
 
-# una funcion para cada hilo
-def procJint(Xint, Ns, XextList, params, ret):
-    ret.put(Jint(Xint, Ns, XextList, params))
-
-def procHint(Xint, Ns, XextList, params, ret):
-    ret.put(Hint(Xint, Ns, XextList, params))
-
-def procJext(Xext, Xint, Ns, params, j, ret):
-    ret.put(Jext(Xext, Xint, Ns, params, j))
 
-def procHext(Xext, Xint, Ns, params, j, ret):
-    ret.put(Hext(Xext, Xint, Ns, params, j))
-
-
-# %%
-def jacobianos(Xint, Ns, XextList, params, hessianos=True):
+# %% pool de procesos y datos en memoria compartida
+class ArrayCompartido:
     '''
-    funcion que calcula los jacobianos y hessianos de las variables intrinsecas
-    y extrinsecas. hace un hilo para cada cuenta
+    array publicado una sola vez en memoria compartida. lo que se manda a
+    los procesos es solo el nombre, la forma y el tipo, cada proceso se
+    adjunta al bloque la primera vez que lo usa y lo guarda en adjuntos.
+    cada proceso se queda adjunto a los ultimos maxAdjuntos bloques, los
+    mas viejos se sueltan
     '''
-    # donde guardar resultado de derivadas de params internos
-    jInt = Queue()
-    if hessianos:
-        hInt = Queue()
+    adjuntos = OrderedDict()  # en cada proceso, nombre -> (bloque, array)
+    maxAdjuntos = 12
     
-    # creo e inicializo los threads
-    if hessianos:
-        # print('cuentas intrinsecas, 2 processos')
-        pHInt = Process(target=procHint, args=(Xint, Ns, XextList,
-                                               params, hInt))
-        pHInt.start()
-    #else:
-        # print('cuentas intrinsecas, 1 processo')
+    def __init__(self, x):
+        x = np.ascontiguousarray(x)
+        bloque = shared_memory.SharedMemory(create=True,
+                                            size=max(x.nbytes, 1))
+        self.nombre, self.shape, self.dtype = bloque.name, x.shape, x.dtype
+        ArrayCompartido.adjuntos[self.nombre] = (bloque, np.ndarray(
+            x.shape, x.dtype, buffer=bloque.buf))
+        self.array()[...] = x
     
-    pJInt = Process(target=procJint, args=(Xint, Ns, XextList, params, jInt))
+    def __getstate__(self):
+        return self.nombre, self.shape, self.dtype
     
-    pJInt.start()  # inicio procesos
+    def __setstate__(self, estado):
+        self.nombre, self.shape, self.dtype = estado
     
-    # donde guardar resultados de jaco y hess externos
-    n = len(XextList)
-    jExt = np.zeros((n, 1, 6), dtype=float)
-    qJext = [Queue() for nn in range(n)]
+    def array(self):
+        adjuntos = ArrayCompartido.adjuntos
+        if self.nombre not in adjuntos:
+            bloque = shared_memory.SharedMemory(name=self.nombre)
+            adjuntos[self.nombre] = (bloque, np.ndarray(
+                self.shape, self.dtype, buffer=bloque.buf))
+            # en los procesos del pool se sueltan los que ya no se usan
+            while len(adjuntos) > ArrayCompartido.maxAdjuntos:
+                bloque = adjuntos.popitem(last=False)[1][0]
+                bloque.close()
+        adjuntos.move_to_end(self.nombre)
+        return adjuntos[self.nombre][1]
+    
+    def liberar(self):
+        bloque, _ = ArrayCompartido.adjuntos.pop(self.nombre)
+        bloque.close()
+        bloque.unlink()
 
-    if hessianos:
-        hExt = np.zeros((n, 6, 6), dtype=float)
-        qHext = [Queue() for nn in range(n)]
+
+class DatosCompartidos:
+    '''
+    handle liviano de params para mandar con cada tarea: imagePoints,
+    chessboardModel y Ci (si es un array) quedan en memoria compartida
+    '''
     
-    # lista de threads
-    proJ = list()
-    if hessianos:
-        proH = list()
-    
-    # creo e inicializo los threads
-    for i in range(n):
-        # print('starting par de processos ', i + 3)
-        pJ = Process(target=procJext, args=(XextList[i], Xint, Ns,
-                                            params, i, qJext[i]))
-        proJ.append(pJ)
-        
-        if hessianos:
-            pH = Process(target=procHext, args=(XextList[i], Xint, Ns,
-                                                params, i, qHext[i]))
-            proH.append(pH)
-        
-        pJ.start()  # inicio procesos
-        if hessianos:
-            pH.start()
-    
-    jInt = jInt.get()  # saco los resultados
-    if hessianos:
-        hInt = hInt.get()
+    def __init__(self, params):
+        n, m, imagePoints, model, chessboardModel, Ci = params
+        self.n, self.m, self.model = n, m, model
+        self.imagePoints = ArrayCompartido(imagePoints)
+        self.chessboardModel = ArrayCompartido(chessboardModel)
+        self.Ci = ArrayCompartido(Ci) if np.ndim(Ci) > 2 else Ci
     
-    for i in range(n):
-        jExt[i] = qJext[i].get()  # guardo resultados
-        if hessianos:
-            hExt[i] = qHext[i].get()
+    def params(self):
+        Ci = self.Ci.array() if isinstance(self.Ci, ArrayCompartido) \
+            else self.Ci
+        return [self.n, self.m, self.imagePoints.array(), self.model,
+                self.chessboardModel.array(), Ci]
     
+    def liberar(self):
+        for x in [self.imagePoints, self.chessboardModel, self.Ci]:
+            if isinstance(x, ArrayCompartido):
+                x.liberar()
+
+
+procesos = None  # el pool, se crea la primera vez que se usa
+publicados = OrderedDict()  # claveDatos(params) -> datos, el ultimo al final
+maxPublicados = 4
+
+
+def workerPool():
+    '''
+    pool de procesos, tantos como nucleos, que se crea una sola vez y se
+    reusa en cada llamada a jacobianos (no se paga el arranque de procesos
+    en cada paso de un optimizador)
+    '''
+    global procesos
+    if procesos is None:
+        procesos = Pool(os.cpu_count())
+    return procesos
+
+
+def claveDatos(params):
+    '''
+    hash del contenido de params (no de los objetos), asi si se cambia un
+    array en el lugar se vuelve a publicar
+    '''
+    h = sha1()
+    for x in params:
+        if isinstance(x, str):
+            h.update(x.encode())
+        else:
+            x = np.ascontiguousarray(np.nan if x is None else x)
+            h.update(str((x.shape, x.dtype.str)).encode())
+            h.update(x.tobytes())
+    return h.hexdigest()
+
+
+def publicarDatos(params):
+    '''
+    publica en memoria compartida los arrays de params una sola vez (mientras
+    no cambie su contenido) y devuelve el DatosCompartidos para las tareas.
+    quedan publicados los ultimos maxPublicados, los mas viejos se liberan
+    '''
+    clave = claveDatos(params)
+    if clave not in publicados:
+        publicados[clave] = DatosCompartidos(params)
+        while len(publicados) > maxPublicados:
+            publicados.popitem(last=False)[1].liberar()
+    publicados.move_to_end(clave)
+    return publicados[clave]
+
+
+def cerrarPool():
+    '''
+    termina el pool y libera la memoria compartida
+    '''
+    global procesos
+    if procesos is not None:
+        procesos.terminate()
+        procesos.join()
+        procesos = None
+    for datos in publicados.values():
+        datos.liberar()
+    publicados.clear()
+
+
+atexit.register(cerrarPool)
+
+
+def derivadaNumerica(tarea):
+    '''
+    lo que hace un proceso del pool, una de las derivadas con numdifftools.
+    tarea es (cual, j, Xint, Ns, XextList, datos), cual es 'Jint', 'Hint',
+    'Jext' o 'Hext' y j la imagen para las extrinsecas.
+    devuelve (cual, j, resultado)
+    '''
+    cual, j, Xint, Ns, XextList, datos = tarea
+    params = datos.params()
+    if cual == 'Jint':
+        return cual, j, Jint(Xint, Ns, XextList, params)
+    if cual == 'Hint':
+        return cual, j, Hint(Xint, Ns, XextList, params)
+    if cual == 'Jext':
+        return cual, j, Jext(XextList[j], Xint, Ns, params, j)
+    return cual, j, Hext(XextList[j], Xint, Ns, params, j)
+
+
+# %%
+def jacobianosAnaliticos(Xint, Ns, XextList, params, hessianos=True):
+    '''
+    lo mismo que jacobianos con las mismas formas de salida, calculando los
+    jacobianos de cada imagen una sola vez para los intrinsecos y los
+    extrinsecos (ver gradHessImagen)
+    '''
+    n = len(XextList)
+    jInt = np.zeros((1, Ns[-1]), dtype=float)
+    hInt = np.zeros((Ns[-1], Ns[-1]), dtype=float)
+    jExt = np.zeros((n, 1, 6), dtype=float)
+    hExt = np.zeros((n, 6, 6), dtype=float)
     
-    pJInt.join()  # espero a que todos terminen
+    for j in range(n):
+        er, S, Jint, Jext = jacobianosImagen(XextList[j], Xint, Ns, params, j)
+        g, h = gradHess(er, S, Jint)
+        jInt[0] += g
+        hInt += h
+        jExt[j, 0], hExt[j] = gradHess(er, S, Jext)
+        if S is not None:
+            jInt[0] += gradPesos(XextList[j], Xint, Ns, params, j, er, S)
+            jExt[j, 0] += gradPesos(XextList[j], Xint, Ns, params, j, er, S,
+                                    False)
     
     if hessianos:
-        pHInt.join()
+        return jInt, hInt, jExt, hExt
+    else:
+        return jInt, jExt
+
+
+def jacobianos(Xint, Ns, XextList, params, hessianos=True, numerico=False):
+    '''
+    funcion que calcula los jacobianos y hessianos de las variables intrinsecas
+    y extrinsecas. analiticos, los hessianos de gauss-newton (ver
+    gradHessImagen). con numerico=True los calcula con numdifftools, para
+    verificar, repartiendo las cuentas en el pool de procesos (workerPool)
+    con los datos en memoria compartida
+    '''
+    if not numerico:
+        return jacobianosAnaliticos(Xint, Ns, XextList, params, hessianos)
     
-    [p.join() for p in proJ]
+    datos = publicarDatos(params)
+    n = len(XextList)
+    cuales = ['Jint', 'Hint', 'Jext', 'Hext'] if hessianos else ['Jint',
+                                                                   'Jext']
+    # primero las intrinsecas que son las mas largas
+    tareas = [(cual, j, Xint, Ns, XextList, datos) for cual in cuales
+              for j in (range(n) if cual[1:] == 'ext' else [0])]
     
-    if hessianos:
-        [p.join() for p in proH]
+    jExt = np.zeros((n, 1, 6), dtype=float)
+    hExt = np.zeros((n, 6, 6), dtype=float)
+    for cual, j, ret in workerPool().imap_unordered(derivadaNumerica,
+                                                    tareas):
+        if cual == 'Jint':
+            jInt = ret
+        elif cual == 'Hint':
+            hInt = ret
+        elif cual == 'Jext':
+            jExt[j] = ret
+        else:
+            hExt[j] = ret
     
     if hessianos:
         return jInt, hInt, jExt, hExt
     else:
         return jInt, jExt
+
+
+# %%
+def calibracionConjunta(Xint, Ns, XextList, params):
+    '''
+    ajuste conjunto de los intrinsecos y de las poses de todas las imagenes
+    con calibrator.calibrateJoint (levenberg-marquardt con el complemento de
+    schur), en vez de tratar por separado Xint y cada Xext. pesa los errores
+    con las covarianzas Ci de params.
+    devuelve Xint, XextList optimos y la covarianza conjunta de todos los
+    parametros, con los terminos cruzados entre intrinsecos y extrinsecos,
+    en el orden fx, fy, u, v, distorsion (los de cl.kIndices[model]) y
+    rvec, tvec de cada imagen
+    '''
+    cameraMatrix, distCoeffs = flat2int(Xint, Ns)
+    n, m, imagePoints, model, chessboardModel, Ci = params
+    nIm = len(XextList)
+    rVecs, tVecs = np.array([flat2ext(Xext) for Xext in XextList]).transpose(
+        (1, 0, 2))
+    
+    rVecs, tVecs, cameraMatrix, distCoeffs, C, res = cl.calibrateJoint(
+        chessboardModel, imagePoints[:nIm, 0], rVecs, tVecs, cameraMatrix,
+        distCoeffs, model, Cccd=covImagenes(Ci, nIm))
+    
+    Xint = int2flat(cameraMatrix, distCoeffs)[0]
+    XextList = [ext2flat(rVecs[j], tVecs[j]) for j in range(nIm)]
+    
+    return Xint, XextList, C
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+tiempo y memoria pico de la propagacion de covarianza J C J^T, comparando
+los productos con broadcast en 5 dimensiones que se usaban en ccd2hom,
+homDist2homUndist y xypToZplane contra calibrator.propagateCovariance
+(einsum con el camino de contraccion precalculado), para C la misma para
+todos los puntos (como Ck, Crt) y una por punto (como Cccd, Cpp)
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+import tracemalloc
+from time import perf_counter
+from calibration import calibrator as cl
+
+Ns = [10**3, 10**4, 10**5, 10**6]
+ks = [4, 6, 8]
+memMax = 1.5 * 2**30  # el de broadcast no se corre si necesita mas memoria
+
+
+def broadcast5D(J, C):
+    '''
+    la propagacion como estaba, J (n, 2, k), C (k, k) o (n, k, k)
+    '''
+    k = J.shape[-1]
+    JResh = J.reshape((-1, 2, 1, k, 1))
+    return (JResh *
+            C.reshape((-1, 1, k, k, 1)) *
+            JResh.transpose((0, 4, 3, 2, 1))
+            ).sum((2, 3))
+
+
+def mide(fun, *args):
+    '''
+    tiempo y memoria pico (numpy reporta a tracemalloc) de una llamada
+    '''
+    tracemalloc.start()
+    t0 = perf_counter()
+    out = fun(*args)
+    t = perf_counter() - t0
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, t, pico
+
+
+# %% mido
+print('C      N        k   broadcast 5D          einsum              error')
+for porPunto in [False, True]:
+    for N in Ns:
+        for k in ks:
+            J = np.random.randn(N, 2, k)
+            A = np.random.randn(k, k)
+            C = A.dot(A.T)
+            if porPunto:
+                C = np.broadcast_to(C, (N, k, k)).copy()
+
+            cl.propagateCovariance(J[:10], C[:10] if porPunto else C)
+            Cnew, tNew, mNew = mide(cl.propagateCovariance, J, C)
+
+            if 2 * 8 * N * 2 * k * k * 2 < memMax:
+                Cold, tOld, mOld = mide(broadcast5D, J, C)
+                error = np.abs(Cold - Cnew).max() / np.abs(Cold).max()
+                viejo = '%7.4fs %8.1fMB' % (tOld, mOld / 2**20)
+            else:
+                error = np.nan
+                viejo = '   ---   no entra  '
+
+            print('%s %8d %2d  %s  %7.4fs %8.1fMB  %.0e' % (
+                'punto ' if porPunto else 'comun ', N, k, viejo, tNew,
+                mNew / 2**20, error))
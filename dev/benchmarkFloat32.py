@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+tiempo, memoria pico y error de calibrator.inverse y calibrator.direct en
+float32 respecto a float64, sobre la grilla de pixeles de una imagen full HD,
+para cada modelo calibrado de la camara. stereographic y unified no tienen
+calibracion guardada, van con coeficientes sinteticos y la matriz y la pose
+del fisheye, parecidos al fisheye cerca del centro
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+import tracemalloc
+from time import perf_counter
+from calibration import calibrator as cl
+
+# %% LOAD DATA
+camera = 'vcaWide'
+modelos = ['rational', 'poly', 'fisheye', 'stereographic', 'unified']
+# rpp = k tan(theta / 2) y (l + m) tan(theta / 2) para l = 1, ~theta al centro
+sinteticos = {'stereographic': np.array([2.0]),
+              'unified': np.array([0.8, 1.2])}
+w, h = 1920, 1080  # full HD
+
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+
+# grilla de pixeles, la camara se centra en la imagen full HD
+u, v = np.meshgrid(np.arange(w, dtype=float), np.arange(h, dtype=float))
+imagePoints = np.array([u.reshape(-1), v.reshape(-1)]).T
+Cccd = np.array([np.eye(2)] * imagePoints.shape[0]) * 0.25
+# en float32 las entradas ya vienen en float32
+entradas = {np.float64: (imagePoints, Cccd),
+            np.float32: (imagePoints.astype(np.float32),
+                         Cccd.astype(np.float32))}
+
+
+def mide(fun, *args, **kwargs):
+    '''
+    tiempo y memoria pico (numpy reporta a tracemalloc) de una llamada
+    '''
+    tracemalloc.start()
+    t0 = perf_counter()
+    out = fun(*args, **kwargs)
+    t = perf_counter() - t0
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, t, pico
+
+
+def errorRelativo(xm64, ym64, xm32, ym32, rV, tV):
+    '''
+    error de la posicion en el mapa relativo a la distancia a la camara, en
+    los puntos que estan delante de la camara. devuelve mediana, percentil
+    99.9 y maximo. cerca del horizonte del fisheye el modelo amplifica el
+    redondeo de los pixeles de entrada y el maximo crece
+    '''
+    xyz = cl.rotoTrasRodri(np.array([xm64, ym64, 0 * xm64]).T, rV.copy(),
+                           tV.copy())
+    delante = (xyz[:, 2] > 0) & np.isfinite(xyz).all(1)
+    e = np.hypot(xm64 - xm32, ym64 - ym32)[delante]
+    e /= np.linalg.norm(xyz[delante], axis=1)
+    return np.median(e), np.percentile(e, 99.9), np.max(e)
+
+
+# %% mido
+np.seterr(all='ignore')  # fuera de la imagen y detras de la camara hay nan
+print('%d x %d = %d puntos' % (w, h, imagePoints.shape[0]))
+print('error rel: mediana / percentil 99.9 / maximo')
+for model in modelos:
+    if model in sinteticos:
+        distCoeffs = sinteticos[model]
+        calib = 'fisheye'
+    else:
+        distCoeffs = np.load(imagesFolder + camera + model + "DistCoeffs.npy")
+        calib = model
+    cameraMatrix = np.load(imagesFolder + camera + calib + "LinearCoeffs.npy")
+    rV = np.load(imagesFolder + camera + calib + "Rvecs.npy")[0]
+    tV = np.load(imagesFolder + camera + calib + "Tvecs.npy")[0]
+    cameraMatrix = cameraMatrix.copy()
+    cameraMatrix[:2, 2] = [w / 2, h / 2]
+
+    print(model)
+    for conCov in [False, True]:
+        res = dict()
+        for dt in [np.float64, np.float32]:
+            iP, C = entradas[dt]
+            res[dt] = mide(cl.inverse, iP, rV, tV, cameraMatrix, distCoeffs,
+                           model, Cccd=C if conCov else False, dtype=dt)
+
+        (xm64, ym64, Cm64), t64, m64 = res[np.float64]
+        (xm32, ym32, Cm32), t32, m32 = res[np.float32]
+        error = errorRelativo(xm64, ym64, xm32, ym32, rV, tV)
+
+        print('  inverse %s  f64 %6.2fs %7.1fMB  f32 %6.2fs %7.1fMB  '
+              'error rel %.1e / %.1e / %.1e' % (
+                  'con Cccd' if conCov else 'sin cov ', t64, m64 / 2**20,
+                  t32, m32 / 2**20, *error))
+
+    # directa de los puntos del plano que se ven
+    objectPoints = np.array([xm64, ym64, 0 * xm64]).T
+    xyz = cl.rotoTrasRodri(objectPoints.copy(), rV.copy(), tV.copy())
+    objectPoints = objectPoints[(xyz[:, 2] > 0) & np.isfinite(xyz).all(1)]
+    res = dict()
+    for dt in [np.float64, np.float32]:
+        res[dt] = mide(cl.direct, objectPoints, rV, tV, cameraMatrix,
+                       distCoeffs, model, dtype=dt)
+    p64, t64, m64 = res[np.float64]
+    p32, t32, m32 = res[np.float32]
+    print('  direct            f64 %6.2fs %7.1fMB  f32 %6.2fs %7.1fMB  '
+          'error max %.1e pix' % (t64, m64 / 2**20, t32, m32 / 2**20,
+                                  np.nanmax(np.abs(p64 - p32))))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+tiempo del gradiente y hessiano de bayesLib.errorCuadraticoInt y
+errorCuadraticoImagen con numdifftools (bl.Jint, bl.Hint, bl.Jext, bl.Hext)
+y analiticos (bl.gradHessInt, bl.gradHessImagen, hessiano de gauss-newton).
+se reporta la diferencia relativa entre los gradientes y el error de los dos
+hessianos respecto a uno de referencia, por diferencias centradas del
+gradiente analitico. sin pesos y con Ci isotropico
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from dev import bayesLib as bl
+
+camera = 'vcaWide'
+modelos = ['fisheye', 'poly']
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+imagePoints = np.load(imagesFolder + camera + "Corners.npy")
+chessboardModel = np.load(imagesFolder + camera + "ChessPattern.npy")
+n = imagePoints.shape[0]  # cantidad de imagenes
+m = chessboardModel.shape[1]  # cantidad de puntos
+j = 0  # imagen para errorCuadraticoImagen
+
+
+def mide(fun, *args):
+    '''
+    resultado y tiempo de una llamada
+    '''
+    t0 = perf_counter()
+    ret = fun(*args)
+    return ret, perf_counter() - t0
+
+
+def difRel(a, b):
+    return np.max(np.abs(a - b)) / np.max(np.abs(b))
+
+
+def hessianoRef(grad, X, *args):
+    '''
+    hessiano por diferencias centradas del gradiente analitico grad
+    '''
+    H = np.zeros((X.shape[0], X.shape[0]))
+    for p in range(X.shape[0]):
+        h = 1e-6 * max(1, abs(X[p]))
+        g = list()
+        for signo in [1, -1]:
+            Xh = X.copy()
+            Xh[p] += signo * h
+            g.append(grad(Xh, *args)[0])
+        H[:, p] = (g[0] - g[1]) / (2 * h)
+    return H
+
+
+# %%
+for model in modelos:
+    distCoeffs = np.load(imagesFolder + camera + model + "DistCoeffs.npy")
+    cameraMatrix = np.load(imagesFolder + camera + model + "LinearCoeffs.npy")
+    rVecs = np.load(imagesFolder + camera + model + "Rvecs.npy")
+    tVecs = np.load(imagesFolder + camera + model + "Tvecs.npy")
+    Xint, Ns = bl.int2flat(cameraMatrix, distCoeffs)
+    XextList = [bl.ext2flat(rVecs[i], tVecs[i]) for i in range(n)]
+
+    for Ci in [None, 1.0]:
+        params = [n, m, imagePoints, model, chessboardModel, Ci]
+        argsInt = (Xint, Ns, XextList, params)
+        argsExt = (XextList[j], Xint, Ns, params, j)
+
+        jN, tJ = mide(bl.Jint, *argsInt)
+        hN, tH = mide(bl.Hint, *argsInt)
+        (jA, hA), tA = mide(bl.gradHessInt, *argsInt)
+        jeN, tJe = mide(bl.Jext, *argsExt)
+        heN, tHe = mide(bl.Hext, *argsExt)
+        (jeA, heA), tAe = mide(bl.gradHessImagen, *argsExt)
+
+        hRef = hessianoRef(bl.gradHessInt, *argsInt)
+        heRef = hessianoRef(bl.gradHessImagen, *argsExt)
+
+        print('%s, Ci %s' % (model, Ci))
+        print('               numdifftools  analitico  speedup  dif. '
+              'gradiente  error hessiano numdifftools / gauss-newton')
+        for nombre, tN, tA, g, gN, h, hN, hR in [
+                ('intrinseco', tJ + tH, tA, jA, jN, hA, hN, hRef),
+                ('extrinseco', tJe + tHe, tAe, jeA, jeN, heA, heN, heRef)]:
+            print('    %s %8.2fs  %9.3fs  %6.0fx  %.1e         %.1e / %.1e'
+                  % (nombre, tN, tA, tN / tA, difRel(g, gN.reshape(-1)),
+                     difRel(hN, hR), difRel(h, hR)))
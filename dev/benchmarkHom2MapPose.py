@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+throughput de calibrator.jacobianosHom2Map y de xypToZplane (con
+covarianza) para tamaños tipicos de lotes de detecciones de un frame, con
+la misma pose en todos los frames. se compara volviendo a calcular los
+terminos de la pose en cada llamada (vaciando el cache, como era antes) y
+reusandolos del cache
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from calibration import calibrator as cl
+
+camera = 'vcaWide'
+model = 'rational'
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+rV = np.load(imagesFolder + camera + model + "Rvecs.npy")[0].reshape(-1)
+tV = np.load(imagesFolder + camera + model + "Tvecs.npy")[0].reshape(-1)
+cachea = hasattr(cl, 'hom2MapPose')
+tamaños = [1, 10, 100, 1000, 10000]
+tiempoTotal = 0.5  # segundos por medicion
+
+
+def mide(fun, vaciar):
+    '''
+    puntos por segundo llamando fun repetidamente
+    '''
+    n, t0 = 0, perf_counter()
+    while perf_counter() - t0 < tiempoTotal:
+        if vaciar:
+            cl.hom2MapPose.cache_clear()
+        fun()
+        n += 1
+    return n / (perf_counter() - t0)
+
+
+# %% mido
+cl.xypToZplane(*np.ones((2, 10)), rV, tV, Cp=np.array([np.eye(2)] * 10))
+print('llamadas por segundo (puntos por segundo)')
+print('  n     jacobianos sin cache / con cache      xypToZplane sin cache / '
+      'con cache')
+for n in tamaños:
+    xp, yp = np.random.randn(2, n) * 0.3
+    Cp = np.array([np.eye(2)] * n) * 1e-6
+
+    res = list()
+    for fun in [lambda: cl.jacobianosHom2Map(xp, yp, rV, tV),
+                lambda: cl.xypToZplane(xp, yp, rV, tV, Cp=Cp)]:
+        for vaciar in [True, False]:
+            if vaciar or cachea:
+                res.append(mide(fun, vaciar and cachea))
+            else:
+                res.append(np.nan)
+    print('%6d  %9.0f (%8.2e) / %9.0f (%8.2e)   %9.0f (%8.2e) / %9.0f '
+          '(%8.2e)' % (n, *[v for r in res for v in (r, r * n)]))
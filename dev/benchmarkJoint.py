@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+calibracion conjunta de intrinsecos y poses de todas las imagenes con
+calibrator.calibrateJoint (complemento de schur sobre la matriz normal con
+forma de flecha) comparada con calibrateInverseLsq (jacobiano denso). se
+mide el tiempo, se verifica la covarianza contra la inversa densa de
+J^T S J y se compara la incerteza conjunta con la que se obtiene tratando
+intrinsecos y cada pose por separado, como hacia dev/bayesLib (sin los
+terminos cruzados)
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from calibration import calibrator as cl
+
+camera = 'vcaWide'
+modelos = ['rational', 'poly', 'fisheye']
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+imagePoints = np.load(imagesFolder + camera + "Corners.npy")
+chessboardModel = np.load(imagesFolder + camera + "ChessPattern.npy")
+m = imagePoints.shape[0]
+Cccd = 1.0  # varianza isotropica de las esquinas, en pixeles^2
+
+# %%
+print('%d imagenes de %d puntos' % (m, chessboardModel.shape[1]))
+for model in modelos:
+    distCoeffs = np.load(imagesFolder + camera + model + "DistCoeffs.npy")
+    cameraMatrix = np.load(imagesFolder + camera + model + "LinearCoeffs.npy")
+    rVecs = np.load(imagesFolder + camera + model + "Rvecs.npy")
+    tVecs = np.load(imagesFolder + camera + model + "Tvecs.npy")
+    args = (chessboardModel, imagePoints, rVecs, tVecs, cameraMatrix,
+            distCoeffs, model)
+
+    t0 = perf_counter()
+    ret = cl.calibrateInverseLsq(*args, intrinsic=True)
+    tDenso = perf_counter() - t0
+
+    t0 = perf_counter()
+    rV, tV, K, k, C, res = cl.calibrateJoint(*args, Cccd=Cccd)
+    tSchur = perf_counter() - t0
+
+    # inversa densa de la matriz normal en el optimo
+    objectPoints, imPts = cl.lsqPoints(chessboardModel, imagePoints, m)
+    lsqArgs = (objectPoints, imPts, cameraMatrix, distCoeffs, model)
+    S = cl.jointNormalBlocks(res.x, *lsqArgs, Cccd)[-1]
+    J = cl.lsqJacobian(res.x, *lsqArgs, True).reshape(S.shape[:3] +
+                                                      (res.x.shape[0],))
+    Cdensa = np.linalg.inv(np.einsum('mnip,mnij,mnjq->pq', J, S, J))
+    eC = np.max(np.abs(C - Cdensa)) / np.max(np.abs(Cdensa))
+
+    # incerteza por separado, sin los terminos cruzados
+    _, U, V, W, _, _, _ = cl.jointNormalBlocks(res.x, *lsqArgs, Cccd)
+    nI = U.shape[0]
+    sI = np.sqrt(np.diag(np.linalg.inv(U)))
+    sE = np.sqrt(np.diagonal(np.linalg.inv(V), axis1=1, axis2=2)).reshape(-1)
+    s = np.sqrt(np.diag(C))
+    corr = C[:nI, nI:] / s[:nI, np.newaxis] / s[np.newaxis, nI:]
+
+    print('%s, %d parametros' % (model, res.x.shape[0]))
+    print('    denso  %6.2fs  %3d jacobianos  costo %.4e' % (
+        tDenso, ret[4].njev, ret[4].cost))
+    print('    schur  %6.2fs  %3d iteraciones costo %.4e (pesado)' % (
+        tSchur, res.nit, res.cost))
+    print('    status %d: %s' % (res.status, res.message))
+    print('    covarianza vs inversa densa, error relativo %.1e' % eC)
+    print('    desvio conjunto / por separado: intrinsecos %s' %
+          np.array2string(s[:nI] / sI, precision=1))
+    print('    poses, mediana %.1f maximo %.1f' % (
+        np.median(s[nI:] / sE), np.max(s[nI:] / sE)))
+    print('    maxima correlacion intrinseco-extrinseco %.2f' %
+          np.max(np.abs(corr)))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+compara el ajuste por cuadrados minimos del error en el mapa con lmfit
+(jacobiano por diferencias finitas sobre Parameters, armados con
+calibrator.formatParameters / retrieveParameters) y con
+calibrator.calibrateInverseLsq (vectores planos y jacobiano analitico),
+ambos con levenberg-marquardt de MINPACK. en los datos de
+resources/intrinsicCalib:
+- extrinseco: la pose de cada imagen por separado
+- intrinseco: fx, fy, u, v, distorsion y las poses de nIm imagenes juntas
+se reportan evaluaciones de la funcion, jacobianos, tiempo y costo final
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from lmfit import minimize, Parameters
+from calibration import calibrator as cl
+
+camaras = ['vcaWide', 'vca', 'ptz']
+modelos = ['rational', 'poly', 'fisheye']
+nIm = 8  # imagenes para el intrinseco
+
+
+def residualLmfit(params, objectPoints, imagePoints, model):
+    '''
+    error en el mapa de una imagen, como hacia calibrateInverse
+    '''
+    rV, tV, cameraMatrix, distCoeffs = cl.retrieveParameters(params, model)
+    xm, ym, _ = cl.inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs,
+                           model)
+    return np.concatenate([xm - objectPoints[:, 0], ym - objectPoints[:, 1]])
+
+
+def residualPlano(params, *args):
+    '''
+    para el intrinseco, lmfit con el vector plano de calibrateInverseLsq
+    '''
+    X = np.array([params['x%d' % i].value for i in range(len(params))])
+    return cl.lsqResidual(X, *args)
+
+
+def costo(e):
+    return np.sum(np.square(e)) / 2
+
+
+def fuera(X, objectPoints, imagePoints, cameraMatrix, distCoeffs, model,
+          intrinsic):
+    '''
+    cantidad de puntos fuera del rango en que la distorsion es invertible,
+    ahi el residuo deja de ser suave y los dos ajustes pueden terminar en
+    lugares distintos
+    '''
+    _, _, K, k = cl.lsqUnpack(X, cameraMatrix, distCoeffs, model, intrinsic)
+    xpp, ypp, _ = cl.ccd2hom(imagePoints.reshape((-1, 2)), K)
+    ret = cl.undistortRadius(cl.undistort[model], np.hypot(xpp, ypp), k)[1]
+    return np.sum(~np.asarray(ret, dtype=bool))
+
+
+# %%
+for camera in camaras:
+    imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+    try:
+        imagePoints = np.load(imagesFolder + camera + "Corners.npy")
+        chessboardModel = np.load(imagesFolder + camera + "ChessPattern.npy")
+    except FileNotFoundError:
+        continue
+    m = imagePoints.shape[0]
+    n = chessboardModel.shape[1]
+    objectPoints = chessboardModel.reshape((n, 3))
+
+    for model in modelos:
+        try:
+            distCoeffs = np.load(imagesFolder + camera + model +
+                                 "DistCoeffs.npy")
+            cameraMatrix = np.load(imagesFolder + camera + model +
+                                   "LinearCoeffs.npy")
+            rVecs = np.load(imagesFolder + camera + model + "Rvecs.npy")
+            tVecs = np.load(imagesFolder + camera + model + "Tvecs.npy")
+        except FileNotFoundError:
+            continue
+        print('%s %s, %d imagenes de %d puntos' % (camera, model, m, n))
+
+        # extrinseco, imagen por imagen
+        res = np.zeros((2, 4))  # nfev, njev, tiempo, costo
+        for j in range(m):
+            imPts = imagePoints[j].reshape((n, 2)).astype(float)
+
+            t0 = perf_counter()
+            params = cl.formatParameters(rVecs[j].reshape(-1),
+                                         tVecs[j].reshape(-1), cameraMatrix,
+                                         distCoeffs.reshape((-1, 1)), model)
+            for nombre in params:
+                params[nombre].vary = nombre[1:4] == 'vec'
+            out = minimize(residualLmfit, params, method='leastsq',
+                           args=(objectPoints, imPts, model))
+            res[0] += [out.nfev, 0, perf_counter() - t0,
+                       costo(out.residual)]
+
+            t0 = perf_counter()
+            ret = cl.calibrateInverseLsq(objectPoints, imPts, rVecs[j],
+                                         tVecs[j], cameraMatrix, distCoeffs,
+                                         model)
+            res[1] += [ret[4].nfev, ret[4].njev, perf_counter() - t0,
+                       ret[4].cost]
+
+        print('    extrinseco     fev    jac   tiempo   costo')
+        for nombre, r in zip(['lmfit', 'analitico'], res):
+            print('    %-10s %7d %6d %7.3fs  %.4e' % (nombre, *r))
+
+        # intrinseco con nIm imagenes
+        imPts = imagePoints[:nIm].reshape((nIm, n, 2)).astype(float)
+        X0 = cl.lsqPack(rVecs[:nIm], tVecs[:nIm], cameraMatrix, distCoeffs,
+                        model, intrinsic=True)
+        args = (np.broadcast_to(objectPoints[:, :2], (nIm, n, 2)), imPts,
+                cameraMatrix, distCoeffs, model, True)
+
+        t0 = perf_counter()
+        params = Parameters()
+        for i, x in enumerate(X0):
+            params.add('x%d' % i, value=x)
+        try:
+            out = minimize(residualPlano, params, method='leastsq',
+                           args=args)
+            r0 = [out.nfev, 0, perf_counter() - t0, costo(out.residual)]
+            r0.append(fuera(np.array([out.params['x%d' % i].value
+                                      for i in range(len(X0))]), *args))
+        except ValueError:  # lmfit no acepta residuos nan
+            r0 = None
+
+        t0 = perf_counter()
+        try:
+            ret = cl.calibrateInverseLsq(objectPoints, imPts, rVecs[:nIm],
+                                         tVecs[:nIm], cameraMatrix,
+                                         distCoeffs, model, intrinsic=True)
+            r1 = [ret[4].nfev, ret[4].njev, perf_counter() - t0,
+                  ret[4].cost, fuera(ret[4].x, *args)]
+        except ValueError:
+            r1 = None
+
+        print('    intrinseco %d parametros, puntos fuera de rango %d' % (
+            len(X0), fuera(X0, *args)))
+        for nombre, r in zip(['lmfit', 'analitico'], [r0, r1]):
+            if r is None:
+                print('    %-10s residuos nan, no converge' % nombre)
+            else:
+                print('    %-10s %7d %6d %7.3fs  %.4e  %d' % (nombre, *r))
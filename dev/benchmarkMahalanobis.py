@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+tiempo de bayesLib.errorCuadraticoInt con la distancia de mahalanobis en
+forma cerrada (errorMahalanobis) y todas las imagenes desdistorsionadas
+juntas, comparado con la version anterior (np.linalg.inv y det por imagen,
+copiada abajo). con Ci por punto armado con np.repeat como en
+dev/intrinsicCalibBayes.py y con un escalar isotropico, que antes no se
+podia usar
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from calibration import calibrator as cl
+from dev import bayesLib as bl
+
+camera = 'vcaWide'
+modelos = ['rational', 'poly', 'fisheye']
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+imagePoints = np.load(imagesFolder + camera + "Corners.npy")
+chessboardModel = np.load(imagesFolder + camera + "ChessPattern.npy")
+n = imagePoints.shape[0]  # cantidad de imagenes
+m = chessboardModel.shape[1]  # cantidad de puntos
+tiempoTotal = 2.0  # segundos por medicion
+
+
+def errorCuadraticoImagenViejo(Xext, Xint, Ns, params, j):
+    '''
+    la version anterior de bayesLib.errorCuadraticoImagen
+    '''
+    cameraMatrix, distCoeffs = bl.flat2int(Xint, Ns)
+    rvec, tvec = bl.flat2ext(Xext)
+    n, m, imagePoints, model, chessboardModel, Ci = params
+
+    try:
+        Cov = Ci[j]
+    except:
+        Cov = None
+
+    xm, ym, Cm = cl.inverse(imagePoints[j,0], rvec, tvec, cameraMatrix,
+                            distCoeffs, model, Cccd=Cov)
+    er = ([xm, ym] - chessboardModel[0,:,:2].T).T
+
+    if np.any(Cm):
+        S = np.linalg.inv(Cm)
+        Er = (er.reshape((-1,2,1)) * S * er.reshape((-1,1,2))).sum()
+        Er += np.log(np.linalg.det(Cm)).sum()
+    else:
+        Er = np.sum(er**2)
+
+    return Er
+
+
+def errorCuadraticoIntViejo(Xint, Ns, XextList, params):
+    '''
+    la version anterior de bayesLib.errorCuadraticoInt, imagen por imagen
+    '''
+    Er = 0
+    for j in range(len(XextList)):
+        Er += errorCuadraticoImagenViejo(XextList[j], Xint, Ns, params, j)
+    return Er
+
+
+def mide(fun, *args):
+    '''
+    llamadas por segundo
+    '''
+    fun(*args)
+    k, t0 = 0, perf_counter()
+    while perf_counter() - t0 < tiempoTotal:
+        fun(*args)
+        k += 1
+    return k / (perf_counter() - t0)
+
+
+# %% mido
+print('%d imagenes de %d puntos, llamadas por segundo' % (n, m))
+print('modelo    Ci          viejo    nuevo  speedup   dif relativa')
+for model in modelos:
+    distCoeffs = np.load(imagesFolder + camera + model + "DistCoeffs.npy")
+    cameraMatrix = np.load(imagesFolder + camera + model + "LinearCoeffs.npy")
+    rVecs = np.load(imagesFolder + camera + model + "Rvecs.npy")
+    tVecs = np.load(imagesFolder + camera + model + "Tvecs.npy")
+
+    Xint, Ns = bl.int2flat(cameraMatrix, distCoeffs)
+    XextList = [bl.ext2flat(rVecs[i], tVecs[i]) for i in range(n)]
+
+    CiRepeat = np.repeat([np.eye(2)], n*m, axis=0).reshape(n, m, 2, 2)
+    for nombre, Ci, CiViejo in [('por punto', CiRepeat, CiRepeat),
+                                ('escalar', 1.0, CiRepeat)]:
+        params = [n, m, imagePoints, model, chessboardModel, Ci]
+        paramsViejo = [n, m, imagePoints, model, chessboardModel, CiViejo]
+
+        eViejo = errorCuadraticoIntViejo(Xint, Ns, XextList, paramsViejo)
+        eNuevo = bl.errorCuadraticoInt(Xint, Ns, XextList, params)
+
+        tViejo = mide(errorCuadraticoIntViejo, Xint, Ns, XextList,
+                      paramsViejo)
+        tNuevo = mide(bl.errorCuadraticoInt, Xint, Ns, XextList, params)
+        print('%-9s %-10s %7.1f  %7.1f  %6.1fx   %.1e' % (
+            model, nombre, tViejo, tNuevo, tNuevo / tViejo,
+            abs(eNuevo / eViejo - 1)))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+pose de una imagen desde muchas condiciones iniciales al azar, como en
+dev/calibExternNov2016.py:
+- viejo: gradiente descendente con momento y gradiente por diferencias
+  hacia adelante (7 evaluaciones por paso), H hilos de M arranques cada uno
+  (copiado abajo, con el error en el mapa de la inversa actual)
+- calibrateInverseLsq arranque por arranque
+- calibrator.calibratePoseMultiStart, todos los arranques juntos
+se reporta el tiempo por arranque, el menor costo y la fraccion de los
+arranques que termina en la cuenca del minimo (a 1e-3 relativo)
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from threading import Thread
+from calibration import calibrator as cl
+
+camera = 'vcaWide'
+modelos = ['rational', 'poly', 'fisheye']
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+imagePoints = np.load(imagesFolder + camera + "Corners.npy")
+chessboardModel = np.load(imagesFolder + camera + "ChessPattern.npy")
+j = 3  # imagen
+imPts = imagePoints[j].reshape((-1, 2)).astype(float)
+objectPoints = chessboardModel.reshape((-1, 3))
+S = 400  # arranques
+H, M, N = 4, 10, 50  # hilos, arranques por hilo e iteraciones del viejo
+Dr = np.pi * 30.0 / 180  # amplitud de variacion angular
+Dt = 0.5  # amplitud de variacion de posicion, relativa a |tVec|
+rng = np.random.default_rng(0)
+
+
+def Esq(rVec, tVec, cameraMatrix, distCoeffs, model):
+    xm, ym, _ = cl.inverse(imPts, rVec, tVec, cameraMatrix, distCoeffs,
+                           model)
+    return (np.sum((xm - objectPoints[:, 0])**2) +
+            np.sum((ym - objectPoints[:, 1])**2))
+
+
+def gradE2(rVec, tVec, cameraMatrix, distCoeffs, model):
+    E0 = Esq(rVec, tVec, cameraMatrix, distCoeffs, model)
+    u = 1e-5
+    DrVec = rVec * u
+    DtVec = tVec * u
+    rV = [rVec] * 3 + np.diag(DrVec)
+    tV = [tVec] * 3 + np.diag(DtVec)
+    E1r = np.empty(3)
+    E1t = np.empty(3)
+    for i in range(3):
+        E1r[i] = Esq(rV[i], tVec, cameraMatrix, distCoeffs, model)
+        E1t[i] = Esq(rVec, tV[i], cameraMatrix, distCoeffs, model)
+    return (E1r - E0) / DrVec, (E1t - E0) / DtVec, E0
+
+
+def graDescMome(alfaR, alfaT, beta, N, rVec, tVec, cameraMatrix,
+                distCoeffs, model):
+    zR = np.zeros_like(rVec)
+    zT = np.zeros_like(tVec)
+    for i in range(N):
+        gR, gT, E = gradE2(rVec, tVec, cameraMatrix, distCoeffs, model)
+        zR = beta * zR + (1 - beta) * gR
+        zT = beta * zT + (1 - beta) * gT
+        rVec = rVec - alfaR * zR
+        tVec = tVec - alfaT * zT
+    return rVec, tVec, Esq(rVec, tVec, cameraMatrix, distCoeffs, model) / 2
+
+
+def unHilo(rV, tV, args, E):
+    for m in range(rV.shape[0]):
+        E.append(graDescMome(1e-6, 1e-6, 0.8, N, rV[m], tV[m], *args))
+
+
+# %%
+print('%d arranques (%d el viejo), segundos por arranque' % (S, H * M))
+print('modelo     metodo        tiempo   menor costo   en la cuenca')
+for model in modelos:
+    distCoeffs = np.load(imagesFolder + camera + model + "DistCoeffs.npy")
+    cameraMatrix = np.load(imagesFolder + camera + model + "LinearCoeffs.npy")
+    rVec = np.load(imagesFolder + camera + model + "Rvecs.npy")[j].ravel()
+    tVec = np.load(imagesFolder + camera + model + "Tvecs.npy")[j].ravel()
+    args = (cameraMatrix, distCoeffs, model)
+    rVins = rVec + (rng.random((S, 3)) - 0.5) * Dr
+    tVins = tVec + (rng.random((S, 3)) - 0.5) * Dt * np.linalg.norm(tVec)
+
+    t0 = perf_counter()
+    rV, tV, res = cl.calibratePoseMultiStart(objectPoints, imPts, rVins,
+                                             tVins, *args)
+    tNuevo = (perf_counter() - t0) / S
+    X = res.x
+
+    def enCuenca(Xs):
+        return np.mean(np.linalg.norm(Xs - X, axis=1) <=
+                       1e-3 * (np.linalg.norm(X) + 1e-3))
+
+    t0 = perf_counter()
+    ret = [cl.calibrateInverseLsq(objectPoints, imPts, rVins[i], tVins[i],
+                                  *args) for i in range(S)]
+    tLsq = (perf_counter() - t0) / S
+    cLsq = np.array([r[4].cost for r in ret])
+    XLsq = np.array([r[4].x for r in ret])
+
+    E = list()
+    t0 = perf_counter()
+    hilos = [Thread(target=unHilo, args=(rVins[h * M:(h + 1) * M],
+                                         tVins[h * M:(h + 1) * M], args, E))
+             for h in range(H)]
+    [h.start() for h in hilos]
+    [h.join() for h in hilos]
+    tViejo = (perf_counter() - t0) / (H * M)
+    cViejo = np.array([e[2] for e in E])
+    XViejo = np.array([np.concatenate(e[:2]) for e in E])
+
+    for nombre, t, c, Xs in [
+            ('viejo', tViejo, cViejo, XViejo),
+            ('lsq', tLsq, cLsq, XLsq),
+            ('multistart', tNuevo, res.costs, res.xs)]:
+        print('%-10s %-10s %9.5f   %.4e    %.2f' % (
+            model, nombre, t, np.nanmin(c), enCuenca(Xs)))
+    print('           %d cuencas, %.1f iteraciones en promedio' % (
+        res.basinCost.shape[0], res.nit.mean()))
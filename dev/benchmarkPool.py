@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+tiempo por llamada de bayesLib.jacobianos(numerico=True) con el pool de
+procesos persistente y los datos en memoria compartida, comparado con la
+version anterior (copiada abajo) que arrancaba 2n+2 procesos en cada
+llamada y le pasaba params entero a cada uno. se llama varias veces
+seguidas con los mismos datos, como desde un optimizador
+
+@author: sebalander
+"""
+
+# %%
+import os
+import numpy as np
+from time import perf_counter
+from multiprocess import Process, Queue
+from dev import bayesLib as bl
+
+camera = 'vcaWide'
+model = 'fisheye'
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+imagePoints = np.load(imagesFolder + camera + "Corners.npy")
+chessboardModel = np.load(imagesFolder + camera + "ChessPattern.npy")
+distCoeffs = np.load(imagesFolder + camera + model + "DistCoeffs.npy")
+cameraMatrix = np.load(imagesFolder + camera + model + "LinearCoeffs.npy")
+rVecs = np.load(imagesFolder + camera + model + "Rvecs.npy")
+tVecs = np.load(imagesFolder + camera + model + "Tvecs.npy")
+m = chessboardModel.shape[1]
+nLlamadas = 3
+imagenes = [4, 16, imagePoints.shape[0]]
+
+
+def procJint(Xint, Ns, XextList, params, ret):
+    ret.put(bl.Jint(Xint, Ns, XextList, params))
+
+
+def procJext(Xext, Xint, Ns, params, j, ret):
+    ret.put(bl.Jext(Xext, Xint, Ns, params, j))
+
+
+def jacobianosViejo(Xint, Ns, XextList, params):
+    '''
+    la version anterior de bl.jacobianos(hessianos=False), un proceso nuevo
+    para cada cuenta
+    '''
+    jInt = Queue()
+    pJInt = Process(target=procJint, args=(Xint, Ns, XextList, params, jInt))
+    pJInt.start()
+
+    n = len(XextList)
+    jExt = np.zeros((n, 1, 6), dtype=float)
+    qJext = [Queue() for nn in range(n)]
+    proJ = list()
+    for i in range(n):
+        pJ = Process(target=procJext, args=(XextList[i], Xint, Ns,
+                                            params, i, qJext[i]))
+        proJ.append(pJ)
+        pJ.start()
+
+    jInt = jInt.get()
+    for i in range(n):
+        jExt[i] = qJext[i].get()
+
+    pJInt.join()
+    [p.join() for p in proJ]
+
+    return jInt, jExt
+
+
+# %%
+print('%d nucleos, segundos por llamada (%d llamadas seguidas)' % (
+    os.cpu_count(), nLlamadas))
+print('imagenes   procesos nuevos   pool    dif. relativa')
+Xint, Ns = bl.int2flat(cameraMatrix, distCoeffs)
+for n in imagenes:
+    XextList = [bl.ext2flat(rVecs[i], tVecs[i]) for i in range(n)]
+    Ci = np.repeat([np.eye(2)], n * m, axis=0).reshape(n, m, 2, 2)
+    params = [n, m, imagePoints, model, chessboardModel, Ci]
+
+    t0 = perf_counter()
+    for i in range(nLlamadas):
+        viejo = jacobianosViejo(Xint, Ns, XextList, params)
+    tViejo = (perf_counter() - t0) / nLlamadas
+
+    t0 = perf_counter()
+    for i in range(nLlamadas):
+        nuevo = bl.jacobianos(Xint, Ns, XextList, params, hessianos=False,
+                              numerico=True)
+    tPool = (perf_counter() - t0) / nLlamadas
+
+    dif = max(np.max(np.abs(a - b)) / np.max(np.abs(b))
+              for a, b in zip(nuevo, viejo))
+    print('%8d   %15.2f   %6.2f   %.1e' % (n, tViejo, tPool, dif))
+
+bl.cerrarPool()
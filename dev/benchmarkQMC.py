@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+convergencia con N del montecarlo de calibration.montecarlo con muestras
+pseudo aleatorias, sobol y halton (ambas scrambled). para cada N se repite
+con semillas independientes y se toma el error cuadratico medio de la media
+y la covarianza de las esquinas de una imagen en el mapa, respecto a un
+sobol de 2^20 muestras. con las covarianzas de dev/montecarloUncertanty.py
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from calibration import calibrator as cl
+from calibration import montecarlo as mc
+
+camera = 'vcaWide'
+modelos = ['rational', 'poly', 'fisheye']
+metodos = ['random', 'sobol', 'halton']
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+imagePoints = np.load(imagesFolder + camera + "Corners.npy")[0, 0]
+npts = imagePoints.shape[0]
+Ns = 2**np.arange(6, 15, 2)
+nRep = 10  # repeticiones con semillas independientes
+Nref = 2**20
+
+
+def errores(xm, ym, Cm, xmRef, ymRef, CmRef):
+    '''
+    error de la media relativo al desvio y de la covarianza relativo en
+    norma de frobenius, medianas sobre los puntos
+    '''
+    desvio = np.sqrt(np.trace(CmRef, axis1=1, axis2=2))
+    eMu = np.hypot(xm - xmRef, ym - ymRef) / desvio
+    eC = np.linalg.norm(Cm - CmRef, axis=(1, 2))
+    eC /= np.linalg.norm(CmRef, axis=(1, 2))
+    return np.median(eMu), np.median(eC)
+
+
+# %% mido
+for model in modelos:
+    distCoeffs = np.load(imagesFolder + camera + model +
+                         "DistCoeffs.npy").reshape(-1)
+    cameraMatrix = np.load(imagesFolder + camera + model + "LinearCoeffs.npy")
+    rV = np.load(imagesFolder + camera + model + "Rvecs.npy")[0].reshape(-1)
+    tV = np.load(imagesFolder + camera + model + "Tvecs.npy")[0].reshape(-1)
+
+    Ci = np.array([np.eye(2)] * npts) * 1.0**2
+    Cf = np.eye(4) * 0.1**2
+    Ck = np.diag((distCoeffs[cl.kIndices[model]] * 0.001)**2)
+    Crt = np.diag([(np.pi / 180)**2] * 3 + [0.1**2] * 3)
+    args = (imagePoints, rV, tV, cameraMatrix, distCoeffs, model, Ci, Cf, Ck,
+            Crt)
+
+    t0 = perf_counter()
+    ref = mc.montecarloInverse(*args, nSamples=Nref, seed=0,
+                               method='sobol')[:3]
+    print('%s, referencia sobol %d muestras en %.1fs' % (
+        model, Nref, perf_counter() - t0))
+    print('    N     ' + ''.join('%-26s' % m for m in metodos))
+
+    for N in Ns:
+        linea = '%7d  ' % N
+        for metodo in metodos:
+            e = list()
+            t0 = perf_counter()
+            for seed in mc.spawnSeeds(1, nRep):
+                res = mc.montecarloInverse(*args, nSamples=N, seed=seed,
+                                           method=metodo)[:3]
+                e.append(errores(*res, *ref))
+            t = (perf_counter() - t0) / nRep
+            eMu, eC = np.sqrt(np.mean(np.square(e), axis=0))
+            linea += '%.1e / %.1e %6.3fs   ' % (eMu, eC, t)
+        print(linea)
+    print('error media (desvios) / covarianza (relativo), tiempo por corrida')
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+tiempo por punto de RationalCalibration.radialUndistort, comparando el
+solver que llama a roots() punto por punto con el que resuelve todos los
+polinomios juntos con las matrices companion apiladas
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from numpy import roots, isreal, real, array
+from calibration import RationalCalibration as rational
+
+# %% LOAD DATA
+camera = 'vcaWide'
+model = 'rational'
+
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+distCoeffsFile = imagesFolder + camera + model + "DistCoeffs.npy"
+linearCoeffsFile = imagesFolder + camera + model + "LinearCoeffs.npy"
+
+distCoeffs = np.load(distCoeffsFile).reshape(-1)
+cameraMatrix = np.load(linearCoeffsFile)
+
+# max radius in homogenous distorted coords, corner of the image
+rppMax = np.sqrt((cameraMatrix[0, 2] / cameraMatrix[0, 0])**2 +
+                 (cameraMatrix[1, 2] / cameraMatrix[1, 1])**2)
+
+
+# %% solver viejo, un polinomio por vez
+def radialUndistortLoop(rpp, k):
+    k.shape = -1
+    poly = [[k[4], -r*k[7], k[1], -r*k[6], k[0], -r*k[5], 1, -r] for r in rpp]
+
+    rootsPoly = array([roots(p) for p in poly])
+    rPRB = isreal(rootsPoly) & (0 <= real(rootsPoly))
+
+    return array([min(rootsPoly[i, rPRB[i]].real)
+                  for i in range(rpp.shape[0])])
+
+
+# %% mido tiempos
+Ns = [10**3, 10**4, 10**5, 10**6]
+NloopMax = 10**4  # el loop es demasiado lento para mas puntos
+
+for N in Ns:
+    rpp = np.random.rand(N) * rppMax
+
+    t0 = perf_counter()
+    rpBatch, retVal = rational.radialUndistort(rpp, distCoeffs)
+    tBatch = perf_counter() - t0
+
+    if N <= NloopMax:
+        t0 = perf_counter()
+        rpLoop = radialUndistortLoop(rpp, distCoeffs)
+        tLoop = perf_counter() - t0
+        iguales = np.array_equal(rpLoop, rpBatch)
+        print('N=%8d  loop %8.2f us/pto  batch %6.2f us/pto  x%5.1f  %s' %
+              (N, tLoop / N * 1e6, tBatch / N * 1e6, tLoop / tBatch,
+               'iguales' if iguales else 'DISTINTOS'))
+    else:
+        print('N=%8d  loop      ---      batch %6.2f us/pto' %
+              (N, tBatch / N * 1e6))
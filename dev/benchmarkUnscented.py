@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+compara la propagacion de incerteza de calibrator.inverse linealizada, con
+la transformada unscented (calibrator.inverseUnscented) y montecarlo de
+N = 1000 realizaciones como en dev/montecarloUncertanty.py. la referencia es
+un montecarlo de 20000 realizaciones. se mide el tiempo y el error relativo
+de la media y de la covarianza en el mapa de las esquinas de una imagen,
+con las covarianzas de montecarloUncertanty y con otras 5 veces mas grandes
+(en desvio) donde la no linealidad pesa mas
+
+@author: sebalander
+"""
+
+# %%
+import numpy as np
+from time import perf_counter
+from calibration import calibrator as cl
+
+camera = 'vcaWide'
+modelos = ['rational', 'poly', 'fisheye']
+imagesFolder = "./resources/intrinsicCalib/" + camera + "/"
+imagePoints = np.load(imagesFolder + camera + "Corners.npy")[0, 0]
+npts = imagePoints.shape[0]
+Nmc = 1000
+Nref = 20000
+
+
+def covarianzas(distCoeffs, model, escala):
+    '''
+    las de montecarloUncertanty, los desvios multiplicados por escala
+    '''
+    Ci = np.array([np.eye(2)] * npts) * 1.0**2
+    Cf = np.eye(4) * 0.1**2
+    Ck = np.diag((distCoeffs[cl.kIndices[model]] * 0.001)**2)
+    Crt = np.diag([(np.pi / 180)**2] * 3 + [0.1**2] * 3)
+    return [C * escala**2 for C in [Ci, Cf, Ck, Crt]]
+
+
+def montecarlo(N, rV, tV, cameraMatrix, distCoeffs, model, Ci, Cf, Ck, Crt,
+               seed):
+    '''
+    N realizaciones de todos los parametros, devuelve media y covarianza
+    '''
+    rng = np.random.default_rng(seed)
+    iK = cl.kIndices[model]
+    Li = np.linalg.cholesky(Ci)
+    xM, yM = np.empty((2, N, npts))
+    for i in range(N):
+        xI = imagePoints + np.einsum('nij,nj->ni', Li, rng.standard_normal(
+            (npts, 2)))
+        K = cameraMatrix.copy()
+        K[[0, 1, 0, 1], [0, 1, 2, 2]] += rng.multivariate_normal(
+            np.zeros(4), Cf)
+        k = distCoeffs.copy()
+        k[iK] += rng.multivariate_normal(np.zeros(len(iK)), Ck)
+        rt = rng.multivariate_normal(np.zeros(6), Crt)
+        xM[i], yM[i], _ = cl.inverse(xI, rV + rt[:3], tV + rt[3:], K, k,
+                                     model)
+
+    X = np.array([xM, yM]).transpose((1, 2, 0))
+    mu = X.mean(0)
+    dX = X - mu
+    Cm = np.einsum('sni,snj->nij', dX, dX) / (N - 1)
+    return mu, Cm
+
+
+def errores(mu, Cm, muRef, CmRef):
+    '''
+    error de la media relativo al desvio y error de la covarianza en norma
+    de frobenius relativo, medianas sobre los puntos
+    '''
+    desvio = np.sqrt(np.trace(CmRef, axis1=1, axis2=2))
+    eMu = np.linalg.norm(mu - muRef, axis=1) / desvio
+    eC = np.linalg.norm(Cm - CmRef, axis=(1, 2))
+    eC /= np.linalg.norm(CmRef, axis=(1, 2))
+    return np.median(eMu), np.median(eC)
+
+
+# %% mido
+print('%d puntos, errores respecto a montecarlo de %d: media (en desvios) '
+      '/ covarianza (relativo)' % (npts, Nref))
+for model in modelos:
+    distCoeffs = np.load(imagesFolder + camera + model +
+                         "DistCoeffs.npy").reshape(-1)
+    cameraMatrix = np.load(imagesFolder + camera + model + "LinearCoeffs.npy")
+    rV = np.load(imagesFolder + camera + model + "Rvecs.npy")[0].reshape(-1)
+    tV = np.load(imagesFolder + camera + model + "Tvecs.npy")[0].reshape(-1)
+
+    for escala in [1, 5]:
+        Ci, Cf, Ck, Crt = covarianzas(distCoeffs, model, escala)
+        args = (rV, tV, cameraMatrix, distCoeffs, model, Ci, Cf, Ck, Crt)
+        muRef, CmRef = montecarlo(Nref, *args, seed=0)
+
+        t0 = perf_counter()
+        xm, ym, Cm = cl.inverse(imagePoints, *args)
+        tLin = perf_counter() - t0
+        eLin = errores(np.array([xm, ym]).T, Cm, muRef, CmRef)
+
+        t0 = perf_counter()
+        xm, ym, Cm = cl.inverseUnscented(imagePoints, *args)
+        tUT = perf_counter() - t0
+        eUT = errores(np.array([xm, ym]).T, Cm, muRef, CmRef)
+
+        t0 = perf_counter()
+        mu, Cm = montecarlo(Nmc, *args, seed=1)
+        tMC = perf_counter() - t0
+        eMC = errores(mu, Cm, muRef, CmRef)
+
+        print('%-8s desvios x%d' % (model, escala))
+        for nombre, t, e in [('lineal', tLin, eLin), ('unscented', tUT, eUT),
+                             ('MC %d' % Nmc, tMC, eMC)]:
+            print('    %-10s %8.4fs   %.1e / %.1e' % (nombre, t, *e))
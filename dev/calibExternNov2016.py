@@ -25,7 +25,6 @@ retrieveParameters = rational.retrieveParameters
 
 from lmfit import minimize, Parameters
 import scipy.linalg as ln
-from threading import Thread
 
 # %% LOAD DATA
 # cam puede ser ['vca', 'vcaWide', 'ptz'] son los datos que se tienen
@@ -309,26 +308,6 @@ def graDescMome(alfaR, alfaT, beta, N, Data, rVec, tVec, data):
 
 #
 
-# %%
-
-def unHilo(realizData, M, h, E, rVoptim, tVoptim):
-    
-    print('thread', h, 'inicializing')
-    alfaR, alfaT, beta, N, data, rV, tV, data = realizData
-    
-    for m in range(M):
-        print('thread', h, 'iteracion', m, 'de', M)
-        r, t, Elis, _, _ = graDescMome(alfaR, alfaT, beta, N, data, rV[m], tV[m], data)
-        
-        E.append(Elis)
-        rVoptim.append(r[-1])
-        tVoptim.append(t[-1])
-    
-        del Elis, r, t
-    
-    print('thread', h, 'terminated')
-#
-
 # %%
 data = [imagePoints, objectPoints, cameraMatrix, model]
 
@@ -337,8 +316,7 @@ alfaT = 1e-6
 beta = 0.8
 
 N = 50 # cantidad de iteraciones
-M = 50  # cantidad de realizaciones por hilo
-H = 4  # cantidad de hilos
+S = 200  # cantidad de condiciones iniciales
 # magnitud de la variacion
 Dr = np.ones_like(rV) * np.pi * 30.0/180 # 30 grados de amplitud de variacion angular
 Dt = np.ones_like(tV) * 10 # 10 metros de variacion de posicion
@@ -347,28 +325,17 @@ Dt = np.ones_like(tV) * 10 # 10 metros de variacion de posicion
 _, _, Elis, _, _ = graDescMome(alfaR, alfaT, beta, N, data, rV, tV, data)
 
 
-# %%
-rVoptim = list()
-tVoptim = list()
-E = list()
-threads = list()
-
+# %% todas las condiciones iniciales juntas con levenberg-marquardt
 # genero posiciones iniciales
-rVins = rV + (np.random.rand(H, M, 3) - 0.5) * Dr
-tVins = tV + (np.random.rand(H, M, 3) - 0.5) * Dt
-
-for h in range(H):
-    realizData = [alfaR, alfaT, beta, N, data, rVins[h], tVins[h], data]
-    
-    t = Thread(target=unHilo, args=(realizData, M, h, E, rVoptim, tVoptim))
-    
-    threads.append(t)
-    threads[h].start()
-
-[t.join() for t in threads] # wait for all
+rVins = rV.reshape(-1) + (np.random.rand(S, 3) - 0.5) * Dr.reshape(-1)
+tVins = tV.reshape(-1) + (np.random.rand(S, 3) - 0.5) * Dt.reshape(-1)
 
-E = np.array(E)
+rVoptim, tVoptim, res = cl.calibratePoseMultiStart(
+    objectPoints, imagePoints, rVins, tVins, cameraMatrix, distCoeffs, model,
+    maxIter=N)
+E = 2 * res.history  # Esq es el doble del costo
 
+print('cuencas', res.basinCost, res.basinCount)
 
 plt.figure()
 plt.plot(E.T)
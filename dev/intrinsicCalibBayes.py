@@ -29,6 +29,7 @@ import numdifftools as ndf
 from dev import multipolyfit as mpf
 
 from dev import bayesLib as bl
+from calibration import montecarlo as mc
 
 from multiprocess import Process, Queue, Value
 # https://github.com/uqfoundation/multiprocess/tree/master/py3.6/examples
@@ -90,7 +91,7 @@ testearFunc = True
 if testearFunc:
     # parametros auxiliares
     # Ci = None
-    Ci = np.repeat([np.eye(2)],n*m, axis=0).reshape(n,m,2,2)
+    Ci = 1.0  # varianza isotropica igual para todos los puntos
     params = [n, m, imagePoints, model, chessboardModel, Ci]
     
     # pongo en forma flat los valores iniciales
@@ -109,43 +110,26 @@ if testearFunc:
 # %% pruebo evaluar las funciones para los processos
 testearFunc = False
 if testearFunc:
-    Ci = np.repeat([np.eye(2)],n*m, axis=0).reshape(n,m,2,2)
+    Ci = 1.0  # varianza isotropica igual para todos los puntos
     params = [n, m, imagePoints, model, chessboardModel, Ci]
     
-    jInt = Queue()  # np.zeros((Ns[-1]), dtype=float)
-    hInt = Queue()  # np.zeros((Ns[-1], Ns[-1]), dtype=float)
-    
-    pp = list()
-    pp.append(Process(target=bl.procJint, args=(Xint, Ns, XextList, params, jInt)))
-    pp.append(Process(target=bl.procHint, args=(Xint, Ns, XextList, params, hInt)))
-    
-    
-    jExt = Queue()  # np.zeros(6, dtype=float)
-    hExt = Queue()  # np.zeros((6, 6), dtype=float)
-    
+    datos = bl.publicarDatos(params)
     j = 23
-    pp.append(Process(target=bl.procJext, args=(Xext, Xint, Ns, params, j, jExt)))
-    pp.append(Process(target=bl.procHext, args=(Xext, Xint, Ns, params, j, hExt)))
-    
-    [p.start() for p in pp]
-    
-    jInt = jInt.get()
-    hInt = hInt.get()
-    jExt = jExt.get()
-    hExt = hExt.get()
-    
-    print(jInt)
-    print(hInt)
-    print(jExt)
-    print(hExt)
+    tareas = [(cual, None, Xint, Ns, XextList, datos)
+              for cual in ['Jint', 'Hint']]
+    tareas += [(cual, j, Xint, Ns, XextList, datos)
+               for cual in ['Jext', 'Hext']]
     
-    [p.join() for p in pp]
+    for cual, j, ret in bl.workerPool().imap_unordered(bl.derivadaNumerica,
+                                                        tareas):
+        print(cual, j)
+        print(ret)
 
 
 # %%
 testearFunc = False
 if testearFunc:
-    Ci = np.repeat([np.eye(2)],n*m, axis=0).reshape(n,m,2,2)
+    Ci = 1.0  # varianza isotropica igual para todos los puntos
     params = [n, m, imagePoints, model, chessboardModel, Ci]
     # pruebo de evaluar jacobianos y hessianos
     Xint, Ns = bl.int2flat(cameraMatrix, distCoeffs)
@@ -180,7 +164,7 @@ e0 = bl.errorCuadraticoInt(Xint0, Ns, XextList0, params)
 
 # %% intento optimizacion con leastsq
 from scipy.optimize import minimize
-Ci = np.repeat([np.eye(2)],n*m, axis=0).reshape(n,m,2,2)
+Ci = 1.0  # varianza isotropica igual para todos los puntos
 params = [n, m, imagePoints, model, chessboardModel, Ci]
 # pongo en forma flat los valores iniciales
 Xint0, Ns = bl.int2flat(cameraMatrix, distCoeffs)
@@ -244,15 +228,16 @@ else:
 
 # %% trato de resolver el problema del hessiano no positivo en los parametros intrinsecos
 
-Ci = np.repeat([np.eye(2)],n*m, axis=0).reshape(n,m,2,2)
+Ci = 1.0  # varianza isotropica igual para todos los puntos
 params = [n, m, imagePoints, model, chessboardModel, Ci]
 
 # pongo en forma flat los valores iniciales
 Xint, Ns = bl.int2flat(cameraMatrix, distCoeffs)
 XextList = [bl.ext2flat(rVecs[i], tVecs[i])for i in range(n)]
 
-jInt = bl.Jint(Xint, Ns, XextList, params)  # (Ns,)
-hInt = bl.Hint(Xint, Ns, XextList, params)  #  (Ns, Ns)
+# analiticos, el hessiano de gauss-newton. los de numdifftools (bl.Jint,
+# bl.Hint) solo para verificar, ver dev/benchmarkGradiente.py
+jInt, hInt = bl.gradHessInt(Xint, Ns, XextList, params)  # (Ns,), (Ns, Ns)
 
 # %%
 deter = ln.det(hInt)
@@ -413,7 +398,9 @@ cova = ln.inv(hes)  # esta seria la covarianza asociada
 
 u,s,v = ln.svd(cova)  # para diagonalizar la elipse de la gaussiana
 
-XXsamples = vert + np.random.randn(1000, 8).dot(s*v)  # sampleo
+# sobol en vez de randn, converge mas rapido con N (dev/benchmarkQMC.py)
+sampler = mc.Sampler('sobol')
+XXsamples = vert + sampler.normal(1024, 8).dot(s*v)  # sampleo
 
 for i in range(6):
     print(i)
@@ -450,7 +437,7 @@ cova = ln.inv(hes)  # esta seria la covarianza asociada
 
 # %% grafico el error en cada direccion para ver que sea suave y en que
 # escalas hacer el fiteo
-Ci = np.repeat([np.eye(2)],n*m, axis=0).reshape(n,m,2,2)
+Ci = 1.0  # varianza isotropica igual para todos los puntos
 params = [n, m, imagePoints, model, chessboardModel, Ci]
 
 # pongo en forma flat los valores iniciales
@@ -608,9 +595,10 @@ print('tiempo ', np.polyval(p, npts) / 60, 'hs; ptos por eje ', npts**0.125)
 # genero muchas perturbaciones de los params intrinsecos alrededor de las cond
 # iniciales en un rango de +-10% que por las graficas parece ser bastante
 # parabolico el comportamiento todavía
-npts = int(1e4)
+npts = 2**13
 mapCounter = Value('i', 0)
-Xrand = (np.random.rand(npts, 8) * 2 - 1) * anchos + Xint
+sampler = mc.Sampler('sobol')  # 'random' para como era antes
+Xrand = (sampler.uniform(npts, 8) * 2 - 1) * anchos + Xint
 Yrand = mapManyParams(Xrand, Ns, XextList, params,  nThre=8)
 
 np.save('Xrand', Xrand)
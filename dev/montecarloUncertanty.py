@@ -12,6 +12,7 @@ test uncertanty propagation wrt montecarlo
 import numpy as np
 import glob
 from calibration import calibrator as cl
+from calibration import montecarlo as mc
 import matplotlib.pyplot as plt
 from importlib import reload
 import scipy.linalg as ln
@@ -22,21 +23,13 @@ def calculaCovarianza(xM, yM,):
     '''
     lso inputs son de tamaño (Nsamples, Mpuntos)
     con Nsamples por cada uno de los Mpuntos puntos
+    con el acumulador de montecarlo, que no necesita tener todas las muestras
+    juntas, se le puede pasar de a tandas
     '''
-    muXm = np.mean(xM, axis=0)
-    muYm = np.mean(yM, axis=0)
+    acc = mc.CovarianceAccumulator(xM.shape[1])
+    acc.update(np.array([xM, yM]).transpose((1, 2, 0)))
 
-    xMcen = xM.T - muXm.reshape(-1, 1)
-    yMcen = yM.T - muYm.reshape(-1, 1)
-
-    CmNum = np.empty((xM.shape[1], 2, 2), dtype=float)
-
-    CmNum[:, 0, 0] = np.sum(xMcen**2, axis=1)
-    CmNum[:, 1, 1] = np.sum(yMcen**2, axis=1)
-    CmNum[:, 0, 1] = CmNum[:, 1, 0] = np.sum(xMcen*yMcen, axis=1)
-    CmNum /= (xM.shape[0] - 1)
-
-    return [muXm, muYm], CmNum
+    return [acc.mean[:, 0], acc.mean[:, 1]], acc.covariance()
 
 
 # %% LOAD DATA
@@ -136,22 +129,26 @@ def analyticVsMC(imagePoints, Ci, cameraMatrix, Cf, distCoeffs, Ck, rtV, Crt):
     kL[:, [0, 1], [0, 1]] = np.random.randn(N, 2).dot(np.sqrt(Cf[:2, :2]))
     kL[:, [0, 1], [0, 1]] += cameraMatrix[[0, 1], [0, 1]]
     
-    xPP, yPP, xP, yP, xM, yM = np.empty((6, N, npts), dtype=float)
-    
+    # acumuladores de media y covarianza, no se guardan las muestras
+    accPP, accP, accM = [mc.CovarianceAccumulator(npts) for i in range(3)]
+
     for i in range(N):
         # % propagate to homogemous
-        xPP[i], yPP[i] = cl.ccd2hom(xI[i], kL[i])
+        xPP, yPP = cl.ccd2hom(xI[i], kL[i])[:2]
+        accPP.update(np.array([[xPP, yPP]]).transpose((0, 2, 1)))
     
         # % go to undistorted homogenous
-        xP[i], yP[i] = cl.homDist2homUndist(xPP[i], yPP[i], kD[i], model)
+        xP, yP = cl.homDist2homUndist(xPP, yPP, kD[i], model)[:2]
+        accP.update(np.array([[xP, yP]]).transpose((0, 2, 1)))
     
         # % project to map
-        xM[i], yM[i] = cl.xypToZplane(xP[i], yP[i], rots[i], tras[i])
+        xM, yM = cl.xypToZplane(xP, yP, rots[i], tras[i])[:2]
+        accM.update(np.array([[xM, yM]]).transpose((0, 2, 1)))
 
     muI, CiNum = calculaCovarianza(xI[:, :, 0], xI[:, :, 1])
-    muPP, CppNum = calculaCovarianza(xPP, yPP)
-    muP, CpNum = calculaCovarianza(xP, yP)
-    muM, CmNum = calculaCovarianza(xM, yM)
+    muPP, CppNum = [accPP.mean[:, 0], accPP.mean[:, 1]], accPP.covariance()
+    muP, CpNum = [accP.mean[:, 0], accP.mean[:, 1]], accP.covariance()
+    muM, CmNum = [accM.mean[:, 0], accM.mean[:, 1]], accM.covariance()
 
     ptsTeo = [imagePoints, [xpp, ypp], [xp, yp], [xm, ym]]
     ptsNum = [muI, muPP, muP, muM]
@@ -448,25 +445,11 @@ plt.subplot(2,3,3)
 plt.plot([-1, 1], [-1, 1], 'k-')
 
 # %%
-from scipy.special import chdtri
-
 def ptosAdentro(x, y, muX, muY, C, p):
     '''
     calcular la cantidad de puntos que caen adentro para una dada probablidad
     '''
-    # calculo ma raiz cuadrada de C. tal que A.dot(A.T) = C
-    l, v = ln.eig(ln.inv(C))
-    A = np.sqrt(l.real) * v
-
-    # llevo los vectores a la forma linealizada
-    X = np.array([x - muX, y - muY]).T.dot(A)
-
-    # radio^2 para 2D y probabiliad p de que esten adentro
-    r2 = chdtri(2, 1 - p)
-
-    adentro = np.sum(ln.norm(X, axis=1) <= np.sqrt(r2)) / x.shape[0]
-
-    return adentro
+    return np.mean(cl.insideEllipse(x, y, muX, muY, C, p))
 
 
 i = 9
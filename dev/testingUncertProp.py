@@ -353,7 +353,7 @@ _, _, Jh_d, Jh_k =  cl.homDist2homUndist_ratioJacobians(xpp, ypp, distCoeffs, mo
 # parte MONTE CARLO
 # Genero los valores a usar
 # matriz para rotoescalear el ruido
-convEllip2 = np.array([cl.unit2CovTransf(c) for c in Cpp])
+convEllip2 = cl.unit2CovTransf(Cpp)
 # aplico rotoescaleo
 xypertub2 = (convEllip2.reshape((1,-1,2,2)) *
              noisePos.reshape((nSampl,-1,1,2))).sum(-1)
@@ -443,7 +443,7 @@ JXm_Xp, JXm_rtV =  cl.jacobianosHom2Map(xp, yp, rVecs[j], tVecs[j])
 # parte MONTE CARLO
 # dejo los valores preparados
 # matriz para rotoescalear el ruido
-convEllip3 = np.array([cl.unit2CovTransf(c) for c in Cp])
+convEllip3 = cl.unit2CovTransf(Cp)
 # aplico rotoescaleo
 xypertub3 = (convEllip3.reshape((1,-1,2,2)) *
              noisePos.reshape((nSampl,-1,1,2))).sum(-1)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks CameraModel against calibrator for every model: inverse (with and
+without covariances) and direct must give the same as cl.inverse and
+cl.direct, directCovariance against the covariance propagated with a
+numerical jacobian of cl.direct, and a pickled and unpickled camera must
+give the same results
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+import pickle
+import numdifftools as ndf
+from calibration import calibrator as cl
+from calibration.cameraModel import CameraModel
+
+distCoeffs = {
+    'stereographic': np.array([0.9]),
+    'unified': np.array([-0.2, 1.1]),
+    'rational': np.array([0.46, 0.026, 0., 0., 8.6e-05, 0.73, 0.089,
+                          0.0013]),
+    'poly': np.array([-0.3, 0.05, 0., 0., -0.002]),
+    'fisheye': np.array([0.01, -0.005, 0.001, -0.0001])
+    }
+cameraMatrix = np.array([[800., 0., 640.], [0., 810., 480.], [0., 0., 1.]])
+rV = np.array([0.1, -0.2, 0.05])
+tV = np.array([-0.2, 0.1, 1.5])
+tol = 1e-10
+
+np.random.seed(0)
+objectPoints = np.zeros((30, 3))
+objectPoints[:, :2] = np.random.rand(30, 2) - 0.5
+Cccd = np.eye(2) * 0.25
+Cf = np.diag([4., 4., 1., 1.])
+Crt = np.eye(6) * 1e-6
+Cobj = np.diag([1e-4, 1e-4, 1e-5])
+
+
+def maxRel(a, b):
+    return np.max(np.abs(a - b)) / np.max(np.abs(b))
+
+
+# %%
+for model, k in distCoeffs.items():
+    K = cameraMatrix.copy()
+    if model in ['stereographic', 'unified']:
+        K[[0, 1], [0, 1]] *= 0.5
+    Ck = np.eye(len(cl.kIndices[model])) * 1e-8
+    cam = CameraModel(model, K, k, rV, tV)
+
+    # direct and inverse against calibrator
+    imagePoints = cam.direct(objectPoints)
+    ref = cl.direct(objectPoints, rV, tV, K, k, model)
+    assert maxRel(imagePoints, ref) < tol
+
+    xm, ym, Cm = cam.inverse(imagePoints)
+    assert Cm is False
+    assert np.max(np.abs(xm - objectPoints[:, 0])) < 1e-8
+    assert np.max(np.abs(ym - objectPoints[:, 1])) < 1e-8
+
+    covs = dict(Cccd=np.array([Cccd] * imagePoints.shape[0]), Cf=Cf, Ck=Ck,
+                Crt=Crt)
+    xm, ym, Cm = cam.inverse(imagePoints, **covs)
+    xmR, ymR, CmR = cl.inverse(imagePoints, rV, tV, K, k, model, **covs)
+    assert np.max(np.abs(xm - xmR)) < tol and np.max(np.abs(ym - ymR)) < tol
+    assert maxRel(Cm, CmR) < tol
+
+    # direct with covariance against a numerical jacobian
+    ip, Cd = cam.directCovariance(objectPoints, Cobj, Cf, Ck, Crt)
+    assert maxRel(ip, ref) < tol
+    X0 = np.concatenate((K[[0, 1, 0, 1], [0, 1, 2, 2]],
+                         k[cl.kIndices[model]], rV, tV))
+    nK = len(cl.kIndices[model])
+    Cs = np.zeros((X0.shape[0], X0.shape[0]))
+    Cs[:4, :4], Cs[4:4 + nK, 4:4 + nK], Cs[4 + nK:, 4 + nK:] = Cf, Ck, Crt
+
+    CdRef = np.empty_like(Cd)
+    for i in range(objectPoints.shape[0]):
+        def proyecta(X):
+            Ki, ki = K.copy(), k.copy()
+            Ki[[0, 1, 0, 1], [0, 1, 2, 2]] = X[:4]
+            ki[cl.kIndices[model]] = X[4:4 + nK]
+            obj = objectPoints[i] + X[-3:]
+            # direct takes more than one point
+            return cl.direct(np.array([obj, obj]), X[4 + nK:7 + nK],
+                             X[7 + nK:10 + nK], Ki, ki, model)[0]
+        J = ndf.Jacobian(proyecta)(np.concatenate((X0, np.zeros(3))))
+        CdRef[i] = J[:, :-3].dot(Cs).dot(J[:, :-3].T) + \
+            J[:, -3:].dot(Cobj).dot(J[:, -3:].T)
+    error = maxRel(Cd, CdRef)
+    assert error < 1e-6
+
+    assert cam.directCovariance(objectPoints)[1] is False
+
+    # pickled
+    cam.radialUndistort()  # the closure is built and must not be pickled
+    cam2 = pickle.loads(pickle.dumps(cam))
+    assert cam2.undistortFun is None
+    xm2, ym2, Cm2 = cam2.inverse(imagePoints, **covs)
+    assert np.all(xm2 == xm) and np.all(ym2 == ym) and np.all(Cm2 == Cm)
+    assert np.all(cam2.direct(objectPoints) == imagePoints)
+
+    print('%-13s ok, directCovariance error %.1e' % (model, error))
+
+# %% rotation matrix as pose
+cam = CameraModel('poly', cameraMatrix, distCoeffs['poly'],
+                  cl.Rodrigues(rV)[0], tV)
+assert np.max(np.abs(cam.rVec - rV)) < 1e-12
+print('rotation matrix ok')
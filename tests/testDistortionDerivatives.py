@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks the analytic derivatives of the distortion quotient q = rpp / rp of
+every model, dQdP (wrt rp) and dQdK (wrt the distortion coefficients),
+against central finite differences, vectorized over many radii. also that
+radialUndistort inverts radialDistort and the jacobian of the undistortion
+that homDist2homUndist uses to propagate covariances. the quotient that
+radialUndistort returns with quot keeps the meaning it had for every model,
+and homDist2homUndist undistorts the same with and without covariances
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from calibration import calibrator as cl
+
+np.seterr(all='ignore')
+rp = np.linspace(0.05, 1.5, 1000)
+h = 1e-6  # finite differences step
+tol = 1e-6  # relative
+
+# distortion coefficients to test and the index in k of each row of dQdK
+casos = {
+    'stereographic': ([np.array([1.2]), np.array([0.7])], [0]),
+    'unified': ([np.array([0.8, 0.3]), np.array([-0.2, 1.1])], [0, 1]),
+    'rational': ([np.array([0.46, 0.026, 0, 0, 8.6e-5, 0.73, 0.089,
+                            0.0013])], [0, 1, 4, 5, 6, 7]),
+    'poly': ([np.array([-0.3, 0.05, 0, 0, -0.002])], [0, 1, 4]),
+    'fisheye': ([np.array([0.01, -0.005, 0.001, -0.0001])], [0, 1, 2, 3])
+    }
+
+
+def errorRel(analitica, numerica):
+    return np.nanmax(np.abs(analitica - numerica)) / np.nanmax(np.abs(numerica))
+
+
+def quot(model, rp, k):
+    return cl.distort[model](rp, k.copy(), quot=True)
+
+
+# %% DIRECT: dQdP and dQdK
+for model, (ks, indices) in casos.items():
+    for k in ks:
+        q, dQdP, dQdK = cl.distort[model](rp, k.copy(), quot=True, der=True)
+
+        dQdPnum = (quot(model, rp + h, k) - quot(model, rp - h, k)) / 2 / h
+        errores = [errorRel(dQdP, dQdPnum)]
+
+        assert dQdK.shape == (len(indices), rp.shape[0])
+        for j, i in enumerate(indices):
+            kMas = k.copy()
+            kMenos = k.copy()
+            kMas[i] += h
+            kMenos[i] -= h
+            dQdKnum = (quot(model, rp, kMas) - quot(model, rp, kMenos)) / 2 / h
+            errores.append(errorRel(dQdK[j], dQdKnum))
+
+        print(model, k, 'error dQdP %.1e, dQdK %.1e' % (errores[0],
+                                                       max(errores[1:])))
+        assert max(errores) < tol
+
+
+# %% INVERSE: radialUndistort and the jacobian wrt distorted coords
+for model, (ks, indices) in casos.items():
+    for k in ks:
+        rpp = cl.distort[model](rp, k.copy())
+        rpInv, retVal = cl.undistortRadius(cl.undistort[model], rpp, k.copy())
+        errorInv = errorRel(rpInv[retVal], rp[retVal])
+
+        # undistort distorted coords along a diagonal and derive numerically,
+        # with a negligible Ck so that it goes by the jacobians branch
+        xpp = ypp = rpp[retVal] / np.sqrt(2)
+        _, _, Jp_pp, _ = cl.homDist2homUndist_ratioJacobians(xpp, ypp,
+                                                              k.copy(), model)
+        Ck = np.eye(len(indices)) * 1e-30
+        xpMas, _, _ = cl.homDist2homUndist(xpp + h, ypp, k.copy(), model,
+                                           Ck=Ck)
+        xpMenos, _, _ = cl.homDist2homUndist(xpp - h, ypp, k.copy(), model,
+                                             Ck=Ck)
+        dXpdXpp = (xpMas - xpMenos) / 2 / h
+        errorJac = errorRel(Jp_pp[:, 0, 0], dXpdXpp)
+
+        print(model, k, 'inversa %.1e (%d de %d), jacobiano %.1e' % (
+            errorInv, retVal.sum(), retVal.shape[0], errorJac))
+        assert errorInv < tol and errorJac < tol
+
+
+# %% QUOTIENTS: rp / rpp, but rpp / rp for fisheye
+for model, (ks, indices) in casos.items():
+    for k in ks:
+        rpp = cl.distort[model](rp, k.copy())
+        rpInv, retVal = cl.undistortRadius(cl.undistort[model], rpp, k.copy())
+        out = cl.undistort[model](rpp, k.copy(), quot=True)
+        q = out[0] if isinstance(out, tuple) else out
+        qEsperado = rpp / rpInv if model == 'fisheye' else rpInv / rpp
+        assert errorRel(q[retVal], qEsperado[retVal]) < 1e-14
+
+        # with der it is the distortion quotient, as radialDistort
+        qDer = cl.undistort[model](rpp, k.copy(), quot=True, der=True)[0]
+        assert errorRel(qDer[retVal], rpp[retVal] / rpInv[retVal]) < 1e-14
+
+        xpp = ypp = rpp[retVal] / np.sqrt(2)
+        xp, yp, _ = cl.homDist2homUndist(xpp, ypp, k.copy(), model)
+        xpC, ypC, _ = cl.homDist2homUndist(xpp, ypp, k.copy(), model,
+                                           Ck=np.eye(len(indices)) * 1e-30)
+        assert errorRel(xp, rp[retVal] / np.sqrt(2)) < tol
+        assert errorRel(xp, xpC) < 1e-14 and errorRel(yp, ypC) < 1e-14
+print('quotients ok')
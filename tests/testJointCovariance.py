@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks the schur complement blocks of the joint calibration on a small
+synthetic problem: jointCovariance against the dense inv(J^T S J) built
+with lsqJacobian, schurSolve against the dense solve of the normal
+equations, and calibrateJoint with maxIter=0
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from calibration import calibrator as cl
+
+model = 'poly'
+cameraMatrix = np.array([[800., 0., 640.], [0., 810., 480.], [0., 0., 1.]])
+distCoeffs = np.array([-0.3, 0.05, 0., 0., -0.002])
+m = 3
+grid = np.mgrid[0:5, 0:4].T.reshape((-1, 2)) * 0.1
+chessboardModel = np.zeros((1, grid.shape[0], 3))
+chessboardModel[0, :, :2] = grid
+rVecs = np.array([[0.1, 0.2, 0.05], [-0.2, 0.1, 0.3], [0.05, -0.15, -0.2]])
+tVecs = np.array([[-0.2, -0.1, 1.], [-0.1, -0.2, 1.2], [-0.15, -0.1, 0.9]])
+Cccd = 0.25
+tol = 1e-8
+
+np.random.seed(0)
+imagePoints = np.array([cl.direct(chessboardModel[0], rVecs[j], tVecs[j],
+                                  cameraMatrix, distCoeffs, model)
+                        for j in range(m)])
+imagePoints += np.random.randn(*imagePoints.shape) * np.sqrt(Cccd)
+
+objectPoints, imPts = cl.lsqPoints(chessboardModel, imagePoints, m)
+args = (objectPoints, imPts, cameraMatrix, distCoeffs, model)
+X = cl.lsqPack(rVecs, tVecs, cameraMatrix, distCoeffs, model, True)
+
+# %% covariance and step against the dense normal equations
+_, U, V, W, gI, gE, S = cl.jointNormalBlocks(X, *args, Cccd)
+J = cl.lsqJacobian(X, *args, True).reshape(S.shape[:3] + (X.shape[0],))
+e = cl.lsqResidual(X, *args, True).reshape(S.shape[:3])
+N = np.einsum('mnip,mnij,mnjq->pq', J, S, J)
+g = np.einsum('mnip,mnij,mnj->p', J, S, e)
+
+C = cl.jointCovariance(U, V, W)
+Cdensa = np.linalg.inv(N)
+error = np.max(np.abs(C - Cdensa)) / np.max(np.abs(Cdensa))
+print('covariance vs dense inverse, error %.1e' % error)
+assert error < tol
+
+dX = cl.schurSolve(U, V, W, gI, gE)
+dXdenso = np.linalg.solve(N, - g)
+error = np.max(np.abs(dX - dXdenso)) / np.max(np.abs(dXdenso))
+print('schur step vs dense solve, error %.1e' % error)
+assert error < tol
+
+# %% no iterations
+rV, tV, K, k, C0, res = cl.calibrateJoint(chessboardModel, imagePoints,
+                                          rVecs, tVecs, cameraMatrix,
+                                          distCoeffs, model, Cccd=Cccd,
+                                          maxIter=0)
+assert res.nit == 0 and res.status == 0 and not res.success
+assert np.all(res.x == X) and np.max(np.abs(C0 - C)) <= tol * np.max(C)
+print('maxIter=0 ok')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks the CovarianceAccumulator of calibration/montecarlo.py against
+np.cov of all the samples at once: fed by batches of different sizes, merged
+from several accumulators (Chan's combination), with a big offset (no
+cancellation) and with nan samples. also that montecarloInverse gets close
+to the covariance that calibrator.inverse propagates
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from calibration import calibrator as cl
+from calibration import montecarlo as mc
+
+np.random.seed(0)
+S, n = 1000, 7
+X = np.einsum('sni,nij->snj', np.random.randn(S, n, 2),
+              np.random.rand(n, 2, 2)) + np.random.rand(n, 2)
+tol = 1e-12
+
+
+def npCov(X):
+    return np.array([np.cov(X[:, i].T) for i in range(X.shape[1])])
+
+
+def errorRel(C, Cref):
+    return np.max(np.abs(C - Cref)) / np.max(np.abs(Cref))
+
+
+# %% batches of different sizes and merged accumulators
+partes = np.split(X, [1, 10, 333, 600])
+acc = mc.CovarianceAccumulator(n)
+for parte in partes:
+    acc.update(parte)
+assert np.all(acc.count == S)
+assert errorRel(acc.mean, X.mean(0)) < tol
+assert errorRel(acc.covariance(), npCov(X)) < tol
+
+accs = list()
+for parte in partes:
+    accs.append(mc.CovarianceAccumulator(n))
+    accs[-1].update(parte)
+accs.append(mc.CovarianceAccumulator(n))  # an empty one too
+merged = accs[0]
+for other in accs[1:]:
+    merged.merge(other)
+assert errorRel(merged.mean, X.mean(0)) < tol
+assert errorRel(merged.covariance(), npCov(X)) < tol
+print('batches and merge ok')
+
+# %% big offset, the spread is 1e-8 relative to the mean
+acc = mc.CovarianceAccumulator(n)
+for parte in np.split(X + 1e8, 10):
+    acc.update(parte)
+assert errorRel(acc.covariance(), npCov(X)) < 1e-6
+print('offset ok')
+
+# %% nan samples are not counted, per point
+Xnan = X.copy()
+Xnan[::3, 0] = np.nan
+Xnan[5, 2, 1] = np.nan
+acc = mc.CovarianceAccumulator(n)
+for parte in np.split(Xnan, [100, 500]):
+    acc.update(parte)
+valid = np.isfinite(Xnan).all(2)
+for i in range(n):
+    assert acc.count[i] == valid[:, i].sum()
+    assert errorRel(acc.covariance()[i], np.cov(Xnan[valid[:, i], i].T)) < tol
+
+acc = mc.CovarianceAccumulator(1)
+acc.update(X[:1, :1])
+assert np.all(np.isnan(acc.covariance()))
+print('nan ok')
+
+# %% montecarlo of the inverse against the propagated covariance
+model = 'poly'
+cameraMatrix = np.array([[800., 0., 640.], [0., 810., 480.], [0., 0., 1.]])
+distCoeffs = np.array([-0.3, 0.05, 0., 0., -0.002])
+rV = np.array([0.1, -0.2, 0.05])
+tV = np.array([-0.2, 0.1, 1.5])
+# away from the horizon, where the propagation is linear enough
+imagePoints = [640, 480] + (np.random.rand(5, 2) - 0.5) * [600, 400]
+covs = dict(Cccd=np.eye(2) * 0.25, Cf=np.diag([4., 4., 1., 1.]),
+            Ck=np.eye(3) * 1e-8, Crt=np.eye(6) * 1e-6)
+
+xm, ym, Cm = cl.inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
+                        **covs)
+resultados = [mc.montecarloInverse(imagePoints, rV, tV, cameraMatrix,
+                                   distCoeffs, model, nSamples=4096,
+                                   seed=seed, method='sobol', **covs)
+              for seed in mc.spawnSeeds(0, 2)]
+acc = resultados[0][3]
+acc.merge(resultados[1][3])
+assert np.all(acc.count == 8192)
+errorMedia = np.max(np.abs(acc.mean - np.array([xm, ym]).T))
+errorC = errorRel(acc.covariance(), Cm)
+print('montecarlo vs propagated, mean %.1e, Cm %.1e' % (errorMedia, errorC))
+assert errorMedia < 1e-4 and errorC < 0.02
+
+# %% scalar Cccd and a distortion coefficient held fixed (singular Ck)
+covs = dict(Cccd=0.25, Ck=np.diag([1e-8, 1e-8, 0.]))
+xm, ym, Cm = cl.inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs, model,
+                        **covs)
+xmMC, ymMC, CmMC, _ = mc.montecarloInverse(imagePoints, rV, tV, cameraMatrix,
+                                           distCoeffs, model, nSamples=4096,
+                                           seed=0, method='sobol', **covs)
+errorC = errorRel(CmMC, Cm)
+print('scalar Cccd and singular Ck, Cm %.1e' % errorC)
+assert errorC < 0.02
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks the analytic least squares of calibrator on a small synthetic
+problem: lsqJacobian against a numerical jacobian of lsqResidual (poses
+only and with the intrinsics), posesToZplane and its jacobian against
+xypToZplane and jacobianosHom2Map pose by pose, and that
+calibratePoseMultiStart gets to the minimum of calibrateInverseLsq, with
+and without a pool of processes
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+import numdifftools as ndf
+from multiprocessing import Pool
+from calibration import calibrator as cl
+
+model = 'poly'
+cameraMatrix = np.array([[800., 0., 640.], [0., 810., 480.], [0., 0., 1.]])
+distCoeffs = np.array([-0.3, 0.05, 0., 0., -0.002])
+grid = np.mgrid[0:5, 0:4].T.reshape((-1, 2)) * 0.1
+chessboardModel = np.zeros((grid.shape[0], 3))
+chessboardModel[:, :2] = grid
+rVecs = np.array([[0.1, 0.2, 0.05], [-0.2, 0.1, 0.3], [0.05, -0.15, -0.2]])
+tVecs = np.array([[-0.2, -0.1, 1.], [-0.1, -0.2, 1.2], [-0.15, -0.1, 0.9]])
+m = rVecs.shape[0]
+
+np.random.seed(0)
+imagePoints = np.array([cl.direct(chessboardModel, rVecs[j], tVecs[j],
+                                  cameraMatrix, distCoeffs, model)
+                        for j in range(m)])
+imagePoints += np.random.randn(*imagePoints.shape) * 0.5
+
+
+def errorRel(a, b):
+    return np.max(np.abs(a - b)) / np.max(np.abs(b))
+
+
+# %% analytic jacobian
+objectPoints, imPts = cl.lsqPoints(chessboardModel, imagePoints, m)
+for intrinsic in [False, True]:
+    args = (objectPoints, imPts, cameraMatrix, distCoeffs, model, intrinsic)
+    X = cl.lsqPack(rVecs, tVecs, cameraMatrix, distCoeffs, model, intrinsic)
+    J = cl.lsqJacobian(X, *args)
+    Jnum = ndf.Jacobian(lambda X: cl.lsqResidual(X, *args))(X)
+    error = errorRel(J, Jnum)
+    print('lsqJacobian intrinsic=%s, error %.1e' % (intrinsic, error))
+    assert J.shape == Jnum.shape and error < 1e-8
+
+# %% all the poses at once
+xp = np.linspace(-0.5, 0.5, 11)
+yp = np.linspace(0.4, -0.3, 11)
+X = np.concatenate((rVecs, tVecs), axis=1)
+xm, ym, J = cl.posesToZplane(xp, yp, X, jacobian=True)
+assert xm.shape == (m, xp.shape[0]) and J.shape == (m, xp.shape[0], 2, 6)
+for j in range(m):
+    xmj, ymj, _ = cl.xypToZplane(xp, yp, rVecs[j], tVecs[j])
+    Jj = cl.jacobianosHom2Map(xp, yp, rVecs[j], tVecs[j])[1]
+    assert errorRel(xm[j], xmj) < 1e-12 and errorRel(ym[j], ymj) < 1e-12
+    assert errorRel(J[j], Jj.transpose((2, 0, 1))) < 1e-12
+print('posesToZplane ok')
+
+# %% many starts against one least squares
+j = 1
+rV, tV, _, _, res = cl.calibrateInverseLsq(chessboardModel, imagePoints[j],
+                                           rVecs[j], tVecs[j], cameraMatrix,
+                                           distCoeffs, model)
+rng = np.random.default_rng(0)
+rStarts = rVecs[j] + rng.uniform(-0.1, 0.1, (16, 3))
+tStarts = tVecs[j] + rng.uniform(-0.1, 0.1, (16, 3))
+
+if __name__ == '__main__':
+    with Pool(2) as pool:
+        for p in [None, pool]:
+            rVm, tVm, resM = cl.calibratePoseMultiStart(
+                chessboardModel, imagePoints[j], rStarts, tStarts,
+                cameraMatrix, distCoeffs, model, pool=p)
+            error = max(np.max(np.abs(rVm - rV.reshape(-1))),
+                        np.max(np.abs(tVm - tV.reshape(-1))))
+            print('multistart pool=%s, %d of %d in the basin, error %.1e' % (
+                p is not None, resM.basinCount[0], rStarts.shape[0], error))
+            assert error < 1e-6 and resM.xs.shape == (rStarts.shape[0], 6)
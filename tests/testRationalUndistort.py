@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks RationalCalibration.radialUndistort, that solves all the polynomials
+in one batched call, against the old solver that calls roots() point by
+point: the same radius bit by bit on random rpp and rpp=0 (rp=0, and nan
+for the quotient rp/rpp)
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from numpy import roots, isreal, real, array
+from calibration import RationalCalibration as rational
+
+distCoeffs = np.array([0.46, 0.026, 0., 0., 8.6e-05, 0.73, 0.089, 0.0013])
+
+
+def radialUndistortLoop(rpp, k):
+    '''
+    the solver before batching, one polynomial at a time
+    '''
+    k.shape = -1
+    poly = [[k[4], -r*k[7], k[1], -r*k[6], k[0], -r*k[5], 1, -r] for r in rpp]
+
+    rootsPoly = array([roots(p) for p in poly])
+    rPRB = isreal(rootsPoly) & (0 <= real(rootsPoly))
+
+    return array([min(rootsPoly[i, rPRB[i]].real)
+                  for i in range(rpp.shape[0])])
+
+
+# %% random rpp, with zeros among them
+np.random.seed(0)
+rpp = np.random.rand(2000) * 1.5
+rpp[[0, 777, 1999]] = 0
+
+rp, retVal = rational.radialUndistort(rpp, distCoeffs.copy())
+rpLoop = radialUndistortLoop(rpp, distCoeffs.copy())
+assert retVal.all()
+assert np.array_equal(rp, rpLoop)
+print('batch vs loop, %d of %d equal' % (np.sum(rp == rpLoop), rpp.shape[0]))
+
+# %% rpp = 0
+with np.errstate(invalid='ignore'):
+    q, retVal = rational.radialUndistort(rpp, distCoeffs.copy(), quot=True)
+    qLoop = rpLoop / rpp
+assert np.all(rp[rpp == 0] == 0) and retVal.all()
+assert np.all(np.isnan(q[rpp == 0])) and np.all(np.isnan(qLoop[rpp == 0]))
+assert np.array_equal(q, qLoop, equal_nan=True)
+print('rpp=0 ok')
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks the rectification maps and the ground plane grid of
+calibration/rectificationMaps.py against calibrator.direct and
+calibrator.inverse for a synthetic fisheye camera, the lookup on grids one
+pixel wide or high, and that cachedMaps gives the same file for arguments
+given by position or by keyword and different files for different options
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from tempfile import mkdtemp
+from os import listdir
+from shutil import rmtree
+from calibration import calibrator as cl
+from calibration import rectificationMaps as rm
+
+model = 'fisheye'
+imgSize = (64, 48)
+cameraMatrix = np.array([[40., 0., 31.7], [0., 40., 23.6], [0., 0., 1.]])
+distCoeffs = np.array([0.01, -0.005, 0.001, -0.0001])
+rV = np.array([0.1, -0.05, 0.02])
+tV = np.array([-0.2, 0.1, 1.5])
+Cccd = np.eye(2) * 0.25
+xLim, yLim, pixSize = (-0.5, 0.5), (-0.4, 0.4), 0.05
+
+
+# %% undistort maps, the distorted pixels go back to the pinhole ones
+maps = rm.undistortMaps(imgSize, cameraMatrix, distCoeffs, model)
+assert maps.shape == (2, imgSize[1], imgSize[0]) and maps.dtype == np.float32
+v, u = np.mgrid[:imgSize[1], :imgSize[0]]
+xpp, ypp, _ = cl.ccd2hom(maps.reshape((2, -1)).T.astype(float), cameraMatrix)
+xp, yp, _ = cl.homDist2homUndist(xpp, ypp, distCoeffs, model)
+error = max(np.max(np.abs(xp * cameraMatrix[0, 0] + cameraMatrix[0, 2] -
+                          u.reshape(-1))),
+            np.max(np.abs(yp * cameraMatrix[1, 1] + cameraMatrix[1, 2] -
+                          v.reshape(-1))))
+print('undistort maps, error %.1e px' % error)
+assert error < 1e-3  # float32 maps
+
+# %% top view maps, the centers of the top view pixels to the image
+maps = rm.topViewMaps(rV, tV, cameraMatrix, distCoeffs, model, xLim, yLim,
+                      pixSize)
+h, w = rm.topViewSize(xLim, yLim, pixSize)
+assert maps.shape == (2, h, w)
+ym, xm = np.mgrid[:h, :w] + 0.5
+objectPoints = np.zeros((h * w, 3))
+objectPoints[:, 0] = xLim[0] + xm.reshape(-1) * pixSize
+objectPoints[:, 1] = yLim[1] - ym.reshape(-1) * pixSize
+ccd = cl.direct(objectPoints, rV, tV, cameraMatrix, distCoeffs, model)
+error = np.max(np.abs(maps.reshape((2, -1)).T - ccd))
+print('top view maps, error %.1e px' % error)
+assert error < 1e-3
+
+# %% ground plane grid, exact at the pixels and interpolated in between
+grid = rm.groundPlaneGrid(imgSize, rV, tV, cameraMatrix, distCoeffs, model,
+                          Cccd=Cccd)
+assert grid.shape == (5, imgSize[1], imgSize[0])
+imagePoints = np.array([u.reshape(-1), v.reshape(-1)], dtype=float).T
+xm, ym, Cm = cl.inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs,
+                        model, Cccd=np.array([Cccd] * imagePoints.shape[0]))
+xl, yl, Cl = rm.groundPlaneLookup(grid, imagePoints)
+error = max(np.max(np.abs(xl - xm)), np.max(np.abs(yl - ym)))
+errorC = np.max(np.abs(Cl - Cm)) / np.max(np.abs(Cm))
+print('ground plane at the pixels, error %.1e, Cm %.1e' % (error, errorC))
+assert error < 1e-6 and errorC < 1e-6
+
+np.random.seed(0)
+imagePoints = np.random.rand(200, 2) * (np.array(imgSize) - 1)
+xm, ym, _ = cl.inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs, model)
+xl, yl, _ = rm.groundPlaneLookup(grid, imagePoints)
+error = max(np.max(np.abs(xl - xm)), np.max(np.abs(yl - ym)))
+print('ground plane between pixels, error %.1e' % error)
+assert error < 1e-3
+
+xl, yl, _ = rm.groundPlaneLookup(grid, np.array([[-1., 5.], [5., 48.]]))
+assert np.all(np.isnan(xl)) and np.all(np.isnan(yl))
+
+# %% grids one pixel wide or high
+for size in [(1, 48), (64, 1), (1, 1)]:
+    g = rm.groundPlaneGrid(size, rV, tV, cameraMatrix, distCoeffs, model)
+    vv, uu = np.mgrid[:size[1], :size[0]]
+    pts = np.array([uu.reshape(-1), vv.reshape(-1)], dtype=float).T
+    xm, ym, _ = cl.inverse(pts, rV, tV, cameraMatrix, distCoeffs, model)
+    xl, yl, Cl = rm.groundPlaneLookup(g, pts)
+    assert Cl is False
+    assert np.max(np.abs(xl - xm)) < 1e-6 and np.max(np.abs(yl - ym)) < 1e-6
+print('one pixel wide and high grids ok')
+
+# %% cache in disk
+folder = mkdtemp()
+try:
+    m1 = rm.cachedMaps(folder, 'topView', rV, tV, cameraMatrix, distCoeffs,
+                       model, xLim, yLim, pixSize)
+    m2 = rm.cachedMaps(folder, 'topView', rV, tV, cameraMatrix, distCoeffs,
+                       model, xLim=xLim, yLim=yLim, pixSize=pixSize)
+    assert len(listdir(folder)) == 1 and np.all(m1 == m2)
+    assert np.all(m1 == maps)
+
+    g1 = rm.cachedMaps(folder, 'groundPlane', imgSize, rV, tV, cameraMatrix,
+                       distCoeffs, model, Cccd)
+    g2 = rm.cachedMaps(folder, 'groundPlane', imgSize, rV, tV, cameraMatrix,
+                       distCoeffs, model, Cccd=Cccd)
+    assert len(listdir(folder)) == 2 and np.all(g1 == grid)
+    assert np.all((g1 == g2) | np.isnan(g1))
+
+    # the same array as two different covariances
+    C = np.eye(4) * 1e-4
+    gf = rm.cachedMaps(folder, 'groundPlane', imgSize, rV, tV, cameraMatrix,
+                       distCoeffs, model, Cf=C)
+    gk = rm.cachedMaps(folder, 'groundPlane', imgSize, rV, tV, cameraMatrix,
+                       distCoeffs, model, Ck=C)
+    assert len(listdir(folder)) == 4
+    assert not np.all((gf[2:] == gk[2:]) | np.isnan(gf[2:]))
+    del m1, m2, g1, g2, gf, gk
+finally:
+    rmtree(folder)
+print('cached maps ok')
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks inverseStream and directStream against a single inverse and direct
+call on all the points, with covariances per point and shared by all, and
+that every chunk is a new array, so list(stream) keeps all of them
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from calibration import calibrator as cl
+
+model = 'fisheye'
+cameraMatrix = np.array([[800., 0., 640.], [0., 810., 480.], [0., 0., 1.]])
+distCoeffs = np.array([0.01, -0.005, 0.001, -0.0001])
+rV = np.array([0.1, -0.2, 0.05])
+tV = np.array([-0.2, 0.1, 1.5])
+Cf = np.diag([4., 4., 1., 1.])
+Ck = np.eye(4) * 1e-8
+Crt = np.eye(6) * 1e-6
+n, chunkSize = 1000, 300  # the last chunk is smaller
+
+np.random.seed(0)
+objectPoints = np.zeros((n, 3))
+objectPoints[:, :2] = np.random.rand(n, 2) - 0.5
+imagePoints = cl.direct(objectPoints, rV, tV, cameraMatrix, distCoeffs, model)
+Cccd = np.random.rand(n, 2, 2) * 0.1
+Cccd = np.einsum('nij,nkj->nik', Cccd, Cccd) + np.eye(2) * 0.1
+
+# %% direct
+partes = list(cl.directStream(cl.splitChunks(objectPoints, chunkSize), rV,
+                              tV, cameraMatrix, distCoeffs, model))
+assert len(partes) == 4
+assert np.all(np.concatenate(partes) == imagePoints)
+print('directStream ok')
+
+# %% inverse, covariances per point and shared
+for C in [Cccd, np.eye(2) * 0.25, False]:
+    covs = dict(Cf=Cf, Ck=Ck, Crt=Crt) if C is not False else dict()
+    xm, ym, Cm = cl.inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs,
+                            model, C, **covs)
+
+    partes = list(cl.inverseStream(cl.splitChunks(imagePoints, chunkSize, C),
+                                   rV, tV, cameraMatrix, distCoeffs, model,
+                                   **covs))
+    assert len(partes) == 4
+    assert not np.shares_memory(partes[0][0], partes[1][0])
+    assert np.all(np.concatenate([p[0] for p in partes]) == xm)
+    assert np.all(np.concatenate([p[1] for p in partes]) == ym)
+    if C is False:
+        assert all(p[2] is False for p in partes)
+    else:
+        assert np.max(np.abs(np.concatenate([p[2] for p in partes]) - Cm)) \
+            <= 1e-14 * np.max(np.abs(Cm))
+print('inverseStream ok')
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks the undistortion lookup tables (calibrator.tabulatedUndistort)
+against the exact solvers (calibrator.undistortExact) for all five models:
+every output with and without quot and der, retVal, points below the first
+node rpp0 and above rppMax, and the intervals flagged to be solved exactly
+(beyond the horizon, where there is no inverse). also that
+useUndistortTables(False) restores the exact solvers
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from calibration import calibrator as cl
+
+np.seterr(all='ignore')
+distCoeffs = {
+    'stereographic': np.array([0.9]),
+    'unified': np.array([-0.2, 1.1]),
+    'rational': np.array([0.46, 0.026, 0., 0., 8.6e-05, 0.73, 0.089,
+                          0.0013]),
+    'poly': np.array([-0.3, 0.05, 0., 0., -0.002]),
+    'fisheye': np.array([0.01, -0.005, 0.001, -0.0001])
+    }
+rppMax, maxError = 1.5, 1e-8
+
+np.random.seed(0)
+rpp = np.concatenate(([0., 1e-6], np.random.rand(2000) * rppMax,
+                      [rppMax, 1.7, 3.]))
+
+
+def compara(out, outExact):
+    '''
+    max error of the tabulated outputs, relative for values bigger than one,
+    nan must be in the same places and the booleans (retVal) the same
+    '''
+    if not isinstance(out, tuple):
+        out, outExact = [out], [outExact]
+    error = 0
+    for o, oE in zip(out, outExact):
+        assert o.shape == oE.shape
+        if oE.dtype == bool:
+            assert np.all(o == oE)
+            continue
+        assert np.all(np.isnan(o) == np.isnan(oE))
+        e = np.abs(o - oE) / np.maximum(np.abs(oE), 1)
+        error = max(error, np.nanmax(e))
+    return error
+
+
+# %%
+for model, k in distCoeffs.items():
+    tabla = cl.tabulatedUndistort(model, rppMax, maxError)
+    exact = cl.undistortExact[model]
+
+    errores, flagged = list(), 0
+    for quot, der in [(False, False), (True, False), (False, True),
+                      (True, True)]:
+        kw = {'quot': quot, 'der': der}
+        # the table that tabla uses for these outputs
+        rpp0, h, outputs, exacto, esTupla = cl.undistortTable(
+            model, k.tobytes(), quot, der, rppMax, maxError, 2**17)
+        flagged = max(flagged, exacto.sum())
+        # the first two points are below the table, the last two above
+        assert rpp0 > rpp[1]
+        assert abs(rpp0 + h * exacto.shape[0] - rppMax) < 1e-12
+
+        out = tabla(rpp, k.copy(), **kw)
+        outExact = exact(rpp, k.copy(), **kw)
+        errores.append(compara(out, outExact))
+
+        # outside the table and in the flagged intervals it is exact
+        pos = ((rpp - rpp0) / h).astype(int)
+        fuera = (rpp < rpp0) | (rpp > rppMax)
+        fuera[~fuera] = exacto[np.minimum(pos[~fuera], exacto.shape[0] - 1)]
+        out = out if isinstance(out, tuple) else [out]
+        outExact = outExact if isinstance(outExact, tuple) else [outExact]
+        for o, oE in zip(out, outExact):
+            assert np.array_equal(o[..., fuera], oE[..., fuera],
+                                  equal_nan=True)
+
+    print('%-13s error %.1e, up to %d intervals flagged' % (
+        model, max(errores), flagged))
+    assert max(errores) < 2 * maxError
+
+    # beyond the horizon, rpp > k, there is no inverse
+    if model == 'stereographic':
+        assert flagged > 0
+
+
+# %% switch on and off
+cl.useUndistortTables(True, rppMax, maxError)
+for model in distCoeffs:
+    assert cl.undistort[model] is not cl.undistortExact[model]
+k = distCoeffs['fisheye']
+xpp = ypp = np.linspace(0.01, 0.9, 50)
+xp, yp, _ = cl.homDist2homUndist(xpp, ypp, k, 'fisheye')
+cl.useUndistortTables(False)
+for model in distCoeffs:
+    assert cl.undistort[model] is cl.undistortExact[model]
+xpE, ypE, _ = cl.homDist2homUndist(xpp, ypp, k, 'fisheye')
+assert np.max(np.abs(xp - xpE)) < 2 * maxError
+print('useUndistortTables ok')
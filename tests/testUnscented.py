@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks calibrator.inverseUnscented against the linear propagation of
+calibrator.inverse for small covariances (where they must agree), also with
+a scalar Cccd and singular covariances (a distortion coefficient and a
+pose parameter held fixed with zero variance), and calibrator.sqrtPSD,
+the square root used for the sigma points
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from calibration import calibrator as cl
+
+model = 'poly'
+cameraMatrix = np.array([[800., 0., 640.], [0., 810., 480.], [0., 0., 1.]])
+distCoeffs = np.array([-0.3, 0.05, 0., 0., -0.002])
+rV = np.array([0.1, -0.2, 0.05])
+tV = np.array([-0.2, 0.1, 1.5])
+np.random.seed(0)
+imagePoints = [640, 480] + (np.random.rand(20, 2) - 0.5) * [600, 400]
+tol = 0.01  # the unscented transform sees some of the non linearity
+
+
+def errorRel(C, Cref):
+    return np.max(np.abs(C - Cref)) / np.max(np.abs(Cref))
+
+
+# %% square roots
+A = np.random.randn(5, 3, 3)
+C = A @ A.transpose((0, 2, 1))
+L = cl.sqrtPSD(C)
+assert errorRel(L @ L.transpose((0, 2, 1)), C) < 1e-14
+C[:, 2] = C[:, :, 2] = 0  # singular, cholesky fails
+L = cl.sqrtPSD(C)
+assert errorRel(L @ L.transpose((0, 2, 1)), C) < 1e-14
+print('sqrtPSD ok')
+
+# %% against the linear propagation
+casos = {
+    'all': dict(Cccd=np.eye(2) * 0.25, Cf=np.diag([4., 4., 1., 1.]),
+                Ck=np.eye(3) * 1e-8, Crt=np.eye(6) * 1e-6),
+    'scalar Cccd': dict(Cccd=0.25, Crt=np.eye(6) * 1e-6),
+    'singular': dict(Cccd=np.array([[0.25, 0.], [0., 0.]]),
+                     Ck=np.diag([1e-8, 1e-8, 0.]),
+                     Crt=np.diag([1e-6] * 5 + [0.]))
+    }
+for caso, covs in casos.items():
+    xm, ym, Cm = cl.inverse(imagePoints, rV, tV, cameraMatrix, distCoeffs,
+                            model, **covs)
+    xmU, ymU, CmU = cl.inverseUnscented(imagePoints, rV, tV, cameraMatrix,
+                                        distCoeffs, model, **covs)
+    assert np.all(np.isfinite(CmU))
+    errorMedia = max(np.max(np.abs(xmU - xm)), np.max(np.abs(ymU - ym)))
+    errorC = errorRel(CmU, Cm)
+    print('%-12s mean %.1e, Cm %.1e' % (caso, errorMedia, errorC))
+    assert errorMedia < 1e-4 and errorC < tol
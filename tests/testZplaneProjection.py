@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 2026
+
+checks xypToZplane against the closed form with the rotation matrix, for
+arrays of points and for a single point given as scalars (as in
+dev/checkCnoid.py and dev/rototrasUncert.py), which must give scalars and a
+(2, 2) covariance, and for samples by points (S, n)
+
+@author: sebalander
+"""
+# %%
+import numpy as np
+from cv2 import Rodrigues
+from calibration import calibrator as cl
+
+rV = np.array([0.3, -0.2, 0.1])
+tV = np.array([0.5, -0.3, 2.0])
+xp = np.linspace(-0.5, 0.5, 11)
+yp = np.linspace(0.4, -0.3, 11)
+Cp = np.eye(2) * 1e-4
+tol = 1e-12
+
+
+def zPlane(xp, yp, rV, tV):
+    '''
+    the projection written out with R
+    '''
+    R = Rodrigues(rV)[0]
+    a = R[0, 0] - R[2, 0] * xp
+    b = R[0, 1] - R[2, 1] * xp
+    c = tV[0] - tV[2] * xp
+    d = R[1, 0] - R[2, 0] * yp
+    e = R[1, 1] - R[2, 1] * yp
+    f = tV[1] - tV[2] * yp
+    q = a*e - d*b
+    return (f*b - c*e) / q, (c*d - f*a) / q
+
+
+# %% arrays
+xm, ym, Cm = cl.xypToZplane(xp, yp, rV, tV, Cp=Cp)
+xmRef, ymRef = zPlane(xp, yp, rV, tV)
+error = max(np.max(np.abs(xm - xmRef)), np.max(np.abs(ym - ymRef)))
+print('arrays, error %.1e' % error)
+assert xm.shape == xp.shape and Cm.shape == (xp.shape[0], 2, 2)
+assert error < tol
+
+# %% scalars
+for i in range(xp.shape[0]):
+    xmi, ymi, Cmi = cl.xypToZplane(xp[i], yp[i], rV, tV, Cp=Cp)
+    assert np.ndim(xmi) == 0 and np.ndim(ymi) == 0 and Cmi.shape == (2, 2)
+    assert abs(xmi - xmRef[i]) < tol and abs(ymi - ymRef[i]) < tol
+    assert np.max(np.abs(Cmi - Cm[i])) < tol * np.max(np.abs(Cm[i]))
+
+    xmi, ymi, Cmi = cl.xypToZplane(float(xp[i]), float(yp[i]), rV, tV)
+    assert np.ndim(xmi) == 0 and Cmi is False
+    assert abs(xmi - xmRef[i]) < tol and abs(ymi - ymRef[i]) < tol
+print('scalars ok')
+
+# %% rotation matrix instead of rotation vector, also with covariances
+R = Rodrigues(rV)[0]
+Crt = np.eye(6) * 1e-6
+xm, ym, Cm = cl.xypToZplane(xp, yp, rV, tV, Cp=Cp, Crt=Crt)
+xmR, ymR, CmR = cl.xypToZplane(xp, yp, R, tV, Cp=Cp, Crt=Crt)
+assert np.max(np.abs(xmR - xm)) < tol and np.max(np.abs(ymR - ym)) < tol
+assert np.max(np.abs(CmR - Cm)) < tol * np.max(np.abs(Cm))
+print('rotation matrix ok')
+
+# %% samples by points (S, n), as in the montecarlo
+xpS = xp + np.linspace(-0.1, 0.1, 3).reshape((-1, 1))
+ypS = yp + np.linspace(0.05, -0.05, 3).reshape((-1, 1))
+CpS = np.zeros(xpS.shape + (2, 2)) + Cp
+xm, ym, Cm = cl.xypToZplane(xpS, ypS, rV, tV, Cp=CpS, Crt=Crt)
+xmRef, ymRef = zPlane(xpS, ypS, rV, tV)
+assert xm.shape == xpS.shape and Cm.shape == xpS.shape + (2, 2)
+assert np.max(np.abs(xm - xmRef)) < tol and np.max(np.abs(ym - ymRef)) < tol
+for s in range(xpS.shape[0]):
+    _, _, Cms = cl.xypToZplane(xpS[s], ypS[s], rV, tV, Cp=Cp, Crt=Crt)
+    assert np.max(np.abs(Cm[s] - Cms)) < tol * np.max(np.abs(Cms))
+print('2-D arrays ok')